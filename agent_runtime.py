@@ -0,0 +1,189 @@
+import asyncio
+from collections.abc import Coroutine
+import logging
+import multiprocessing as mp
+import typing
+from typing import Any
+
+from prompt_scheduler import PromptScheduler
+
+if typing.TYPE_CHECKING:
+    from main import Agent
+
+_PROMPT = "prompt"
+_SPECULATE = "speculate"
+_CANCEL_SPECULATION = "cancel_speculation"
+_INTERRUPT = "interrupt"
+
+logger = logging.getLogger(__name__)
+
+
+class AgentLink:
+    """
+    stands in for the agent in the ears' processes. every call is sent down a pipe to
+    the `AgentRuntime` in the main process and returns right away, instead of running
+    on the process's own copy of the agent
+    """
+
+    def __init__(self):
+        self._reader, self._writer = mp.Pipe(duplex=False)
+        # several processes may write, a message has to go down the pipe in one piece
+        self._lock = mp.Lock()
+
+    def prompt(self, prompt: str):
+        self._send(_PROMPT, prompt)
+
+    def speculate(self, prompt: str):
+        self._send(_SPECULATE, prompt)
+
+    def cancel_speculation(self):
+        self._send(_CANCEL_SPECULATION)
+
+    def interrupt(self):
+        self._send(_INTERRUPT)
+
+    def _send(self, *msg):
+        with self._lock:
+            self._writer.send(msg)
+
+
+class AgentRuntime:
+    """
+    runs the agent on a single asyncio event loop in the main process.
+
+    the ears listen in their own processes and reach the agent through `link`, so there
+    is one llm client, kept warm, and one conversation state, both owned by the loop.
+    each prompt is answered (and spoken) in its own task, scheduled by `prompts` (see
+    `PromptScheduler` for coalescing and `barge_in`); `spawn` schedules any other work,
+    e.g. a tool call, as a task too. `cancel` stops everything in flight
+    """
+
+    def __init__(self, agent: "Agent", barge_in: bool = True):
+        self.agent = agent
+        self.link = AgentLink()
+        self.prompts = PromptScheduler(self._answer, barge_in=barge_in)
+        self._tasks: set[asyncio.Task] = set()
+        self._answers: set[asyncio.Future] = set()
+
+    async def run(self):
+        """
+        Note: this runs until the ears stop listening!
+        """
+        loop = asyncio.get_running_loop()
+        reader = self.link._reader  # pylint: disable=W0212
+        loop.add_reader(reader.fileno(), self._receive)
+        self.spawn(self.prompts.run(), name="prompts")
+        try:
+            if self.agent.ears:
+                # the ears fork their processes in `listen`, they inherit the link
+                self.agent.ears.agent = self.link
+                proc = self.agent.ears.listen()
+                await asyncio.to_thread(proc.join)
+            # the ears may have sent their last prompt just before exiting
+            self._receive()
+            while self._answers:
+                await asyncio.gather(*self._answers, return_exceptions=True)
+        finally:
+            loop.remove_reader(reader.fileno())
+            self.cancel()
+
+    def spawn(
+        self, coro: Coroutine[Any, Any, Any], name: str | None = None
+    ) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+        return task
+
+    def cancel(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _receive(self):
+        reader = self.link._reader  # pylint: disable=W0212
+        while reader.poll():
+            self._handle(reader.recv())
+
+    def _handle(self, msg: tuple):
+        if msg[0] == _PROMPT:
+            answer = self.prompts.submit(msg[1])
+            if answer not in self._answers:
+                self._answers.add(answer)
+                answer.add_done_callback(self._on_answered)
+        elif msg[0] == _SPECULATE:
+            self.agent.speculate(msg[1])
+        elif msg[0] == _CANCEL_SPECULATION:
+            self.agent.cancel_speculation()
+        elif msg[0] == _INTERRUPT:
+            self.agent.interrupt()
+            self.prompts.interrupt()
+        else:
+            logger.warning("unexpected message %s", msg[0])
+
+    async def _answer(self, prompt: str):
+        await self.agent.aprompt(prompt)
+
+    def _on_answered(self, answer: asyncio.Future):
+        self._answers.discard(answer)
+        if not answer.cancelled() and answer.exception():
+            logger.error("failed to answer a prompt", exc_info=answer.exception())
+
+    def _on_task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("task %s failed", task.get_name(), exc_info=task.exception())
+
+
+def _test_prompts_from_other_processes_are_answered_in_order():
+    class Ears:
+        def __init__(self):
+            self.agent = None
+
+        def listen(self) -> mp.Process:
+            def send():
+                self.agent.speculate("what time is it")
+                self.agent.prompt("what time is it")
+                self.agent.prompt("and the date")
+
+            proc = mp.get_context("fork").Process(target=send)
+            proc.start()
+            return proc
+
+    class Agent:
+        def __init__(self):
+            self.ears = Ears()
+            self.calls = []
+
+        def speculate(self, prompt: str):
+            self.calls.append(("speculate", prompt))
+
+        def cancel_speculation(self):
+            self.calls.append(("cancel_speculation",))
+
+        async def aprompt(self, prompt: str):
+            self.calls.append(("prompt", prompt))
+            await asyncio.sleep(0.01)
+            self.calls.append(("answered", prompt))
+
+    agent = Agent()
+    asyncio.run(AgentRuntime(agent, barge_in=False).run())
+    assert agent.calls == [
+        ("speculate", "what time is it"),
+        ("prompt", "what time is it"),
+        ("answered", "what time is it"),
+        ("prompt", "and the date"),
+        ("answered", "and the date"),
+    ]
+
+
+def _test_cancel_stops_tasks_in_flight():
+    async def run() -> asyncio.Task:
+        runtime = AgentRuntime(agent=None)
+        task = runtime.spawn(asyncio.sleep(10), name="tool")
+        await asyncio.sleep(0)
+        runtime.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert not runtime._tasks
+        return task
+
+    assert asyncio.run(run()).cancelled()
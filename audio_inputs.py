@@ -0,0 +1,196 @@
+from abc import abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+import multiprocessing as mp
+import threading
+import time
+import wave
+
+import numpy as np
+
+from models.audio_input import SAMPLE_WIDTH, AudioInput
+
+DEFAULT_SAMPLE_RATE = 16_000
+MAX_PENDING_BLOCKS = 4  # how far a file replayed as fast as possible may run ahead
+
+
+class MicrophoneInput(AudioInput):
+    def __init__(
+        self,
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        block_size: int = DEFAULT_SAMPLE_RATE // 2,
+        device=None,
+    ):
+        super().__init__(sample_rate, block_size)
+        self.device = device
+
+    def open(self, on_block: Callable, pending_blocks=None):
+        import sounddevice as sd
+
+        def callback(audio_data, _, __, status):
+            if status:
+                raise ValueError(
+                    f"audio data with non-zero status error ({status}) inbound"
+                )
+            on_block(audio_data)
+
+        return sd.RawInputStream(
+            samplerate=self.sample_rate,
+            blocksize=self.block_size,
+            device=self.device,
+            dtype="int16",
+            channels=1,
+            callback=callback,
+        )
+
+
+class _FileInput(AudioInput):
+    """
+    replays a finite recording on a background thread, either paced like a live
+    microphone (`realtime=True`) or as fast as the consumer keeps up
+    """
+
+    def __init__(self, sample_rate: int, block_size: int | None, realtime: bool):
+        super().__init__(sample_rate, block_size or sample_rate // 2)
+        self.realtime = realtime
+        self._exhausted = mp.Event()  # visible to the ears' other processes
+
+    @abstractmethod
+    def _blocks(self) -> Iterator[bytes]:
+        """
+        yields mono int16 blocks of at most `block_size` frames
+        """
+
+    def is_realtime(self) -> bool:
+        return self.realtime
+
+    def is_exhausted(self) -> bool:
+        return self._exhausted.is_set()
+
+    @contextmanager
+    def open(self, on_block: Callable, pending_blocks: Callable[[], int] | None = None):
+        self._exhausted.clear()
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._pump, args=(on_block, pending_blocks, stop), daemon=True
+        )
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+    def _pump(self, on_block: Callable, pending_blocks, stop: threading.Event):
+        block_secs = self.block_size / self.sample_rate
+        start = time.monotonic()
+        for i, block in enumerate(self._blocks()):
+            if stop.is_set():
+                return
+            if self.realtime:
+                # a block is only available once it has been fully "recorded"
+                wait_secs = start + (i + 1) * block_secs - time.monotonic()
+                if wait_secs > 0:
+                    time.sleep(wait_secs)
+            elif pending_blocks:
+                while pending_blocks() >= MAX_PENDING_BLOCKS and not stop.is_set():
+                    time.sleep(0.001)
+            on_block(block)
+        self._exhausted.set()
+
+
+class WavFileInput(_FileInput):
+    """
+    replays a 16 bit PCM wav file at its native sample rate, downmixing to mono
+    """
+
+    def __init__(self, path: str, realtime: bool = True, block_size: int | None = None):
+        self.path = path
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != SAMPLE_WIDTH:
+                raise ValueError(f"{path} is not 16 bit PCM")
+            sample_rate = wav.getframerate()
+            self.n_channels = wav.getnchannels()
+        super().__init__(sample_rate, block_size, realtime)
+
+    def _blocks(self) -> Iterator[bytes]:
+        with wave.open(self.path, "rb") as wav:
+            while True:
+                frames = wav.readframes(self.block_size)
+                if not frames:
+                    return
+                yield _to_mono(frames, self.n_channels)
+
+
+class PcmFileInput(_FileInput):
+    """
+    replays headerless mono int16 PCM
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        realtime: bool = True,
+        block_size: int | None = None,
+    ):
+        self.path = path
+        super().__init__(sample_rate, block_size, realtime)
+
+    def _blocks(self) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            while True:
+                frames = f.read(self.block_bytes)
+                if not frames:
+                    return
+                yield frames
+
+
+def _to_mono(frames: bytes, n_channels: int) -> bytes:
+    if n_channels == 1:
+        return frames
+    samples = np.frombuffer(frames, dtype=np.int16).reshape(-1, n_channels)
+    return samples.mean(axis=1).astype(np.int16).tobytes()
+
+
+def _test_wav_file_input_downmixes_in_blocks():
+    import os
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "stereo.wav")
+    stereo = np.array([[100, 300], [-100, -300], [8, 8]], dtype=np.int16)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(8_000)
+        wav.writeframes(stereo.tobytes())
+
+    wav_input = WavFileInput(path, realtime=False, block_size=2)
+    assert wav_input.sample_rate == 8_000
+    blocks = list(wav_input._blocks())  # pylint: disable=W0212
+    assert [np.frombuffer(b, dtype=np.int16).tolist() for b in blocks] == [
+        [200, -200],
+        [8],
+    ]
+
+
+def _test_file_input_fast_replay_respects_backlog():
+    import os
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "audio.pcm")
+    with open(path, "wb") as f:
+        f.write(bytes(4 * 10))
+
+    received = []
+    consumed = 0
+    pcm_input = PcmFileInput(path, sample_rate=8_000, realtime=False, block_size=2)
+    with pcm_input.open(
+        received.append, pending_blocks=lambda: len(received) - consumed
+    ):
+        while consumed < 10:
+            time.sleep(0.005)
+            assert len(received) - consumed <= MAX_PENDING_BLOCKS
+            consumed = min(consumed + 1, len(received))
+    assert pcm_input.is_exhausted()
+    assert all(len(block) == 4 for block in received)
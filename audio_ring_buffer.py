@@ -0,0 +1,357 @@
+from multiprocessing import shared_memory
+import time
+
+_WORD_SIZE = 8  # header fields are stored as native uint64s
+
+
+class AudioRingBuffer:
+    """
+    single-producer, multi-reader ring of fixed-size audio blocks living in shared memory.
+
+    the producer (normally a sounddevice callback) copies each block into the next slot
+    and then publishes it by bumping the write sequence. readers never take a lock; each
+    one owns a cursor in the shared header and gets zero-copy memoryviews into the slots.
+
+    shared layout (uint64 words, float64 monotonic write times, then raw audio):
+        [write_seq][reader_seq * n_readers][slot_len * n_slots][slot_time * n_slots]
+        [slot data * n_slots]
+
+    a reader that falls more than `n_slots - 1` blocks behind is skipped forward to the
+    oldest block that is still intact and the skipped blocks are counted as overruns.
+    """
+
+    def __init__(
+        self,
+        block_bytes: int,
+        n_slots: int = 64,
+        n_readers: int = 4,
+        name: str | None = None,
+    ):
+        if n_slots < 2:
+            raise ValueError("ring buffer needs at least 2 slots")
+        self.block_bytes = block_bytes
+        self.n_slots = n_slots
+        self.n_readers = n_readers
+
+        header_words = 1 + n_readers + n_slots
+        self._times_offset = header_words * _WORD_SIZE
+        self._data_offset = self._times_offset + n_slots * _WORD_SIZE
+        size = self._data_offset + n_slots * block_bytes
+
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._is_owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._is_owner = False
+        self._attach()
+
+    def _attach(self):
+        if self._is_owner:
+            self._shm.buf[: self._data_offset] = bytes(self._data_offset)
+        self._header = self._shm.buf[: self._times_offset].cast("Q")
+        self._times = self._shm.buf[self._times_offset : self._data_offset].cast("d")
+        self._data = self._shm.buf[self._data_offset :]
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def write_seq(self) -> int:
+        """
+        number of blocks published so far
+        """
+        return self._header[0]
+
+    def write(self, block) -> int:
+        """
+        copies `block` (any buffer) into the next slot and publishes it.
+        meant to be called from exactly one producer, e.g. the realtime audio callback.
+
+        returns the sequence number the block was published under
+        """
+        src = memoryview(block).cast("B")
+        n_bytes = len(src)
+        if n_bytes > self.block_bytes:
+            raise ValueError(
+                f"block of {n_bytes} bytes does not fit in {self.block_bytes} byte slot"
+            )
+        seq = self._header[0]
+        slot = seq % self.n_slots
+        start = slot * self.block_bytes
+        self._data[start : start + n_bytes] = src
+        self._header[1 + self.n_readers + slot] = n_bytes
+        self._times[slot] = time.monotonic()
+        # publish only after the slot is fully written
+        self._header[0] = seq + 1
+        return seq
+
+    def reader(self, reader_idx: int, from_latest: bool = True) -> "RingBufferReader":
+        """
+        returns a reader bound to cursor `reader_idx`.
+        each concurrent consumer (recognizer, recorder, clap detector...) needs its own index
+        """
+        if not 0 <= reader_idx < self.n_readers:
+            raise IndexError(f"reader index {reader_idx} out of range")
+        return RingBufferReader(self, reader_idx, from_latest)
+
+    def pending(self, reader_idx: int) -> int:
+        """
+        number of published blocks the given reader has not consumed yet.
+        safe to call from any process
+        """
+        return max(self._header[0] - self._header[1 + reader_idx], 0)
+
+    def _read_nowait(self, reader_idx: int) -> tuple[memoryview | None, int]:
+        """
+        advances the given reader's cursor by one block.
+        returns the block view (None if caught up) and how many blocks were skipped
+        because the producer lapped the reader
+        """
+        cursor_idx = 1 + reader_idx
+        write_seq = self._header[0]
+        seq = self._header[cursor_idx]
+        if seq >= write_seq:
+            return None, 0
+
+        skipped = 0
+        oldest_intact = self._oldest_intact(write_seq)
+        if seq < oldest_intact:
+            skipped = oldest_intact - seq
+            seq = oldest_intact
+
+        slot = seq % self.n_slots
+        start = slot * self.block_bytes
+        n_bytes = self._header[1 + self.n_readers + slot]
+        self._header[cursor_idx] = seq + 1
+        return self._data[start : start + n_bytes], skipped
+
+    def copy_blocks(self, first_seq: int, end_seq: int) -> bytes | None:
+        """
+        copies the blocks `first_seq` up to (not including) `end_seq` out of the ring,
+        or returns None if any of them is not published yet or already overwritten
+        """
+        if end_seq > self._header[0] or first_seq < self._oldest_intact():
+            return None
+        chunks = []
+        for seq in range(first_seq, end_seq):
+            slot = seq % self.n_slots
+            start = slot * self.block_bytes
+            n_bytes = self._header[1 + self.n_readers + slot]
+            chunks.append(self._data[start : start + n_bytes].tobytes())
+        # the producer may have lapped the first blocks while they were copied
+        if first_seq < self._oldest_intact():
+            return None
+        return b"".join(chunks)
+
+    def _oldest_intact(self, write_seq: int | None = None) -> int:
+        if write_seq is None:
+            write_seq = self._header[0]
+        return max(write_seq - self.n_slots + 1, 0)
+
+    def write_time(self, seq: int) -> float:
+        """
+        `time.monotonic()` at which block `seq` was published, while it is still intact
+        """
+        return self._times[seq % self.n_slots]
+
+    def _seek_latest(self, reader_idx: int):
+        self._header[1 + reader_idx] = self._header[0]
+
+    def _rewind(self, reader_idx: int, n_blocks: int) -> int:
+        cursor_idx = 1 + reader_idx
+        seq = self._header[cursor_idx]
+        oldest_intact = self._oldest_intact()
+        rewound = max(seq - n_blocks, oldest_intact)
+        self._header[cursor_idx] = rewound
+        return seq - rewound
+
+    def close(self):
+        self._header.release()
+        self._times.release()
+        self._data.release()
+        self._shm.close()
+
+    def unlink(self):
+        if self._is_owner:
+            self._shm.unlink()
+
+    def __getstate__(self):
+        return {
+            "block_bytes": self.block_bytes,
+            "n_slots": self.n_slots,
+            "n_readers": self.n_readers,
+            "name": self.name,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class RingBufferReader:
+    def __init__(self, ring: AudioRingBuffer, reader_idx: int, from_latest: bool):
+        self._ring = ring
+        self.reader_idx = reader_idx
+        self.overruns = 0
+        self.last_write_time = 0.0  # when the last block read was published
+        if from_latest:
+            ring._seek_latest(reader_idx)  # pylint: disable=W0212
+
+    @property
+    def position(self) -> int:
+        """
+        sequence number of the next block this reader will consume
+        """
+        return self._ring._header[1 + self.reader_idx]  # pylint: disable=W0212
+
+    def pending(self) -> int:
+        return self._ring.pending(self.reader_idx)
+
+    def read_nowait(self) -> memoryview | None:
+        """
+        returns a zero-copy view of the next unread block, or None if caught up.
+        the view stays valid until the producer laps it, i.e. for `n_slots - 1` more blocks
+        """
+        view, skipped = self._ring._read_nowait(  # pylint: disable=W0212
+            self.reader_idx
+        )
+        self.overruns += skipped
+        if view is not None:
+            self.last_write_time = self._ring.write_time(self.position - 1)
+        return view
+
+    def skip_to_latest(self) -> int:
+        """
+        drops every unread block, returns how many were skipped
+        """
+        skipped = self.pending()
+        self._ring._seek_latest(self.reader_idx)  # pylint: disable=W0212
+        return skipped
+
+    def rewind(self, n_blocks: int) -> int:
+        """
+        moves the cursor back so the last `n_blocks` blocks are read again,
+        as far as they are still intact. returns how many blocks were actually rewound
+        """
+        return self._ring._rewind(self.reader_idx, n_blocks)  # pylint: disable=W0212
+
+    def read(self, timeout: float | None = None, poll_secs=0.005) -> memoryview | None:
+        """
+        blocks until the next block is published, returns None on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            view = self.read_nowait()
+            if view is not None:
+                return view
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_secs)
+
+
+def _test_ring_buffer_read_write():
+    ring = AudioRingBuffer(block_bytes=4, n_slots=4, n_readers=2)
+    try:
+        reader = ring.reader(0)
+        assert reader.read_nowait() is None
+
+        before = time.monotonic()
+        ring.write(b"abcd")
+        ring.write(b"ef")
+        assert bytes(reader.read_nowait()) == b"abcd"
+        assert before <= reader.last_write_time <= time.monotonic()
+        assert bytes(reader.read_nowait()) == b"ef"
+        assert reader.read_nowait() is None
+        assert reader.read(timeout=0) is None
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def _test_ring_buffer_independent_readers():
+    ring = AudioRingBuffer(block_bytes=2, n_slots=4, n_readers=2)
+    try:
+        first = ring.reader(0)
+        ring.write(b"aa")
+        second = ring.reader(1)
+        ring.write(b"bb")
+
+        assert bytes(first.read_nowait()) == b"aa"
+        assert bytes(second.read_nowait()) == b"bb"
+        assert ring.pending(0) == 1
+        assert ring.pending(1) == 0
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def _test_ring_buffer_overrun_skips_to_oldest_intact():
+    ring = AudioRingBuffer(block_bytes=1, n_slots=3, n_readers=1)
+    try:
+        reader = ring.reader(0)
+        for val in b"abcde":
+            ring.write(bytes([val]))
+
+        # slots hold c, d, e but c's slot is next to be overwritten so only d, e are intact
+        assert bytes(reader.read_nowait()) == b"d"
+        assert reader.overruns == 3
+        assert bytes(reader.read_nowait()) == b"e"
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def _test_ring_buffer_rewind():
+    ring = AudioRingBuffer(block_bytes=1, n_slots=4, n_readers=1)
+    try:
+        reader = ring.reader(0)
+        for val in b"abcde":
+            ring.write(bytes([val]))
+        while reader.read_nowait() is not None:
+            pass
+
+        assert reader.position == 5
+        assert reader.rewind(2) == 2
+        assert reader.position == 3
+        assert bytes(reader.read_nowait()) == b"d"
+
+        # only b, c, d, e are still in the ring and b's slot is next to be overwritten
+        assert reader.rewind(10) == 2
+        assert bytes(reader.read_nowait()) == b"c"
+
+        assert reader.skip_to_latest() == 2
+        assert reader.read_nowait() is None
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def _test_ring_buffer_copy_blocks():
+    ring = AudioRingBuffer(block_bytes=2, n_slots=3, n_readers=1)
+    try:
+        for block in (b"ab", b"cd", b"e"):
+            ring.write(block)
+        assert ring.copy_blocks(1, 3) == b"cde"
+        assert ring.copy_blocks(2, 4) is None
+
+        # the slot after the newest block counts as overwritten, like for readers
+        ring.write(b"fg")
+        assert ring.copy_blocks(1, 4) is None
+        assert ring.copy_blocks(2, 4) == b"efg"
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def _test_ring_buffer_attach_by_name():
+    ring = AudioRingBuffer(block_bytes=2, n_slots=2, n_readers=1)
+    try:
+        reader = ring.reader(0)
+        other = AudioRingBuffer(block_bytes=2, n_slots=2, n_readers=1, name=ring.name)
+        other.write(b"hi")
+        assert bytes(reader.read_nowait()) == b"hi"
+        other.close()
+    finally:
+        ring.close()
+        ring.unlink()
@@ -4,6 +4,8 @@ import logging
 from multiprocessing import Process, Queue
 import speech_recognition as sr
 
+from chunked_transcriber import ChunkedTranscriber
+from modded_deps.modded_recognizer import ModdedRecognizer
 from models.blip import Blip
 from models.blip_kind import BlipKind
 from models.ears import Ears
@@ -13,14 +15,21 @@ logger = logging.getLogger(__name__)
 
 
 class BasicEars(Ears):
+    """
+    long sentences are split and transcribed by `chunk_workers` processes at once, see
+    `ChunkedTranscriber`. by default every sentence is transcribed whole
+    """
+
     def __init__(
         self,
-        model_name: str = RecognizerName.WHISPER_MEDIUM_OFFLINE,
+        model_name: RecognizerName = RecognizerName.WHISPER_MEDIUM_EN_OFFLINE,
         handle_blip: Callable | None = None,
+        chunk_workers: int = 1,
     ):
         super().__init__()
         self.model_name = model_name
-        self._recognizer = sr.Recognizer()
+        self._recognizer = ModdedRecognizer()
+        self._transcriber = ChunkedTranscriber(model_name, n_workers=chunk_workers)
         self._queue = Queue()
 
         self.handle_blip = handle_blip
@@ -33,31 +42,22 @@ class BasicEars(Ears):
         """
         Note: this blocks forever
         """
+        # load and warm the model now rather than on the first sentence
+        self._transcriber.start()
         logger.debug("listening for words")
 
         with sr.Microphone() as source:
+            # TODO: allow for mic configuration, handle multi-mic setups
+            self._recognizer.calibrate(source)
             while True:
                 self._listen_for_sentence(source)
 
     def _listen_for_sentence(self, source: sr.Microphone) -> str:
         logger.debug("listening for sentence")
-        # TODO: allow for mic configuration, handle multi-mic setups
-        self._recognizer.adjust_for_ambient_noise(source)
-        audio = self._recognizer.listen(source)
+        audio = self._recognizer.listen_with_dispatch(source)
 
         try:
-            if self.model_name == RecognizerName.WHISPER_SMALL_OFFLINE:
-                text = self._recognizer.recognize_whisper(audio, model="small.en")
-            elif self.model_name == RecognizerName.WHISPER_BASE_OFFLINE:
-                text = self._recognizer.recognize_whisper(audio, model="base.en")
-            elif self.model_name == RecognizerName.WHISPER_MEDIUM_OFFLINE:
-                text = self._recognizer.recognize_whisper(audio, model="medium.en")
-            elif self.model_name == RecognizerName.WHISPER_LARGE_OFFLINE:
-                text = self._recognizer.recognize_whisper(audio, model="large")
-            elif self.model_name == RecognizerName.GOOGLE:
-                text = self._recognizer.recognize_google(audio)
-            else:
-                raise TypeError(f"Unhandled model type {self.model_name}")
+            text = self._transcriber.transcribe(audio)
 
             for word in text.split(" "):
                 self._queue.put(Blip(kind=BlipKind.WORD, val=word))
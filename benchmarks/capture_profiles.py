@@ -0,0 +1,73 @@
+"""
+measures how `CaptureProfile` settings trade cpu against latency in `VoskStreamedEars`.
+
+each profile replays the same recording as fast as possible and reports cpu time per
+second of audio, how often partial results were pulled, per-block decode time, and the
+worst-case delay before a change in speech can be noticed: one block of buffering,
+plus waiting for the next partial poll, plus a (p90) block decode.
+
+usage: python -m benchmarks.capture_profiles MODEL_PATH WAV_PATH
+"""
+
+import argparse
+import logging
+
+import numpy as np
+from vosk import Model
+
+from audio_inputs import WavFileInput
+from benchmarks.vosk_replay import replay
+from models.capture_profile import CaptureProfile
+
+PROFILES = {
+    "default 500ms": CaptureProfile.default(),
+    "500ms, every partial": CaptureProfile(0.5, 0.5, skip_unchanged_partials=False),
+    "low latency 100ms": CaptureProfile.low_latency(),
+    "100ms, every partial": CaptureProfile(0.1, 0.1, skip_unchanged_partials=False),
+    "lowest latency 50ms": CaptureProfile.lowest_latency(),
+    "50ms, every partial": CaptureProfile(0.05, 0.05, skip_unchanged_partials=False),
+}
+
+
+def run(model_path: str, wav_path: str):
+    model = Model(model_path)
+    sample_rate = WavFileInput(wav_path).sample_rate
+
+    print(
+        f"{'profile':<24}{'cpu %':>8}{'polls/s':>9}{'decode p90':>12}{'notice latency':>16}"
+    )
+    for name, profile in PROFILES.items():
+        audio_input = WavFileInput(
+            wav_path, realtime=False, block_size=profile.block_size(sample_rate)
+        )
+        result = replay(
+            model,
+            model_path,
+            audio_input,
+            capture_profile=profile,
+            use_wake_grammar=False,
+            use_vad=False,
+        )
+
+        audio_secs = result.audio_secs
+        n_polls = sum(r.n_partial_polls for r in result.recognizers)
+        decode_p90 = float(np.percentile(result.recognizer.accept_secs, 90))
+        poll_wait = max(profile.partial_interval_secs, profile.block_secs)
+        notice_secs = profile.block_secs + poll_wait + decode_p90
+        print(
+            f"{name:<24}"
+            f"{result.cpu_secs / audio_secs * 100:>7.1f}%"
+            f"{n_polls / audio_secs:>9.1f}"
+            f"{decode_p90 * 1e3:>10.1f}ms"
+            f"{notice_secs * 1e3:>14.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("model_path")
+    parser.add_argument("wav_path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    run(args.model_path, args.wav_path)
@@ -0,0 +1,89 @@
+"""
+micro-benchmark of the per-block control-state overhead in `VoskStreamedEars`.
+
+compares the old `mp.Manager` proxies against `SharedEarsState` for the field accesses
+`_handle_partial` and `_handle_words` make on every decoded block.
+
+usage: python -m benchmarks.ears_state [iterations]
+"""
+
+import multiprocessing as mp
+import sys
+import time
+
+from ears_state import SharedEarsState
+from models.listening_mode import ListeningMode
+
+
+def _manager_partial(state, lock):
+    last_audio_time, listening_mode = state
+    with lock:
+        last_audio_time.value = time.time()
+        _ = listening_mode.value == ListeningMode.PASSIVE
+
+
+def _manager_words(state, lock):
+    last_audio_time, listening_mode, words = state
+    with lock:
+        words.append("some words")
+        last_audio_time.value = time.time()
+        _ = listening_mode.value == ListeningMode.ACTIVE
+
+
+def _shared_partial(state: SharedEarsState):
+    state.last_audio_time = time.time()
+    _ = state.listening_mode == ListeningMode.PASSIVE
+
+
+def _shared_words(state: SharedEarsState):
+    with state.lock:
+        state.transcript.append("some words")
+        state.last_audio_time = time.time()
+        _ = state.listening_mode == ListeningMode.ACTIVE
+
+
+def _time_per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations: int):
+    manager = mp.Manager()
+    lock = manager.Lock()
+    last_audio_time = manager.Value("d", 0.0)
+    listening_mode = manager.Value("s", ListeningMode.PASSIVE)
+    words = manager.list()
+
+    shared = SharedEarsState("hey agent")
+
+    rows = [
+        (
+            "partial",
+            _time_per_call_us(
+                lambda: _manager_partial((last_audio_time, listening_mode), lock),
+                iterations,
+            ),
+            _time_per_call_us(lambda: _shared_partial(shared), iterations),
+        ),
+        (
+            "words",
+            _time_per_call_us(
+                lambda: _manager_words((last_audio_time, listening_mode, words), lock),
+                iterations,
+            ),
+            _time_per_call_us(lambda: _shared_words(shared), iterations),
+        ),
+    ]
+    manager.shutdown()
+
+    print(f"{'handler':<10}{'manager us':>14}{'shared us':>14}{'speedup':>10}")
+    for name, before_us, after_us in rows:
+        print(
+            f"{name:<10}{before_us:>14.2f}{after_us:>14.2f}{before_us / after_us:>9.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000)
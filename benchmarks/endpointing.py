@@ -0,0 +1,158 @@
+"""
+replays timed transcripts of spoken turns through the endpointer and reports, per
+endpointing config, how long prompts wait after the last word and how often a turn is
+cut off at a pause the speaker meant to talk through. compares the adaptive waits to
+the flat pauses they replace.
+
+usage: python -m benchmarks.endpointing TURNS_PATH [--complete SECS] [--question SECS]
+    [--neutral SECS] [--trailing SECS]
+       python -m benchmarks.endpointing --vosk-model MODEL_PATH --wav WAV_PATH
+    [--turn-gap SECS]
+
+TURNS_PATH is a jsonl file with one turn per line: {"words": [[word, start, end], ...]}.
+with --vosk-model the turns are transcribed from a 16 bit mono wav instead, split
+wherever nobody speaks for --turn-gap seconds.
+
+a turn is cut off when the endpointer's wait after some word is shorter than the gap to
+the next word. hypotheses are never counted as stable, replayed words are all final
+"""
+
+import argparse
+import json
+import wave
+
+import numpy as np
+from vosk import Model
+
+from endpointing import Endpointer
+from models.endpointing_config import EndpointingConfig
+from models.timed_word import TimedWord
+from vosk_streamed_ears import PAUSE_THRESHOLD_SECS, Recognizer
+
+TURN_GAP_SECS = 3.0
+# the flat waits StatefulEars used before endpointing adapted (incomplete / complete)
+STATEFUL_PAUSE_AFTER_INCOMPLETE_SECS = 1.5
+STATEFUL_PAUSE_AFTER_COMPLETE_SECS = 3.0
+
+
+def load_turns(path: str) -> list[list[TimedWord]]:
+    with open(path, encoding="utf-8") as f:
+        return [
+            [
+                TimedWord(word, start, end)
+                for word, start, end in json.loads(line)["words"]
+            ]
+            for line in f
+            if line.strip()
+        ]
+
+
+def transcribe_turns(
+    model_path: str, wav_path: str, turn_gap_secs: float
+) -> list[list[TimedWord]]:
+    words: list[TimedWord] = []
+    with wave.open(wav_path, "rb") as wav:
+        rate = wav.getframerate()
+        recognizer = Recognizer(Model(model_path), rate)
+        block_frames = rate // 10
+        n_read = 0
+        while data := wav.readframes(block_frames):
+            if recognizer.AcceptWaveform(data, n_read / rate):
+                recognizer.get_full()
+                words.extend(recognizer.last_words)
+            n_read += len(data) // wav.getsampwidth()
+        recognizer.get_final()
+        words.extend(recognizer.last_words)
+
+    turns: list[list[TimedWord]] = []
+    for word in words:
+        if not turns or word.start - turns[-1][-1].end >= turn_gap_secs:
+            turns.append([])
+        turns[-1].append(word)
+    return turns
+
+
+def replay_turn(endpointer: Endpointer, turn: list[TimedWord]) -> float | None:
+    """
+    seconds waited after the last word of `turn` before it was sent, None if it was cut
+    off at an earlier pause
+    """
+    for i, word in enumerate(turn[:-1]):
+        text = " ".join(w.word for w in turn[: i + 1])
+        if endpointer.pause_secs(text) < turn[i + 1].start - word.end:
+            return None
+    return endpointer.pause_secs(" ".join(w.word for w in turn))
+
+
+def run(turns: list[list[TimedWord]], adaptive: EndpointingConfig):
+    configs = {
+        f"fixed {PAUSE_THRESHOLD_SECS}s (vosk)": EndpointingConfig.fixed(
+            PAUSE_THRESHOLD_SECS
+        ),
+        "stateful thresholds": EndpointingConfig(
+            complete_pause_secs=STATEFUL_PAUSE_AFTER_COMPLETE_SECS,
+            question_pause_secs=STATEFUL_PAUSE_AFTER_COMPLETE_SECS,
+            neutral_pause_secs=STATEFUL_PAUSE_AFTER_INCOMPLETE_SECS,
+            stable_pause_secs=STATEFUL_PAUSE_AFTER_INCOMPLETE_SECS,
+            trailing_pause_secs=STATEFUL_PAUSE_AFTER_INCOMPLETE_SECS,
+        ),
+        "adaptive": adaptive,
+    }
+    results = {
+        name: [replay_turn(Endpointer(config), turn) for turn in turns]
+        for name, config in configs.items()
+    }
+
+    print(f"turns:              {len(turns)}")
+    adaptive_waits = results["adaptive"]
+    for name, waits in results.items():
+        sent = [wait for wait in waits if wait is not None]
+        line = (
+            f"  {name:<22} median wait {_median(sent)},"
+            f" cut off {len(waits) - len(sent)}/{len(waits)}"
+            f" ({(len(waits) - len(sent)) / max(len(waits), 1):.0%})"
+        )
+        if name != "adaptive":
+            # only turns neither config cut off are comparable
+            saved = [
+                wait - adaptive_wait
+                for wait, adaptive_wait in zip(waits, adaptive_waits)
+                if wait is not None and adaptive_wait is not None
+            ]
+            line += f", adaptive saves {_median(saved)} (median)"
+        print(line)
+
+
+def _median(values_secs: list[float]) -> str:
+    if not values_secs:
+        return "n/a"
+    return f"{np.median(values_secs):.2f}s"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("turns_path", nargs="?", default=None)
+    parser.add_argument("--vosk-model", default=None)
+    parser.add_argument("--wav", default=None, help="recording to transcribe with vosk")
+    parser.add_argument("--turn-gap", type=float, default=TURN_GAP_SECS)
+    default = EndpointingConfig.default()
+    parser.add_argument("--complete", type=float, default=default.complete_pause_secs)
+    parser.add_argument("--question", type=float, default=default.question_pause_secs)
+    parser.add_argument("--neutral", type=float, default=default.neutral_pause_secs)
+    parser.add_argument("--trailing", type=float, default=default.trailing_pause_secs)
+    args = parser.parse_args()
+
+    if args.vosk_model:
+        _turns = transcribe_turns(args.vosk_model, args.wav, args.turn_gap)
+    else:
+        _turns = load_turns(args.turns_path)
+    run(
+        _turns,
+        EndpointingConfig(
+            complete_pause_secs=args.complete,
+            question_pause_secs=args.question,
+            neutral_pause_secs=args.neutral,
+            stable_pause_secs=default.stable_pause_secs,
+            trailing_pause_secs=args.trailing,
+        ),
+    )
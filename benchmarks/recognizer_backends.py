@@ -0,0 +1,52 @@
+"""
+measures what preloading saves: the cold load and warm-up of a recognizer backend,
+then the first and a repeated transcription of the same recording.
+
+usage: python -m benchmarks.recognizer_backends WAV_PATH RECOGNIZER [RECOGNIZER ...]
+
+RECOGNIZER is a `RecognizerName` value, e.g. whisper_base_en_offline or
+whisper_base_en_int8_offline
+"""
+
+import argparse
+import logging
+import time
+
+import speech_recognition as sr
+
+from models.recognizer_name import RecognizerName
+from recognizer_backends import get_backend, load_recognizer
+
+
+def run(wav_path: str, names: list[RecognizerName]):
+    with sr.AudioFile(wav_path) as source:
+        audio = sr.Recognizer().record(source)
+    audio_secs = len(audio.frame_data) / audio.sample_width / audio.sample_rate
+
+    print(
+        f"{'recognizer':<32}{'load+warm':>10}{'1st':>8}{'2nd':>8}{'RTF':>7}  transcript"
+    )
+    for name in names:
+        start = time.perf_counter()
+        recognizer = load_recognizer(name)
+        load_secs = time.perf_counter() - start
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            text = recognizer.transcribe(audio)
+            timings.append(time.perf_counter() - start)
+        warm = "" if get_backend(name).warm_up else " (no warm up)"
+        print(
+            f"{name.value:<32}{load_secs:>9.2f}s{timings[0]:>7.2f}s{timings[1]:>7.2f}s"
+            f"{timings[1] / audio_secs:>7.2f}  {text[:40]}{warm}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("wav_path")
+    parser.add_argument("recognizers", nargs="+", type=RecognizerName)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    run(args.wav_path, args.recognizers)
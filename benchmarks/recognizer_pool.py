@@ -0,0 +1,64 @@
+"""
+replays the same recording as several concurrent realtime streams through one
+`RecognizerPool` and reports per-session block latency, to size how many streams a
+host can serve with a given number of workers.
+
+usage: python -m benchmarks.recognizer_pool MODEL_PATH WAV_PATH [--streams N] [--workers N]
+"""
+
+import argparse
+from contextlib import ExitStack
+import logging
+import time
+
+from audio_inputs import WavFileInput
+from benchmarks.vosk_replay import _format_percentiles
+from recognizer_pool import RecognizerPool
+
+DRAIN_SECS = 2.0  # time allowed for workers to finish the last blocks
+
+
+def run(model_path: str, wav_path: str, n_streams: int, n_workers: int | None):
+    sample_rate = WavFileInput(wav_path).sample_rate
+    pool = RecognizerPool(model_path, n_workers=n_workers, sample_rate=sample_rate)
+    load_start = time.perf_counter()
+    pool.start()
+    print(f"model load + fork:  {time.perf_counter() - load_start:.2f}s")
+
+    sessions = [pool.open_session() for _ in range(n_streams)]
+    inputs = [
+        WavFileInput(wav_path, realtime=True, block_size=pool.block_size)
+        for _ in sessions
+    ]
+    with ExitStack() as stack:
+        for session, audio_input in zip(sessions, inputs):
+            stack.enter_context(audio_input.open(session.write))
+        while not all(audio_input.is_exhausted() for audio_input in inputs):
+            time.sleep(0.1)
+        time.sleep(DRAIN_SECS)
+    pool.stop()
+
+    print(f"streams:            {n_streams} on {pool.n_workers} workers")
+    all_latencies = []
+    for session in sessions:
+        latencies = list(session.latencies_secs)
+        all_latencies.extend(latencies)
+        print(
+            f"  session {session.session_id:<3} {session.n_blocks:>5} blocks,"
+            f" {session.n_overruns} dropped, {_format_percentiles(latencies)}"
+        )
+    print(f"all sessions:       {_format_percentiles(all_latencies)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("model_path")
+    parser.add_argument("wav_path")
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="defaults to one per cpu"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    run(args.model_path, args.wav_path, args.streams, args.workers)
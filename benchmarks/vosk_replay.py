@@ -0,0 +1,221 @@
+"""
+replays a recording through `VoskStreamedEars` with the agent stubbed out and reports
+recognizer throughput and latency, so performance can be tracked without a microphone.
+
+usage: python -m benchmarks.vosk_replay MODEL_PATH AUDIO_PATH [--realtime] [--pcm-rate RATE]
+    [--wake-model PATH | --no-wake-grammar] [--no-vad] [--redecode RECOGNIZER]
+
+AUDIO_PATH is a 16 bit wav file, or headerless mono int16 PCM when --pcm-rate is given
+"""
+
+import argparse
+from dataclasses import dataclass
+import logging
+import threading
+import time
+
+import numpy as np
+from vosk import Model
+
+from audio_inputs import PcmFileInput, WavFileInput
+from models.audio_input import SAMPLE_WIDTH
+from models.recognizer_name import RecognizerName
+from vosk_streamed_ears import PAUSE_THRESHOLD_SECS, Recognizer, VoskStreamedEars
+
+
+class _TimedRecognizer(Recognizer):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.sample_rate = args[1]
+        self.accept_secs: list[float] = []
+        self.audio_secs = 0.0
+        self.n_partial_polls = 0
+
+    def AcceptWaveform(self, data, capture_secs=None):  # pylint: disable=C0103
+        start = time.perf_counter()
+        is_final = super().AcceptWaveform(data, capture_secs)
+        self.accept_secs.append(time.perf_counter() - start)
+        self.audio_secs += len(data) / SAMPLE_WIDTH / self.sample_rate
+        return is_final
+
+    def PartialResult(self):  # pylint: disable=C0103
+        self.n_partial_polls += 1
+        return super().PartialResult()
+
+
+class _StubAgent:
+    """
+    stands in for `Agent`, records when each prompt arrives relative to the last word heard,
+    and how much of that was silence the recognizer had actually decoded. speculations and
+    interruptions are ignored
+    """
+
+    def __init__(self, ears: VoskStreamedEars):
+        self._ears = ears
+        self.prompt_latencies_secs: list[float] = []
+        self.prompt_silences_secs: list[float] = []
+
+    def prompt(self, prompt: str):
+        state = self._ears._state  # pylint: disable=W0212
+        self.prompt_latencies_secs.append(time.time() - state.last_audio_time)
+        self.prompt_silences_secs.append(state.decoded_silence_secs())
+        logging.info("stub agent prompted: %s", prompt)
+
+    def speculate(self, prompt: str):
+        pass
+
+    def interrupt(self):
+        pass
+
+
+def _format_percentiles(values_secs: list[float]) -> str:
+    if not values_secs:
+        return "n/a"
+    p50, p90, p99 = np.percentile(np.array(values_secs) * 1e3, [50, 90, 99])
+    return f"p50={p50:.2f}ms p90={p90:.2f}ms p99={p99:.2f}ms max={max(values_secs) * 1e3:.2f}ms"
+
+
+@dataclass
+class Replay:
+    ears: VoskStreamedEars
+    agent: _StubAgent
+    recognizer: _TimedRecognizer
+    wake_recognizer: _TimedRecognizer | None
+    wall_secs: float
+    cpu_secs: float
+
+    @property
+    def recognizers(self) -> list[_TimedRecognizer]:
+        return [self.recognizer] + (
+            [self.wake_recognizer] if self.wake_recognizer else []
+        )
+
+    @property
+    def audio_secs(self) -> float:
+        return sum(r.audio_secs for r in self.recognizers)
+
+
+def replay(model: Model, model_path: str, audio_input, **ears_kwargs) -> Replay:
+    """
+    runs `audio_input` through the ears' listening loop in this process, with the
+    endpoint scheduler on a thread and the agent stubbed out
+    """
+    ears = VoskStreamedEars(model_path, audio_input=audio_input, **ears_kwargs)
+    agent = _StubAgent(ears)
+    ears.agent = agent
+    recognizer = _TimedRecognizer(model, audio_input.sample_rate)
+
+    # pylint: disable=W0212
+    wake_recognizer = ears._build_wake_recognizer(model, _TimedRecognizer)
+    scheduler = threading.Thread(target=ears._endpoint.run, daemon=True)
+    scheduler.start()
+    start, cpu_start = time.perf_counter(), time.process_time()
+    ears._listen_for_speech(recognizer, wake_recognizer)
+    wall_secs = time.perf_counter() - start
+    cpu_secs = time.process_time() - cpu_start
+    ears._endpoint.stop()
+    # pylint: enable=all
+    scheduler.join()
+    ears.close()
+    return Replay(ears, agent, recognizer, wake_recognizer, wall_secs, cpu_secs)
+
+
+def run(
+    model_path: str,
+    audio_path: str,
+    realtime: bool,
+    pcm_rate: int | None,
+    use_wake_grammar: bool = True,
+    wake_model_path: str | None = None,
+    use_vad: bool = True,
+    redecode_model: RecognizerName | None = None,
+):
+    if pcm_rate:
+        audio_input = PcmFileInput(audio_path, sample_rate=pcm_rate, realtime=realtime)
+    else:
+        audio_input = WavFileInput(audio_path, realtime=realtime)
+
+    load_start = time.perf_counter()
+    model = Model(model_path)
+    load_secs = time.perf_counter() - load_start
+
+    result = replay(
+        model,
+        model_path,
+        audio_input,
+        use_wake_grammar=use_wake_grammar,
+        wake_model_path=wake_model_path,
+        use_vad=use_vad,
+        redecode_model=redecode_model,
+    )
+
+    decode_secs = sum(sum(r.accept_secs) for r in result.recognizers)
+    n_blocks = sum(len(r.accept_secs) for r in result.recognizers)
+    print(f"model load:         {load_secs:.2f}s")
+    print(f"audio decoded:      {result.audio_secs:.2f}s in {n_blocks} blocks")
+    print(f"wall time:          {result.wall_secs:.2f}s (includes endpoint wait)")
+    print(f"decode RTF:         {decode_secs / result.audio_secs:.3f}")
+    print(f"AcceptWaveform:     {_format_percentiles(result.recognizer.accept_secs)}")
+    if result.wake_recognizer:
+        wake_secs = result.wake_recognizer.accept_secs
+        print(f"  wake grammar:     {_format_percentiles(wake_secs)}")
+    vad = result.ears._vad  # pylint: disable=W0212
+    if vad:
+        print(
+            f"vad skipped:        {vad.n_skipped}/{vad.n_skipped + vad.n_passed} blocks"
+        )
+    state = result.ears._state  # pylint: disable=W0212
+    print(
+        f"decoder lag:        peak {state.peak_lag_secs:.2f}s,"
+        f" {state.n_shed_blocks} blocks shed"
+    )
+    print(f"prompts sent:       {len(result.agent.prompt_latencies_secs)}")
+    print(
+        f"speech-to-prompt:   {_format_percentiles(result.agent.prompt_latencies_secs)}"
+        f" (pause threshold {PAUSE_THRESHOLD_SECS}s)"
+    )
+    print(
+        f"  decoded silence:  {_format_percentiles(result.agent.prompt_silences_secs)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("model_path")
+    parser.add_argument("audio_path")
+    parser.add_argument(
+        "--realtime", action="store_true", help="pace the replay like a live microphone"
+    )
+    parser.add_argument(
+        "--pcm-rate", type=int, default=None, help="sample rate of a raw PCM input"
+    )
+    parser.add_argument(
+        "--wake-model", default=None, help="small model for the passive wake grammar"
+    )
+    parser.add_argument(
+        "--no-wake-grammar",
+        action="store_true",
+        help="decode passive audio with the full recognizer",
+    )
+    parser.add_argument(
+        "--no-vad", action="store_true", help="decode every block, silent or not"
+    )
+    parser.add_argument(
+        "--redecode",
+        type=RecognizerName,
+        default=None,
+        help="whisper tier that re-decodes each prompt, e.g. whisper_base_en_offline",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    run(
+        args.model_path,
+        args.audio_path,
+        args.realtime,
+        args.pcm_rate,
+        use_wake_grammar=not args.no_wake_grammar,
+        wake_model_path=args.wake_model,
+        use_vad=not args.no_vad,
+        redecode_model=args.redecode,
+    )
@@ -0,0 +1,342 @@
+from dataclasses import dataclass
+import logging
+import multiprocessing as mp
+import os
+import string
+import sys
+
+import numpy as np
+import speech_recognition as sr
+
+from models.recognizer_name import RecognizerName
+from models.timed_word import TimedWord
+from recognizer_backends import load_recognizer
+
+SEGMENT_SECS = 15.0  # target length of each segment transcribed in parallel
+SEARCH_SECS = 3.0  # how far from a target cut to look for a quieter point
+OVERLAP_SECS = 1.0  # audio shared by neighbouring segments on each side of a cut
+FRAME_SECS = 0.02  # energy is compared over frames this long
+MAX_OVERLAP_WORDS = 8  # longest repeat looked for when stitching plain text
+
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _Segment:
+    """
+    a slice of the phrase, in frames. `start`/`end` is the audio transcribed,
+    `keep_from`/`keep_to` the part of it whose words belong to this segment, the rest
+    is overlap also heard by a neighbour
+    """
+
+    start: int
+    end: int
+    keep_from: int
+    keep_to: int
+
+
+class ChunkedTranscriber:
+    """
+    transcribes long phrases in parallel.
+
+    a phrase longer than `segment_secs` is cut at the quietest point near every
+    `segment_secs`, and the segments, padded with `overlap_secs` of their neighbours'
+    audio so no word is clipped at a cut, are transcribed by a pool of `n_workers`
+    processes. the model is loaded once in `start`, before the pool is forked, so the
+    workers share its pages copy-on-write instead of each loading their own.
+
+    the transcripts are stitched back together: with word timings each word is kept by
+    the segment its middle falls in, otherwise the words repeated where two segments
+    overlap are dropped from the second.
+
+    short phrases, or a single worker, are transcribed in the calling process. so is
+    everything when the model is on a gpu, which forked workers can't use
+    """
+
+    def __init__(
+        self,
+        model_name: RecognizerName,
+        n_workers: int = 1,
+        segment_secs: float = SEGMENT_SECS,
+        overlap_secs: float = OVERLAP_SECS,
+    ):
+        self.model_name = model_name
+        self.n_workers = n_workers
+        self.segment_secs = segment_secs
+        self.overlap_secs = overlap_secs
+        self._pool = None
+
+    def start(self):
+        # warming runs the model, and some runtimes' thread pools don't survive a fork
+        # once used, so the workers are forked from a model that was only loaded
+        recognizer = load_recognizer(self.model_name, warm_up=False)
+        if self.n_workers > 1 and not recognizer.runs_on_cpu:
+            logger.warning(
+                "%s is on a gpu, transcribing long phrases whole", self.model_name.value
+            )
+        elif self.n_workers > 1:
+            # the copy-on-write model sharing relies on fork
+            self._pool = mp.get_context("fork").Pool(
+                self.n_workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, self.n_workers),
+            )
+        load_recognizer(self.model_name)
+
+    def stop(self):
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        recognizer = load_recognizer(self.model_name)
+        segments = _plan_segments(
+            audio, self.segment_secs, SEARCH_SECS, self.overlap_secs
+        )
+        if self._pool is None or len(segments) < 2:
+            return recognizer.transcribe(audio)
+
+        logger.debug(
+            "transcribing %.1fs in %d segments",
+            len(audio.frame_data) / audio.sample_width / audio.sample_rate,
+            len(segments),
+        )
+        with_words = recognizer.has_word_timings
+        width = audio.sample_width
+        results = self._pool.map(
+            _transcribe_segment,
+            [
+                (
+                    self.model_name,
+                    audio.frame_data[segment.start * width : segment.end * width],
+                    audio.sample_rate,
+                    width,
+                    with_words,
+                )
+                for segment in segments
+            ],
+        )
+        if with_words:
+            words = _stitch_words(segments, results, audio.sample_rate)
+            return " ".join(word.word for word in words)
+        return _stitch_texts(results)
+
+
+def _init_worker(model_name: RecognizerName, n_workers: int):
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        # the workers run at once, left alone each would use every core
+        torch.set_num_threads(max((os.cpu_count() or 1) // n_workers, 1))
+    load_recognizer(model_name)
+
+
+def _transcribe_segment(
+    args: tuple[RecognizerName, bytes, int, int, bool],
+) -> list[TimedWord] | str:
+    model_name, frames, sample_rate, sample_width, with_words = args
+    recognizer = load_recognizer(model_name)
+    audio = sr.AudioData(bytes(frames), sample_rate, sample_width)
+    try:
+        if with_words:
+            return recognizer.transcribe_words(audio)
+        return recognizer.transcribe(audio)
+    except sr.UnknownValueError:
+        return [] if with_words else ""
+
+
+def _frame_energies(audio: sr.AudioData) -> tuple[np.ndarray, int]:
+    """
+    the rms of every `FRAME_SECS` frame of `audio`, and the frame length in samples
+    """
+    samples = np.frombuffer(audio.frame_data, dtype=_SAMPLE_DTYPES[audio.sample_width])
+    frame_len = max(int(audio.sample_rate * FRAME_SECS), 1)
+    n_frames = len(samples) // frame_len
+    frames = samples[: n_frames * frame_len].reshape(n_frames, frame_len)
+    frames = frames.astype(np.float64)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame_len), frame_len
+
+
+def _plan_segments(
+    audio: sr.AudioData, segment_secs: float, search_secs: float, overlap_secs: float
+) -> list[_Segment]:
+    n_samples = len(audio.frame_data) // audio.sample_width
+    n_segments = round(n_samples / audio.sample_rate / segment_secs)
+    if n_segments < 2:
+        return [_Segment(0, n_samples, 0, n_samples)]
+
+    energies, frame_len = _frame_energies(audio)
+    search = int(search_secs / FRAME_SECS)
+    cuts = []
+    for i in range(1, n_segments):
+        target = int(len(energies) * i / n_segments)
+        lo = max(target - search, 0)
+        hi = min(target + search + 1, len(energies))
+        # the middle of the quietest frame, the first of equally quiet ones
+        cuts.append((lo + int(np.argmin(energies[lo:hi]))) * frame_len + frame_len // 2)
+
+    overlap = int(overlap_secs * audio.sample_rate)
+    bounds = [0, *cuts, n_samples]
+    return [
+        _Segment(
+            start=max(keep_from - overlap, 0),
+            end=min(keep_to + overlap, n_samples),
+            keep_from=keep_from,
+            keep_to=keep_to,
+        )
+        for keep_from, keep_to in zip(bounds, bounds[1:])
+    ]
+
+
+def _stitch_words(
+    segments: list[_Segment], results: list[list[TimedWord]], sample_rate: int
+) -> list[TimedWord]:
+    """
+    joins the segments' words, timed from the start of the phrase. a word heard by two
+    segments is kept by the one its middle belongs to
+    """
+    stitched = []
+    for segment, words in zip(segments, results):
+        offset = segment.start / sample_rate
+        keep_from = segment.keep_from / sample_rate
+        keep_to = segment.keep_to / sample_rate
+        for word in words:
+            start, end = word.start + offset, word.end + offset
+            if keep_from <= (start + end) / 2 < keep_to:
+                stitched.append(TimedWord(word.word, start, end, word.conf))
+    return stitched
+
+
+def _stitch_texts(texts: list[str]) -> str:
+    """
+    joins the segments' transcripts, dropping the longest run of words the next one
+    starts with that the previous one already ended with
+    """
+    words: list[str] = []
+    for text in texts:
+        new_words = text.split()
+        normalized = [_normalize(word) for word in new_words]
+        n_overlap = 0
+        for n in range(min(len(words), len(new_words), MAX_OVERLAP_WORDS), 0, -1):
+            if [_normalize(word) for word in words[-n:]] == normalized[:n]:
+                n_overlap = n
+                break
+        words.extend(new_words[n_overlap:])
+    return " ".join(words)
+
+
+def _normalize(word: str) -> str:
+    return word.lower().strip(string.punctuation)
+
+
+def _test_cuts_fall_in_the_quiet_between_words():
+    rate = 100
+    samples = np.full(rate * 40, 1_000, dtype=np.int16)
+    # quiet at 18s and 35s
+    samples[18 * rate : 18 * rate + 10] = 0
+    samples[35 * rate : 35 * rate + 10] = 0
+    audio = sr.AudioData(samples.tobytes(), rate, 2)
+
+    assert len(_plan_segments(audio, 60, 3, 1)) == 1
+
+    segments = _plan_segments(audio, 20, 3, 1)
+    assert segments == [
+        _Segment(0, 1_901, 0, 1_801),
+        _Segment(1_701, 4_000, 1_801, 4_000),
+    ]
+
+    # the quiet at 35s is too far from the cut aimed at 26.7s to be found
+    segments = _plan_segments(audio, 13.3, 5, 1)
+    assert [segment.keep_to for segment in segments] == [1_801, 2_167, 4_000]
+
+
+def _test_stitching_drops_words_heard_twice():
+    segments = [_Segment(0, 1_200, 0, 1_000), _Segment(800, 2_000, 1_000, 2_000)]
+    results = [
+        [TimedWord("turn", 8.5, 8.8), TimedWord("off", 9.7, 10.2)],
+        # "off" is heard again, from 8s into the phrase
+        [TimedWord("of", 1.7, 2.2), TimedWord("lights", 2.5, 3.0)],
+    ]
+    stitched = _stitch_words(segments, results, 100)
+    assert [word.word for word in stitched] == ["turn", "off", "lights"]
+    assert stitched[2].start == 10.5
+
+    assert (
+        _stitch_texts(["turn off the", "Off the lights.", "", "lights. please"])
+        == "turn off the lights. please"
+    )
+    assert _stitch_texts(["one two", "three"]) == "one two three"
+
+
+def _test_long_phrase_is_transcribed_in_parallel():
+    from recognizer_backends import (  # pylint: disable=C0415
+        RecognizerBackend,
+        _loaded,
+        get_backend,
+        register_backend,
+    )
+
+    # every word is a run of samples all equal to its number, words are split by silence
+    rate = 100
+    script = [(n, n * 2.0, n * 2.0 + 1.5) for n in range(1, 20)]
+    samples = np.zeros(rate * 40, dtype=np.int16)
+    for n, start, end in script:
+        samples[int(start * rate) : int(end * rate)] = n
+
+    def transcribe_words(model, audio: sr.AudioData, prompt: str) -> list[TimedWord]:
+        heard = np.frombuffer(audio.frame_data, dtype=np.int16)
+        words = []
+        for n in np.unique(heard[heard > 0]):
+            at = np.flatnonzero(heard == n)
+            words.append(TimedWord(f"w{n}", at[0] / rate, (at[-1] + 1) / rate))
+        return words
+
+    def transcribe(model, audio: sr.AudioData) -> str:
+        return " ".join(word.word for word in transcribe_words(model, audio, ""))
+
+    name = RecognizerName.WHISPER_BASE_EN_OFFLINE
+    original = get_backend(name)
+    register_backend(
+        name,
+        RecognizerBackend(
+            lambda: None, transcribe, warm_up=False, transcribe_words=transcribe_words
+        ),
+    )
+    chunked = ChunkedTranscriber(name, n_workers=2, segment_secs=10)
+    try:
+        chunked.start()
+        text = chunked.transcribe(sr.AudioData(samples.tobytes(), rate, 2))
+    finally:
+        chunked.stop()
+        register_backend(name, original)
+        _loaded.pop(name, None)
+
+    assert text == " ".join(f"w{n}" for n, _, _ in script)
+
+
+def _test_model_on_a_gpu_is_not_forked():
+    from types import SimpleNamespace  # pylint: disable=C0415
+
+    from recognizer_backends import (  # pylint: disable=C0415
+        RecognizerBackend,
+        _loaded,
+        get_backend,
+        register_backend,
+    )
+
+    name = RecognizerName.WHISPER_BASE_EN_OFFLINE
+    original = get_backend(name)
+    model = SimpleNamespace(device=SimpleNamespace(type="cuda"))
+    register_backend(
+        name, RecognizerBackend(lambda: model, lambda model, audio: "", warm_up=False)
+    )
+    chunked = ChunkedTranscriber(name, n_workers=2)
+    try:
+        chunked.start()
+        assert chunked._pool is None  # pylint: disable=W0212
+    finally:
+        chunked.stop()
+        register_backend(name, original)
+        _loaded.pop(name, None)
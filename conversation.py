@@ -0,0 +1,235 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+import logging
+import threading
+import time
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from models.cache_stats import CacheStats
+from models.response_stats import ResponseStats
+
+SYSTEM_PROMPT = (
+    "You are a voice assistant. Everything you say is read aloud, so answer in short, "
+    "plain spoken sentences without markdown, lists or code unless asked for them."
+)
+HISTORY_TOKEN_BUDGET = 4_000  # earlier turns kept word for word before summarizing
+CHARS_PER_TOKEN = 4  # rough, for estimating history size without a tokenizer round trip
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the conversation so far for your own later reference. Keep every fact, "
+    "name, preference and open question the user mentioned, drop small talk. Reply "
+    "with the summary only."
+)
+
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _Turn:
+    prompt: str
+    response: str
+
+    def n_tokens(self) -> int:
+        return (len(self.prompt) + len(self.response)) // CHARS_PER_TOKEN + 1
+
+
+class Conversation:
+    """
+    the history sent along with every prompt.
+
+    earlier turns are kept word for word while they fit in `history_token_budget`. past
+    that, the oldest are folded into a rolling summary, in the background and enough of
+    them at once to bring the history down to half the budget, so the start of what the
+    model sees rarely changes.
+
+    the system prompt (with the summary) and the last turn before the new prompt are
+    marked as cache breakpoints for anthropic's prompt caching, so each turn reads the
+    prefix the turn before it wrote and only the new prompt is processed from scratch.
+    anthropic only caches prefixes past a minimum length (1024 tokens for most models),
+    short conversations miss until they get there
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[list[BaseMessage]], str],
+        system_prompt: str = SYSTEM_PROMPT,
+        history_token_budget: int = HISTORY_TOKEN_BUDGET,
+    ):
+        self.system_prompt = system_prompt
+        self.history_token_budget = history_token_budget
+        self.cache_stats = CacheStats()
+        self.summary = ""
+        self._summarize = summarize
+        self._turns: list[_Turn] = []
+        self._lock = threading.Lock()
+        self._is_summarizing = False
+
+    @property
+    def n_turns(self) -> int:
+        return len(self._turns)
+
+    def messages(self, prompt: str) -> list[BaseMessage]:
+        """
+        what to send the model to answer `prompt`
+        """
+        with self._lock:
+            summary, turns = self.summary, list(self._turns)
+        messages = self._prefix(summary, turns)
+        messages.append(HumanMessage(content=prompt))
+        return messages
+
+    def add_turn(self, prompt: str, response: str, stats: ResponseStats | None = None):
+        """
+        records an answered prompt, with the stats of the response to it if the model
+        reported its usage
+        """
+        if stats and stats.input_tokens:
+            self._record_cache_use(stats)
+        if not response:
+            return
+        with self._lock:
+            self._turns.append(_Turn(prompt, response))
+            if (
+                self._is_summarizing
+                or self._history_tokens() <= self.history_token_budget
+            ):
+                return
+            to_fold = self._turns_to_fold()
+            self._is_summarizing = True
+        threading.Thread(target=self._fold, args=(to_fold,), daemon=True).start()
+
+    def _prefix(self, summary: str, turns: list[_Turn]) -> list[BaseMessage]:
+        system = [{"type": "text", "text": self.system_prompt}]
+        if summary:
+            system.append(
+                {
+                    "type": "text",
+                    "text": f"The conversation so far, summarized: {summary}",
+                }
+            )
+        system[-1]["cache_control"] = _CACHE_CONTROL
+        messages: list[BaseMessage] = [SystemMessage(content=system)]
+        for turn in turns[:-1]:
+            messages.append(HumanMessage(content=turn.prompt))
+            messages.append(AIMessage(content=turn.response))
+        if turns:
+            messages.append(HumanMessage(content=turns[-1].prompt))
+            messages.append(
+                AIMessage(
+                    content=[
+                        {
+                            "type": "text",
+                            "text": turns[-1].response,
+                            "cache_control": _CACHE_CONTROL,
+                        }
+                    ]
+                )
+            )
+        return messages
+
+    def _history_tokens(self) -> int:
+        return sum(turn.n_tokens() for turn in self._turns)
+
+    def _turns_to_fold(self) -> list[_Turn]:
+        n_tokens = self._history_tokens()
+        to_fold = []
+        for turn in self._turns[:-1]:
+            if n_tokens <= self.history_token_budget // 2:
+                break
+            to_fold.append(turn)
+            n_tokens -= turn.n_tokens()
+        return to_fold
+
+    def _fold(self, turns: list[_Turn]):
+        request = self._prefix(self.summary, turns)
+        request.append(HumanMessage(content=SUMMARY_INSTRUCTIONS))
+        try:
+            summary = self._summarize(request)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("failed to summarize the conversation, will retry")
+            summary = None
+        with self._lock:
+            if summary:
+                self.summary = summary
+                # turns are only ever removed here, the folded ones are still first
+                del self._turns[: len(turns)]
+                logger.debug(
+                    "folded %d turns into the summary, %d left",
+                    len(turns),
+                    self.n_turns,
+                )
+            self._is_summarizing = False
+
+    def _record_cache_use(self, stats: ResponseStats):
+        if stats.cache_read_tokens:
+            self.cache_stats.n_hits += 1
+            self.cache_stats.tokens_saved += stats.cache_read_tokens
+        else:
+            self.cache_stats.n_misses += 1
+        logger.debug(
+            "prompt cache %s: %d of %d input tokens read from it, %d written",
+            "hit" if stats.cache_read_tokens else "miss",
+            stats.cache_read_tokens,
+            stats.input_tokens,
+            stats.cache_creation_tokens,
+        )
+
+
+def _stats(input_tokens: int, cache_read_tokens: int) -> ResponseStats:
+    return ResponseStats(
+        first_token_secs=0.1,
+        first_sentence_secs=0.2,
+        total_secs=1.0,
+        n_tokens=10,
+        input_tokens=input_tokens,
+        cache_read_tokens=cache_read_tokens,
+    )
+
+
+def _test_prefix_is_marked_for_caching():
+    conversation = Conversation(summarize=lambda messages: "")
+    first = conversation.messages("hi")
+    assert [type(m) for m in first] == [SystemMessage, HumanMessage]
+    assert first[0].content[-1]["cache_control"] == _CACHE_CONTROL
+
+    conversation.add_turn("hi", "Hello!", _stats(1_200, 0))
+    conversation.add_turn("what's up", "Not much.", _stats(1_250, 1_200))
+    messages = conversation.messages("bye")
+    assert [m.content for m in messages[1:4]] == ["hi", "Hello!", "what's up"]
+    assert messages[4].content[0]["cache_control"] == _CACHE_CONTROL
+    assert messages[5].content == "bye"
+
+    assert conversation.cache_stats == CacheStats(
+        n_hits=1, n_misses=1, tokens_saved=1_200
+    )
+
+
+def _test_old_turns_are_folded_into_the_summary():
+    requests = []
+    folded = threading.Event()
+
+    def summarize(messages: list[BaseMessage]) -> str:
+        requests.append(messages)
+        folded.set()
+        return "they talked about the weather"
+
+    conversation = Conversation(summarize, history_token_budget=40)
+    for i in range(4):
+        # 15 tokens each
+        conversation.add_turn(f"question {i} " + "x" * 20, "answer " + "y" * 18)
+    assert folded.wait(1)
+    while conversation._is_summarizing:  # pylint: disable=W0212
+        time.sleep(0.001)
+
+    # the first 3 turns were 45 tokens, the 2 before the last are folded to get back
+    # under 20
+    assert [m.content for m in requests[0][1:5:2]] == [
+        "question 0 " + "x" * 20,
+        "question 1 " + "x" * 20,
+    ]
+    assert conversation.n_turns == 2
+    messages = conversation.messages("and tomorrow?")
+    assert "they talked about the weather" in messages[0].content[1]["text"]
+    assert messages[1].content.startswith("question 2")
@@ -0,0 +1,162 @@
+import ctypes
+import multiprocessing as mp
+
+from models.listening_mode import ListeningMode
+from transcript_store import TranscriptStore
+
+_MODES = list(ListeningMode)
+
+
+class _EarsStateStruct(ctypes.Structure):
+    _fields_ = [
+        ("last_audio_time", ctypes.c_double),
+        ("last_word_end_secs", ctypes.c_double),
+        ("processed_audio_secs", ctypes.c_double),
+        ("trigger_end_secs", ctypes.c_double),
+        ("endpoint_pause_secs", ctypes.c_double),
+        ("lag_secs", ctypes.c_double),
+        ("peak_lag_secs", ctypes.c_double),
+        ("n_shed_blocks", ctypes.c_uint64),
+        ("listening_mode", ctypes.c_uint8),
+    ]
+
+
+class SharedEarsState:
+    """
+    control state shared between the ears' listening and prompting processes.
+
+    every field lives in one raw shared-memory struct, so reads are plain memory loads.
+    read-modify-write sequences go through `lock`, a process-shared semaphore that is
+    uncontended almost all of the time (no round trip to a manager server process).
+    """
+
+    def __init__(self, trigger: str):
+        self.lock = mp.Lock()
+        self._struct = mp.RawValue(_EarsStateStruct)
+        self.transcript = TranscriptStore(trigger)
+        self.listening_mode = ListeningMode.PASSIVE
+        self.trigger_end_secs = None
+
+    @property
+    def last_audio_time(self) -> float:
+        return self._struct.last_audio_time
+
+    @last_audio_time.setter
+    def last_audio_time(self, val: float):
+        self._struct.last_audio_time = val
+
+    @property
+    def last_word_end_secs(self) -> float:
+        """
+        capture time at which the last recognized word ended
+        """
+        return self._struct.last_word_end_secs
+
+    @last_word_end_secs.setter
+    def last_word_end_secs(self, val: float):
+        self._struct.last_word_end_secs = val
+
+    @property
+    def processed_audio_secs(self) -> float:
+        """
+        capture time up to which audio has been through the recognizer
+        """
+        return self._struct.processed_audio_secs
+
+    @processed_audio_secs.setter
+    def processed_audio_secs(self, val: float):
+        self._struct.processed_audio_secs = val
+
+    @property
+    def trigger_end_secs(self) -> float | None:
+        """
+        capture time at which the trigger of the current prompt ended, if known
+        """
+        val = self._struct.trigger_end_secs
+        return None if val < 0 else val
+
+    @trigger_end_secs.setter
+    def trigger_end_secs(self, val: float | None):
+        self._struct.trigger_end_secs = -1.0 if val is None else val
+
+    @property
+    def endpoint_pause_secs(self) -> float:
+        """
+        silence after the last word that ends the current prompt
+        """
+        return self._struct.endpoint_pause_secs
+
+    @endpoint_pause_secs.setter
+    def endpoint_pause_secs(self, val: float):
+        self._struct.endpoint_pause_secs = val
+
+    def decoded_silence_secs(self) -> float:
+        """
+        how much audio the recognizer has seen since the last word ended
+        """
+        return self.processed_audio_secs - self.last_word_end_secs
+
+    @property
+    def lag_secs(self) -> float:
+        """
+        seconds of captured audio waiting to be decoded
+        """
+        return self._struct.lag_secs
+
+    @lag_secs.setter
+    def lag_secs(self, val: float):
+        self._struct.lag_secs = val
+        self._struct.peak_lag_secs = max(self._struct.peak_lag_secs, val)
+
+    @property
+    def peak_lag_secs(self) -> float:
+        return self._struct.peak_lag_secs
+
+    @property
+    def n_shed_blocks(self) -> int:
+        """
+        blocks never decoded because the recognizer fell behind
+        """
+        return self._struct.n_shed_blocks
+
+    def shed_blocks(self, n_blocks: int):
+        self._struct.n_shed_blocks += n_blocks
+
+    @property
+    def listening_mode(self) -> ListeningMode:
+        return _MODES[self._struct.listening_mode]
+
+    @listening_mode.setter
+    def listening_mode(self, mode: ListeningMode):
+        self._struct.listening_mode = _MODES.index(mode)
+
+    def has_words(self) -> bool:
+        return self.transcript.has_words()
+
+
+def _test_shared_ears_state_fields():
+    state = SharedEarsState("hey agent")
+    assert state.listening_mode == ListeningMode.PASSIVE
+
+    state.listening_mode = ListeningMode.ACTIVE
+    state.last_audio_time = 12.5
+    assert state.listening_mode == ListeningMode.ACTIVE
+    assert state.last_audio_time == 12.5
+
+    state.last_word_end_secs = 3.25
+    state.processed_audio_secs = 5.0
+    assert state.decoded_silence_secs() == 1.75
+
+    assert state.trigger_end_secs is None
+    state.trigger_end_secs = 0.0
+    assert state.trigger_end_secs == 0.0
+
+    state.endpoint_pause_secs = 0.75
+    assert state.endpoint_pause_secs == 0.75
+
+    state.lag_secs = 1.5
+    state.lag_secs = 0.5
+    state.shed_blocks(3)
+    assert state.lag_secs == 0.5
+    assert state.peak_lag_secs == 1.5
+    assert state.n_shed_blocks == 3
@@ -0,0 +1,198 @@
+from collections.abc import Callable
+import ctypes
+import logging
+import multiprocessing as mp
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_DISARMED = 0.0
+
+
+class EndpointScheduler:
+    """
+    long-lived timer with a single resettable deadline, shared across processes.
+
+    speech handlers move the deadline with `schedule`/`postpone`; `run` sleeps until
+    exactly the current deadline and calls `on_deadline` once it holds. when it wakes up
+    to a postponed deadline it just sleeps the remainder. the pause asked for can also
+    shrink (e.g. once the words make the prompt look finished), a deadline moved
+    earlier wakes the sleeper right away so it never fires late.
+
+    `on_deadline` returns True when it handled the endpoint. returning False re-arms the
+    scheduler `retry_secs` later.
+    """
+
+    def __init__(
+        self,
+        on_deadline: Callable[[], bool],
+        delay_secs: float,
+        retry_secs: float = 0.25,
+    ):
+        self.on_deadline = on_deadline
+        self.delay_secs = delay_secs
+        self.retry_secs = retry_secs
+        self._lock = mp.Lock()
+        self._deadline = mp.RawValue(ctypes.c_double, _DISARMED)
+        self._armed = mp.Event()
+        self._deadline_moved_up = mp.Event()
+        self._idle = mp.Event()
+        self._idle.set()
+        self._stopped = mp.Event()
+
+    @property
+    def is_armed(self) -> bool:
+        return self._deadline.value != _DISARMED
+
+    def schedule(self, delay_secs: float | None = None):
+        """
+        arms the scheduler (if idle) and moves the deadline to `delay_secs` from now
+        """
+        delay_secs = self.delay_secs if delay_secs is None else delay_secs
+        with self._lock:
+            self._move_deadline(time.monotonic() + delay_secs)
+            if not self._armed.is_set():
+                self._idle.clear()
+                self._armed.set()
+
+    def postpone(self, delay_secs: float | None = None):
+        """
+        moves the deadline to `delay_secs` from now, only if the scheduler is armed
+        """
+        delay_secs = self.delay_secs if delay_secs is None else delay_secs
+        with self._lock:
+            if self.is_armed:
+                self._move_deadline(time.monotonic() + delay_secs)
+
+    def _move_deadline(self, deadline: float):
+        if self.is_armed and deadline < self._deadline.value:
+            self._deadline_moved_up.set()
+        self._deadline.value = deadline
+
+    def cancel(self):
+        with self._lock:
+            self._disarm()
+            self._idle.set()
+
+    def _disarm(self):
+        self._armed.clear()
+        self._deadline.value = _DISARMED
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """
+        blocks until the scheduler is disarmed and not dispatching `on_deadline`
+        """
+        return self._idle.wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self._armed.set()
+        self._deadline_moved_up.set()
+
+    def run(self):
+        """
+        Note: this blocks until `stop` is called!
+        """
+        while not self._stopped.is_set():
+            self._armed.wait()
+            with self._lock:
+                deadline = self._deadline.value
+                remaining = deadline - time.monotonic()
+                if deadline == _DISARMED or remaining <= 0:
+                    self._disarm()
+                self._deadline_moved_up.clear()
+            if deadline == _DISARMED:
+                self._idle.set()
+                continue
+            if remaining > 0:
+                self._deadline_moved_up.wait(remaining)
+                continue  # the deadline may have moved while sleeping
+
+            try:
+                handled = self.on_deadline()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("endpoint handler failed")
+                handled = False
+            with self._lock:
+                if self.is_armed:
+                    continue
+                if handled:
+                    self._idle.set()
+                    continue
+            self.schedule(self.retry_secs)
+
+
+def _test_endpoint_scheduler_fires_once_after_last_push():
+    fired_at = []
+
+    def on_deadline():
+        fired_at.append(time.monotonic())
+        return True
+
+    scheduler = EndpointScheduler(on_deadline, delay_secs=0.05)
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    try:
+        scheduler.schedule()
+        time.sleep(0.03)
+        last_push = time.monotonic()
+        scheduler.postpone()
+        time.sleep(0.15)
+
+        assert len(fired_at) == 1
+        assert fired_at[0] - last_push >= 0.05
+        assert not scheduler.is_armed
+        assert scheduler.wait_idle(timeout=0)
+
+        # postponing an idle scheduler does not arm it
+        scheduler.postpone()
+        time.sleep(0.08)
+        assert len(fired_at) == 1
+    finally:
+        scheduler.stop()
+        thread.join()
+
+
+def _test_endpoint_scheduler_fires_on_a_deadline_moved_earlier():
+    fired_at = []
+
+    def on_deadline():
+        fired_at.append(time.monotonic())
+        return True
+
+    scheduler = EndpointScheduler(on_deadline, delay_secs=0.05)
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    try:
+        scheduler.schedule(2.5)
+        time.sleep(0.02)
+        moved_at = time.monotonic()
+        scheduler.schedule(0.05)
+        time.sleep(0.2)
+
+        assert len(fired_at) == 1
+        assert 0.05 <= fired_at[0] - moved_at < 0.15
+    finally:
+        scheduler.stop()
+        thread.join()
+
+
+def _test_endpoint_scheduler_retries_unhandled():
+    calls = []
+
+    def on_deadline():
+        calls.append(time.monotonic())
+        return len(calls) > 1
+
+    scheduler = EndpointScheduler(on_deadline, delay_secs=0.01, retry_secs=0.02)
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    try:
+        scheduler.schedule()
+        time.sleep(0.1)
+        assert len(calls) == 2
+        assert calls[1] - calls[0] >= 0.02
+    finally:
+        scheduler.stop()
+        thread.join()
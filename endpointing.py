@@ -0,0 +1,116 @@
+from enum import Enum
+import string
+
+from models.endpointing_config import EndpointingConfig
+from models.spoken_kind import SpokenKind
+
+QUESTION_STARTERS = frozenset(
+    "what when where who whom whose why which how is are am was were do does did "
+    "can could will would should shall may might have has had".split()
+)
+# words a finished sentence practically never ends with
+TRAILING_WORDS = frozenset(
+    "and or but so because if then than that which the a an to of in on at for "
+    "from with by about into my your his her their our its is are was were be um uh "
+    "like".split()
+)
+
+
+class TurnShape(Enum):
+    COMPLETE = "complete"
+    QUESTION = "question"
+    NEUTRAL = "neutral"
+    TRAILING = "trailing"
+
+
+class Endpointer:
+    """
+    picks how long to wait for more speech after the last word, from the shape of the
+    transcript so far: short after a finished sentence or a question, long when the
+    speaker trails off mid-clause. see `EndpointingConfig` for the waits.
+
+    works on punctuated (whisper) and unpunctuated (vosk) text alike, the word based
+    rules carry the unpunctuated case
+    """
+
+    def __init__(self, config: EndpointingConfig | None = None):
+        self.config = config or EndpointingConfig.default()
+
+    def shape(self, text: str) -> TurnShape:
+        text = text.strip()
+        kind = SpokenKind.kind_from_transcription(text)
+        if kind == SpokenKind.COMPLETE:
+            return TurnShape.QUESTION if text.endswith("?") else TurnShape.COMPLETE
+        if kind == SpokenKind.NONE or text.endswith("..."):
+            return TurnShape.TRAILING
+
+        words = [_normalize(word) for word in text.split()]
+        words = [word for word in words if word]
+        if not words or words[-1] in TRAILING_WORDS:
+            return TurnShape.TRAILING
+        if (
+            words[0] in QUESTION_STARTERS
+            and len(words) >= self.config.min_question_words
+        ):
+            return TurnShape.QUESTION
+        return TurnShape.NEUTRAL
+
+    def looks_finished(self, text: str) -> bool:
+        """
+        whether `text` reads like a whole prompt, worth answering before the pause ends
+        """
+        return self.shape(text) in (TurnShape.COMPLETE, TurnShape.QUESTION)
+
+    def pause_secs(self, text: str, is_stable: bool = False) -> float:
+        """
+        `is_stable` is whether the recognizer's latest hypothesis for `text` agreed with
+        the one before it
+        """
+        shape = self.shape(text)
+        if shape == TurnShape.COMPLETE:
+            return self.config.complete_pause_secs
+        if shape == TurnShape.QUESTION:
+            return self.config.question_pause_secs
+        if shape == TurnShape.TRAILING:
+            return self.config.trailing_pause_secs
+        if is_stable:
+            return self.config.stable_pause_secs
+        return self.config.neutral_pause_secs
+
+
+def _normalize(word: str) -> str:
+    return word.lower().strip(string.punctuation)
+
+
+def _test_endpointer_shapes():
+    endpointer = Endpointer()
+    assert endpointer.shape("Turn off the lights.") == TurnShape.COMPLETE
+    assert endpointer.shape("What time is it?") == TurnShape.QUESTION
+    assert endpointer.shape("what time is it") == TurnShape.QUESTION
+    assert endpointer.shape("what time") == TurnShape.NEUTRAL
+    assert endpointer.shape("turn off the lights") == TurnShape.NEUTRAL
+    assert endpointer.shape("turn off the") == TurnShape.TRAILING
+    assert endpointer.shape("I was thinking...") == TurnShape.TRAILING
+    assert endpointer.shape("") == TurnShape.TRAILING
+
+    assert endpointer.looks_finished("what time is it")
+    assert not endpointer.looks_finished("turn off the lights")
+
+
+def _test_endpointer_pause_secs():
+    config = EndpointingConfig.default()
+    endpointer = Endpointer(config)
+    assert endpointer.pause_secs("what time is it") == config.question_pause_secs
+    assert endpointer.pause_secs("play some jazz and") == config.trailing_pause_secs
+    assert endpointer.pause_secs("play some jazz") == config.neutral_pause_secs
+    assert endpointer.pause_secs("play some jazz", is_stable=True) == (
+        config.stable_pause_secs
+    )
+    # a trailing word outweighs a stable hypothesis
+    assert endpointer.pause_secs("play some jazz and", is_stable=True) == (
+        config.trailing_pause_secs
+    )
+
+    fixed = Endpointer(EndpointingConfig.fixed(2))
+    assert fixed.pause_secs("what time is it?") == 2
+    assert fixed.pause_secs("and") == 2
@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+import logging
+import threading
+import time
+
+from models.fast_path_stats import FastPathStats
+
+# said around a command without changing it
+IGNORED_WORDS = frozenset("please hey agent um uh".split())
+# words that make an answer depend on the conversation or the moment it is asked
+CONTEXT_WORDS = frozenset(
+    "it this that these those he she they him her them his hers their there then "
+    "again now today tonight tomorrow yesterday time date latest current weather "
+    "news me my mine i".split()
+)
+CACHE_SIZE = 256  # responses kept
+CACHE_TTL_SECS = 15 * 60.0  # how long a cached response is trusted
+
+_END = ""  # marks a trie node that ends a phrase, never a normalized word
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> tuple[str, ...]:
+    """
+    the words of `text` lowercased and stripped to letters and digits, the way
+    `BlipHandler._filter_blip` does single words, with `IGNORED_WORDS` dropped
+    """
+    words = (
+        "".join(char.lower() for char in word if char.isalnum())
+        for word in text.split()
+    )
+    return tuple(word for word in words if word and word not in IGNORED_WORDS)
+
+
+class IntentRouter:
+    """
+    answers simple commands without the llm. phrases are compiled into a trie of their
+    normalized words, an utterance matches when all of it spells out a phrase, so a
+    lookup costs a dict step per word.
+
+    a handler returns what to say back, "" to stay quiet
+    """
+
+    def __init__(self):
+        self._root: dict = {}
+
+    def add(self, phrases: Iterable[str], handle: Callable[[], str]):
+        for phrase in phrases:
+            node = self._root
+            for word in normalize(phrase):
+                node = node.setdefault(word, {})
+            node[_END] = handle
+
+    def route(self, words: tuple[str, ...]) -> Callable[[], str] | None:
+        node = self._root
+        for word in words:
+            node = node.get(word)
+            if node is None:
+                return None
+        return node.get(_END)
+
+
+class ResponseCache:
+    """
+    llm responses to prompts that always get the same answer, by normalized prompt.
+    the least recently used are evicted past `max_entries`, and none is kept longer
+    than `ttl_secs`
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl_secs: float = CACHE_TTL_SECS):
+        self.max_entries = max_entries
+        self.ttl_secs = ttl_secs
+        # key -> (response, stored_at, how long the llm took to give it)
+        self._entries: OrderedDict[str, tuple[str, float, float]] = OrderedDict()
+
+    def get(self, key: str) -> tuple[str, float] | None:
+        """
+        the cached response and the latency it saves, None if there is none (anymore)
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, stored_at, latency_secs = entry
+        if time.monotonic() - stored_at > self.ttl_secs:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response, latency_secs
+
+    def put(self, key: str, response: str, latency_secs: float):
+        self._entries[key] = (response, time.monotonic(), latency_secs)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class FastPath:
+    """
+    sits in front of the llm: a prompt is answered by the `router` if it is a known
+    command, then from the `cache` if it was asked before, and only otherwise by the
+    llm, whose response is cached when the prompt doesn't lean on the conversation
+    (see `CONTEXT_WORDS`).
+
+    a routed command saves the llm's average response time so far, a cached response
+    the time it originally took
+    """
+
+    def __init__(
+        self, router: IntentRouter | None = None, cache: ResponseCache | None = None
+    ):
+        self.router = router or IntentRouter()
+        self.cache = cache or ResponseCache()
+        self.stats = FastPathStats()
+        self._lock = threading.Lock()
+        self._n_responses = 0
+        self._response_secs = 0.0
+
+    def reply(self, prompt: str) -> str | None:
+        """
+        the local answer to `prompt`, None if it needs the llm
+        """
+        words = normalize(prompt)
+        handle = self.router.route(words)
+        with self._lock:
+            self.stats.n_prompts += 1
+            if handle is not None:
+                self.stats.n_routed += 1
+                if self._n_responses:
+                    self.stats.latency_saved_secs += (
+                        self._response_secs / self._n_responses
+                    )
+            else:
+                cached = self.cache.get(" ".join(words))
+                if cached is None:
+                    return None
+                self.stats.n_cached += 1
+                self.stats.latency_saved_secs += cached[1]
+                logger.debug("answered from the response cache")
+                return cached[0]
+        logger.debug("routed to a local command")
+        return handle()
+
+    def peek(self, prompt: str) -> bool:
+        """
+        whether `prompt` would be answered locally, without counting it
+        """
+        words = normalize(prompt)
+        if self.router.route(words) is not None:
+            return True
+        with self._lock:
+            return self.cache.get(" ".join(words)) is not None
+
+    def remember(self, prompt: str, response: str, latency_secs: float):
+        """
+        records the llm's `response` to `prompt`, caching it if it can be reused
+        """
+        words = normalize(prompt)
+        with self._lock:
+            self._n_responses += 1
+            self._response_secs += latency_secs
+            if response and words and not CONTEXT_WORDS.intersection(words):
+                self.cache.put(" ".join(words), response, latency_secs)
+
+
+def _test_router_matches_whole_commands():
+    router = IntentRouter()
+    router.add(["what time is it", "what's the time"], lambda: "noon")
+    router.add(["stop"], lambda: "")
+
+    assert router.route(normalize("What time is it?"))() == "noon"
+    assert router.route(normalize("whats the time please"))() == "noon"
+    assert router.route(normalize("Stop!"))() == ""
+    assert router.route(normalize("what time")) is None
+    assert router.route(normalize("stop the music")) is None
+    assert router.route(normalize("")) is None
+
+
+def _test_cache_evicts_least_recent_and_expired():
+    cache = ResponseCache(max_entries=2, ttl_secs=0.05)
+    cache.put("a", "A", 1.0)
+    cache.put("b", "B", 1.0)
+    assert cache.get("a") == ("A", 1.0)
+    cache.put("c", "C", 1.0)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def _test_fast_path_counts_hits_and_latency_saved():
+    fast_path = FastPath()
+    fast_path.router.add(["volume up"], lambda: "")
+
+    assert fast_path.reply("what is the capital of France?") is None
+    fast_path.remember("what is the capital of France?", "Paris.", 1.5)
+    assert fast_path.reply("What is the capital of France") == "Paris."
+
+    # depends on what came before, never cached
+    fast_path.remember("what does it mean", "It means...", 1.0)
+    assert fast_path.reply("what does it mean") is None
+
+    assert fast_path.reply("volume up") == ""
+    assert fast_path.peek("volume up please")
+    stats = fast_path.stats
+    assert (stats.n_prompts, stats.n_routed, stats.n_cached) == (4, 1, 1)
+    assert stats.hit_rate == 0.5
+    # the cached answer took 1.5s, the llm averages 1.25s
+    assert stats.latency_saved_secs == 2.75
@@ -1,22 +1,47 @@
+import asyncio
+from collections import deque
+from datetime import datetime
 import logging
-import multiprocessing as mp
+import time
 
 from dotenv import load_dotenv
 from langchain_anthropic import ChatAnthropic
 from langchain_core.language_models.chat_models import BaseChatModel
 
+from agent_runtime import AgentRuntime
+from conversation import Conversation
+from fast_path import FastPath, IntentRouter
 from models.ears import Ears
 from models.mouth import Mouth
+from models.response_stats import ResponseStats
+from response_stream import ResponseStream, chunk_text
+from speculation import Speculator
 from vosk_streamed_ears import VoskStreamedEars
 
+RESPONSE_STATS_HISTORY = 256  # stats kept for the latest responses
+TIME_PHRASES = ("what time is it", "what's the time", "what is the time")
+REPEAT_PHRASES = ("repeat that", "say that again", "what did you say", "come again")
+STOP_PHRASES = ("stop", "stop talking", "be quiet", "never mind", "cancel", "shut up")
+
 logger = logging.getLogger(__name__)
 
 
 class Agent:
-    def __init__(self, llm: BaseChatModel):
+    def __init__(self, llm: BaseChatModel, conversation: Conversation | None = None):
         self.ears: Ears = None
         self.mouth: Mouth = None
         self.llm: BaseChatModel = llm
+        self.conversation = conversation or Conversation(
+            summarize=lambda messages: chunk_text(self.llm.invoke(messages))
+        )
+        self.response_stats: deque[ResponseStats] = deque(maxlen=RESPONSE_STATS_HISTORY)
+        self.fast_path = FastPath(self._command_router())
+        self._last_response = ""
+        # a speculation is ready once its first token is, that's all the wait it hides
+        self._speculator = Speculator(
+            lambda prompt: self._start_response(prompt).wait_for_first_token(),
+            on_discard=ResponseStream.close,
+        )
 
     def set_ears(self, ears: Ears):
         self.ears = ears
@@ -27,17 +52,165 @@ class Agent:
         mouth.agent = self
 
     def start(self):
-        procs: list[mp.Process] = []
-        if self.ears:
-            procs.append(self.ears.listen())
-        
-        for proc in procs:
-            proc.join()
+        """
+        Note: this blocks until the ears stop listening!
+        """
+        asyncio.run(AgentRuntime(self).run())
 
     def prompt(self, prompt: str):
+        """
+        answers `prompt`, handing each sentence to the mouth as soon as it is generated.
+        commands and repeated questions are answered locally, see `FastPath`
+        """
+        logger.info("human: %s", prompt)
+        reply = self._reply_locally(prompt)
+        if reply is not None:
+            if reply and self.mouth:
+                self.mouth.speak(reply)
+            return
+        asked_at = time.monotonic()
+        stream = self.stream(prompt)
+        first_sentence_secs = None
+        for sentence in stream.sentences():
+            if first_sentence_secs is None:
+                first_sentence_secs = time.monotonic() - asked_at
+            if self.mouth:
+                self.mouth.speak(sentence)
+        self._end_turn(prompt, stream, first_sentence_secs)
+
+    async def aprompt(self, prompt: str):
+        """
+        `prompt` for the runtime's event loop, the response is pulled and spoken off the
+        loop. cancelling stops it once the sentence being spoken is done
+        """
         logger.info("human: %s", prompt)
-        resp = self.llm.invoke(prompt)
-        logger.info("agent: %s", resp.content)
+        reply = self._reply_locally(prompt)
+        if reply is not None:
+            if reply and self.mouth:
+                await asyncio.to_thread(self.mouth.speak, reply)
+            return
+        asked_at = time.monotonic()
+        # taking a speculation waits for its first token
+        starting = asyncio.ensure_future(asyncio.to_thread(self.stream, prompt))
+        try:
+            stream = await asyncio.shield(starting)
+        except asyncio.CancelledError:
+            # the thread can't be stopped, the stream it returns is closed instead
+            starting.add_done_callback(_close_started_stream)
+            raise
+        first_sentence_secs = None
+        try:
+            async for sentence in stream.asentences():
+                if first_sentence_secs is None:
+                    first_sentence_secs = time.monotonic() - asked_at
+                if self.mouth:
+                    await asyncio.to_thread(self.mouth.speak, sentence)
+        except asyncio.CancelledError:
+            stream.close()
+            if self.mouth:
+                self.mouth.stop()
+            logger.info("agent: cancelled")
+            raise
+        self._end_turn(prompt, stream, first_sentence_secs)
+
+    def stream(self, prompt: str) -> ResponseStream:
+        """
+        the response to `prompt`, readable token by token or sentence by sentence while
+        it is generated. picks up the speculative response if it was for `prompt`
+        """
+        return self._speculator.take(prompt) or self._start_response(prompt)
+
+    def speculate(self, prompt: str):
+        """
+        starts answering `prompt` before the ears are sure the speaker has finished,
+        `prompt` picks the answer up if it is asked the same thing
+        """
+        if self.fast_path.peek(prompt):
+            return
+        self._speculator.speculate(prompt)
+
+    def cancel_speculation(self):
+        self._speculator.discard()
+
+    def interrupt(self):
+        """
+        the speaker is talking over the agent. the runtime also cancels the answer in
+        flight, see `PromptScheduler`
+        """
+        self.cancel_speculation()
+        if self.mouth:
+            self.mouth.stop()
+
+    def _command_router(self) -> IntentRouter:
+        router = IntentRouter()
+        router.add(
+            TIME_PHRASES,
+            lambda: f"It's {datetime.now().strftime('%I:%M %p').lstrip('0')}.",
+        )
+        router.add(
+            REPEAT_PHRASES,
+            lambda: self._last_response or "I haven't said anything yet.",
+        )
+        # nothing to say, the prompt just never reaches the llm
+        router.add(STOP_PHRASES, lambda: "")
+        return router
+
+    def _reply_locally(self, prompt: str) -> str | None:
+        reply = self.fast_path.reply(prompt)
+        if reply is None:
+            return None
+        logger.info("agent (local): %s", reply)
+        if reply:
+            self._last_response = reply
+            self.conversation.add_turn(prompt, reply)
+        stats = self.fast_path.stats
+        logger.debug(
+            "fast path: %.0f%% of prompts answered locally, %.2fs saved",
+            stats.hit_rate * 100,
+            stats.latency_saved_secs,
+        )
+        return reply
+
+    def _end_turn(
+        self, prompt: str, stream: ResponseStream, first_sentence_secs: float | None
+    ):
+        text = stream.text()
+        logger.info("agent: %s", text)
+        stats = stream.stats
+        self._last_response = text
+        self.conversation.add_turn(prompt, text, stats)
+        self.fast_path.remember(prompt, text, stats.total_secs)
+        logger.debug(
+            "response: first sentence after %ss, %d tokens at %.1f tokens/s",
+            "n/a" if first_sentence_secs is None else f"{first_sentence_secs:.2f}",
+            stats.n_tokens,
+            stats.tokens_per_sec,
+        )
+        speculation = self._speculator.stats
+        logger.debug(
+            "speculation: %d/%d used, %.2fs hidden",
+            speculation.n_used,
+            speculation.n_started,
+            speculation.hidden_secs,
+        )
+        cache = self.conversation.cache_stats
+        logger.debug(
+            "prompt cache: %d hits, %d misses, %d input tokens saved",
+            cache.n_hits,
+            cache.n_misses,
+            cache.tokens_saved,
+        )
+
+    def _start_response(self, prompt: str) -> ResponseStream:
+        return ResponseStream(
+            self.llm.stream(self.conversation.messages(prompt)),
+            on_finish=self.response_stats.append,
+        ).start()
+
+
+def _close_started_stream(starting: asyncio.Future):
+    if not starting.cancelled() and starting.exception() is None:
+        starting.result().close()
 
 
 def setup():
@@ -1,12 +1,77 @@
 import collections
 import math
 import os
-import audioop
-from typing import override
+import numpy as np
 from speech_recognition import Recognizer, AudioSource, WaitTimeoutError, AudioData
 
+# the noise floor is one of the quietest buffers heard within this window. even fluent
+# speech dips to the background between words, so speech does not drag the floor up,
+# while a background that got louder and stays that way is learned once the window has
+# passed
+NOISE_FLOOR_WINDOW_SECS = 5
+# a low percentile rather than the minimum, a few buffers dropped to silence (e.g. a
+# glitch when the microphone starts) don't take the floor down with them
+NOISE_FLOOR_PERCENTILE = 5
+# the threshold never goes below this, or any sound would start a phrase none can end
+MIN_ENERGY_THRESHOLD = 30
+
 
 class ModdedRecognizer(Recognizer):
+    def __init__(self):
+        super().__init__()
+        self.noise_floor = None
+        self._recent_energies = collections.deque()
+
+    def calibrate(self, source, duration=1):
+        """
+        measures the background once, e.g. right after opening the microphone.
+        while listening, the noise floor (and with it ``energy_threshold``) then keeps
+        tracking the background in the buffers that are read anyway, instead of blocking
+        for a calibration before every phrase
+        """
+        assert isinstance(source, AudioSource), "Source must be an audio source"
+        assert (
+            source.stream is not None
+        ), "Audio source must be entered before calibrating"
+        seconds_per_buffer = float(source.CHUNK) / source.SAMPLE_RATE
+        n_buffers = max(int(math.ceil(duration / seconds_per_buffer)), 1)
+        chunk_bytes = source.CHUNK * source.SAMPLE_WIDTH
+        chunks = []
+        for _ in range(n_buffers):
+            buffer = source.stream.read(source.CHUNK)
+            if len(buffer) < chunk_bytes:
+                break  # reached end of the stream
+            chunks.append(buffer)
+        if not chunks:
+            return
+        # one vectorized pass over the whole calibration window
+        energies = _rms_batch(chunks, source.SAMPLE_WIDTH)
+        self.noise_floor = float(np.median(energies))
+        self._recent_energies.clear()
+        self._recent_energies.extend(energies.tolist())
+        self._update_energy_threshold()
+
+    def _track_noise_floor(self, energy, seconds_per_buffer):
+        """
+        folds the energy of the latest buffer into the noise floor, a running low
+        percentile over the last ``NOISE_FLOOR_WINDOW_SECS``
+        """
+        if not self.dynamic_energy_threshold:
+            return
+        window_buffers = max(int(NOISE_FLOOR_WINDOW_SECS / seconds_per_buffer), 1)
+        self._recent_energies.append(energy)
+        while len(self._recent_energies) > window_buffers:
+            self._recent_energies.popleft()
+        self.noise_floor = float(
+            np.percentile(self._recent_energies, NOISE_FLOOR_PERCENTILE)
+        )
+        self._update_energy_threshold()
+
+    def _update_energy_threshold(self):
+        self.energy_threshold = max(
+            self.noise_floor * self.dynamic_energy_ratio, MIN_ENERGY_THRESHOLD
+        )
+
     def listen_with_dispatch(
         self,
         source,
@@ -79,12 +144,14 @@ class ModdedRecognizer(Recognizer):
         non_speaking_buffer_count = int(
             math.ceil(self.non_speaking_duration / seconds_per_buffer)
         )  # maximum number of buffers of non-speaking audio to retain before and after a phrase
+        chunk_bytes = source.CHUNK * source.SAMPLE_WIDTH
 
         # read audio input for phrases until there is a phrase that is long enough
         elapsed_time = 0  # number of seconds of audio read
         buffer = b""  # an empty buffer means that the stream has ended and there is no data left to read
+        frames = _FrameBuffer(chunk_bytes)
         while True:
-            frames = collections.deque()
+            frames.clear()
 
             if snowboy_configuration is None:
                 # store audio input until the phrase starts
@@ -100,28 +167,14 @@ class ModdedRecognizer(Recognizer):
                     if len(buffer) == 0:
                         break  # reached end of the stream
                     frames.append(buffer)
-                    if (
-                        len(frames) > non_speaking_buffer_count
-                    ):  # ensure we only keep the needed amount of non-speaking buffers
-                        frames.popleft()
+                    # ensure we only keep the needed amount of non-speaking buffers
+                    frames.keep_last_chunks(non_speaking_buffer_count)
 
                     # detect whether speaking has started on audio input
-                    energy = audioop.rms(
-                        buffer, source.SAMPLE_WIDTH
-                    )  # energy of the audio signal
+                    energy = _rms(buffer, source.SAMPLE_WIDTH)
                     if energy > self.energy_threshold:
                         break
-
-                    # dynamically adjust the energy threshold using asymmetric weighted average
-                    if self.dynamic_energy_threshold:
-                        damping = (
-                            self.dynamic_energy_adjustment_damping**seconds_per_buffer
-                        )  # account for different chunk sizes and rates
-                        target_energy = energy * self.dynamic_energy_ratio
-                        self.energy_threshold = (
-                            self.energy_threshold * damping
-                            + target_energy * (1 - damping)
-                        )
+                    self._track_noise_floor(energy, seconds_per_buffer)
             else:
                 # read audio input until the hotword is said
                 snowboy_location, snowboy_hot_word_files = snowboy_configuration
@@ -141,11 +194,9 @@ class ModdedRecognizer(Recognizer):
             phrase_start_time = elapsed_time
 
             if stream:
-                # yield the first buffer of the phrase
-                yield AudioData(
-                    b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH
-                )
-                frames.clear()
+                # yield the first buffer of the phrase, the consumer now owns that memory
+                yield AudioData(frames.view(), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+                frames = _FrameBuffer(chunk_bytes)
 
             while True:
                 # handle phrase being too long by cutting off the audio
@@ -159,30 +210,20 @@ class ModdedRecognizer(Recognizer):
                 buffer = source.stream.read(source.CHUNK)
                 if len(buffer) == 0:
                     break  # reached end of the stream
-                frames.append(buffer)
+                if not stream:
+                    frames.append(buffer)
                 phrase_count += 1
 
                 # check if speaking has stopped for longer than the pause threshold on the audio input
-                energy = audioop.rms(
-                    buffer, source.SAMPLE_WIDTH
-                )  # unit energy of the audio signal within the buffer
+                energy = _rms(buffer, source.SAMPLE_WIDTH)
                 if energy > self.energy_threshold:
                     pause_count = 0
                 else:
                     pause_count += 1
+                self._track_noise_floor(energy, seconds_per_buffer)
                 if pause_count > pause_buffer_count:  # end of the phrase
                     break
 
-                # dynamically adjust the energy threshold using asymmetric weighted average
-                if self.dynamic_energy_threshold:
-                    damping = (
-                        self.dynamic_energy_adjustment_damping**seconds_per_buffer
-                    )  # account for different chunk sizes and rates
-                    target_energy = energy * self.dynamic_energy_ratio
-                    self.energy_threshold = (
-                        self.energy_threshold * damping + target_energy * (1 - damping)
-                    )
-
                 if stream:
                     # yield the current chunk of audio data wrapped in AudioData
                     yield AudioData(buffer, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
@@ -198,10 +239,224 @@ class ModdedRecognizer(Recognizer):
             # yield the last buffer of the phrase.
             yield AudioData(buffer, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
         else:
-            # obtain frame data
-            for i in range(pause_count - non_speaking_buffer_count):
-                frames.pop()  # remove extra non-speaking frames at the end
+            # remove extra non-speaking frames at the end
+            frames.drop_last_chunks(pause_count - non_speaking_buffer_count)
+            # yield the entire phrase as a single AudioData instance, without copying it
+            yield AudioData(frames.view(), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+
+class _FrameBuffer:
+    """
+    pcm of the phrase being captured, in a preallocated bytearray that grows by doubling.
+
+    chunks are appended back to back; the front is trimmed by moving a start offset
+    (the bytes are only moved once the end reaches the capacity) and the back by moving
+    the end offset, so capturing a phrase does not allocate per chunk. `view` is a
+    zero-copy slice: once it has been handed out the buffer must not be appended to
+    """
+
+    def __init__(self, chunk_bytes, initial_chunks=64):
+        self._chunk_bytes = chunk_bytes
+        self._buf = bytearray(chunk_bytes * initial_chunks)
+        self._start = 0
+        self._end = 0
+        self._n_chunks = 0
+        self._last_chunk_bytes = 0  # only the final chunk of a stream may be short
+
+    def __len__(self):
+        return self._end - self._start
+
+    def append(self, chunk):
+        n_bytes = len(chunk)
+        if self._end + n_bytes > len(self._buf):
+            self._make_room(n_bytes)
+        self._buf[self._end : self._end + n_bytes] = chunk
+        self._end += n_bytes
+        self._n_chunks += 1
+        self._last_chunk_bytes = n_bytes
+
+    def keep_last_chunks(self, n_chunks):
+        if self._n_chunks <= n_chunks:
+            return
+        if n_chunks <= 0:
+            self.clear()
+            return
+        self._start = self._end - self._last_chunk_bytes
+        self._start -= (n_chunks - 1) * self._chunk_bytes
+        self._n_chunks = n_chunks
+
+    def drop_last_chunks(self, n_chunks):
+        if n_chunks <= 0:
+            return
+        if n_chunks >= self._n_chunks:
+            self.clear()
+            return
+        self._end -= self._last_chunk_bytes + (n_chunks - 1) * self._chunk_bytes
+        self._n_chunks -= n_chunks
+        self._last_chunk_bytes = self._chunk_bytes
+
+    def clear(self):
+        self._start = 0
+        self._end = 0
+        self._n_chunks = 0
+
+    def view(self):
+        return memoryview(self._buf)[self._start : self._end]
+
+    def _make_room(self, n_bytes):
+        size = self._end - self._start
+        if self._start:
+            self._buf[:size] = self._buf[self._start : self._end]
+            self._start = 0
+            self._end = size
+        if size + n_bytes > len(self._buf):
+            self._buf.extend(bytes(max(len(self._buf), n_bytes)))
+
 
-            frame_data = b"".join(frames)
-            # yield the entire phrase as a single AudioData instance
-            yield AudioData(frame_data, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def _rms(chunk, sample_width):
+    """
+    root mean square of a chunk of signed pcm, like the removed ``audioop.rms``
+    """
+    samples = np.frombuffer(chunk, dtype=_SAMPLE_DTYPES[sample_width])
+    if not len(samples):
+        return 0
+    samples = samples.astype(np.float64)
+    return int(math.sqrt(samples.dot(samples) / len(samples)))
+
+
+def _rms_batch(chunks, sample_width):
+    """
+    the rms of every chunk in one vectorized pass, chunks must be equally long
+    """
+    samples = np.frombuffer(b"".join(chunks), dtype=_SAMPLE_DTYPES[sample_width])
+    samples = samples.reshape(len(chunks), -1).astype(np.float64)
+    return np.sqrt(np.mean(samples * samples, axis=1))
+
+
+class _BytesStream:
+    def __init__(self, data, sample_width):
+        self._data = data
+        self._pos = 0
+        self._sample_width = sample_width
+
+    def read(self, n_frames):
+        n_bytes = n_frames * self._sample_width
+        chunk = self._data[self._pos : self._pos + n_bytes]
+        self._pos += n_bytes
+        return chunk
+
+
+class _BytesSource(AudioSource):
+    def __init__(self, data, sample_rate=16_000, chunk=1_600):
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = chunk
+        self.stream = _BytesStream(data, self.SAMPLE_WIDTH)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+def _tone(secs, amplitude, sample_rate=16_000):
+    t = np.arange(int(secs * sample_rate)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16).tobytes()
+
+
+def _noise(secs, amplitude, sample_rate=16_000, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, amplitude, int(secs * sample_rate))
+    return samples.astype(np.int16).tobytes()
+
+
+def _test_noise_floor_tracks_background_between_phrases():
+    recognizer = ModdedRecognizer()
+    recognizer.pause_threshold = 0.5
+    recognizer.non_speaking_duration = 0.2
+    data = (
+        _noise(1, 100)
+        + _noise(2, 100, seed=1)
+        + _tone(1, 8_000)
+        + _noise(1, 100, seed=2)
+        # a fan turns on and stays on
+        + _noise(7, 400, seed=3)
+        + _tone(1, 8_000)
+        + _noise(1, 400, seed=4)
+    )
+    source = _BytesSource(data)
+    recognizer.calibrate(source)
+    quiet_floor = recognizer.noise_floor
+    assert 50 < quiet_floor < 200
+
+    # no calibration between phrases, the floor is tracked while listening
+    phrase = recognizer.listen_with_dispatch(source)
+    assert 1 <= len(phrase.frame_data) / 2 / 16_000 <= 1.5
+    assert recognizer.noise_floor < 2 * quiet_floor
+
+    # the fan is mistaken for speech until it has been heard for a whole window
+    recognizer.listen_with_dispatch(source)
+    assert recognizer.noise_floor > 3 * quiet_floor
+
+    phrase = recognizer.listen_with_dispatch(source)
+    assert 1 <= len(phrase.frame_data) / 2 / 16_000 <= 1.5
+
+
+def _test_silent_buffers_dont_drop_the_noise_floor():
+    recognizer = ModdedRecognizer()
+    source = _BytesSource(_noise(1, 100))
+    recognizer.calibrate(source)
+    seconds_per_buffer = source.CHUNK / source.SAMPLE_RATE
+    threshold = recognizer.energy_threshold
+
+    # the microphone drops a buffer, then the background comes back
+    for energy in (0, *[100] * 20):
+        recognizer._track_noise_floor(energy, seconds_per_buffer)
+    assert recognizer.energy_threshold > 0.8 * threshold
+
+    # nothing but digital silence still needs some sound to start a phrase
+    for _ in range(int(NOISE_FLOOR_WINDOW_SECS / seconds_per_buffer)):
+        recognizer._track_noise_floor(0, seconds_per_buffer)
+    assert recognizer.energy_threshold == MIN_ENERGY_THRESHOLD
+
+
+def _test_frame_buffer_trims_both_ends_in_place():
+    frames = _FrameBuffer(chunk_bytes=2, initial_chunks=2)
+    for chunk in (b"ab", b"cd", b"ef"):
+        frames.append(chunk)
+        frames.keep_last_chunks(2)
+    assert bytes(frames.view()) == b"cdef"
+
+    # growing past the capacity keeps the retained bytes
+    for chunk in (b"gh", b"ij", b"k"):
+        frames.append(chunk)
+    assert bytes(frames.view()) == b"cdefghijk"
+
+    # the short final chunk is dropped by its own length
+    frames.drop_last_chunks(2)
+    assert bytes(frames.view()) == b"cdefgh"
+    assert len(frames) == 6
+
+
+def _test_stream_yields_first_buffer_then_chunks():
+    recognizer = ModdedRecognizer()
+    recognizer.pause_threshold = 0.5
+    recognizer.non_speaking_duration = 0.2
+    source = _BytesSource(_noise(2, 100) + _tone(1, 8_000) + _noise(1, 100, seed=1))
+    recognizer.calibrate(source)
+
+    started = []
+    chunks = list(
+        recognizer.listen_with_dispatch(
+            source, on_phrase_start=lambda: started.append(True), stream=True
+        )
+    )
+    assert started == [True]
+    # the first chunk carries the retained lead-in, the rest are single buffers
+    assert len(chunks[0].frame_data) > 1_600 * 2
+    assert all(len(chunk.frame_data) == 1_600 * 2 for chunk in chunks[1:])
+    assert 1 <= sum(len(c.frame_data) for c in chunks) / 2 / 16_000 <= 2
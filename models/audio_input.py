@@ -0,0 +1,43 @@
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+
+SAMPLE_WIDTH = 2  # every input delivers int16 samples
+
+
+class AudioInput(ABC):
+    """
+    a source of mono int16 audio, delivered in blocks of `block_size` frames
+    """
+
+    def __init__(self, sample_rate: int, block_size: int):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+
+    @property
+    def block_bytes(self) -> int:
+        return self.block_size * SAMPLE_WIDTH
+
+    @abstractmethod
+    def open(
+        self,
+        on_block: Callable,
+        pending_blocks: Callable[[], int] | None = None,
+    ) -> AbstractContextManager:
+        """
+        starts calling `on_block` with each block (any buffer) until the context exits.
+        `pending_blocks` reports how many delivered blocks are still unconsumed,
+        inputs that are not paced by a clock use it to avoid running ahead of the consumer
+        """
+
+    def is_realtime(self) -> bool:
+        """
+        True if blocks arrive paced by a clock, so falling behind them is lag
+        """
+        return True
+
+    def is_exhausted(self) -> bool:
+        """
+        True once a finite input has delivered its last block
+        """
+        return False
@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class CacheStats:
+    """
+    how well the conversation's stable prefix was served from the prompt cache, over
+    every turn so far. `tokens_saved` are input tokens read from the cache instead of
+    being processed again
+    """
+
+    n_hits: int = 0
+    n_misses: int = 0
+    tokens_saved: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        n_turns = self.n_hits + self.n_misses
+        return self.n_hits / n_turns if n_turns else 0.0
@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class CaptureProfile:
+    """
+    trades cpu for latency in the streaming ears.
+
+    `block_secs` is how much audio is buffered before the recognizer sees it, i.e. the
+    floor on how quickly a trigger or an end of speech can be noticed.
+    `partial_interval_secs` is how often (in audio time) the recognizer is asked for a
+    partial result; asking costs a `PartialResult` call plus a json parse.
+    with `skip_unchanged_partials`, partials identical to the previous one are dropped
+    before they are parsed or handled.
+    """
+
+    block_secs: float = 0.5
+    partial_interval_secs: float = 0.5
+    skip_unchanged_partials: bool = True
+
+    def block_size(self, sample_rate: int) -> int:
+        return max(int(sample_rate * self.block_secs), 1)
+
+    def partial_interval_frames(self, sample_rate: int) -> int:
+        return int(sample_rate * self.partial_interval_secs)
+
+    @staticmethod
+    def default() -> "CaptureProfile":
+        return CaptureProfile()
+
+    @staticmethod
+    def low_latency() -> "CaptureProfile":
+        return CaptureProfile(block_secs=0.1, partial_interval_secs=0.3)
+
+    @staticmethod
+    def lowest_latency() -> "CaptureProfile":
+        return CaptureProfile(block_secs=0.05, partial_interval_secs=0.2)
@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class EndpointingConfig:
+    """
+    how long the ears wait after the last word before sending the prompt, in seconds,
+    depending on how the transcript ends.
+
+    `complete_pause_secs` follows terminal punctuation and `question_pause_secs` a
+    question form ("what time is it", at least `min_question_words` long).
+    `trailing_pause_secs` follows a trailing ellipsis or a word that can't end a
+    sentence ("and", "the", "to"), the speaker is likely still thinking.
+    anything else waits `neutral_pause_secs`, or `stable_pause_secs` if the
+    recognizer's hypothesis has stopped changing
+    """
+
+    complete_pause_secs: float = 0.6
+    question_pause_secs: float = 0.8
+    neutral_pause_secs: float = 1.2
+    stable_pause_secs: float = 0.9
+    trailing_pause_secs: float = 2.5
+    min_question_words: int = 3
+
+    @staticmethod
+    def default() -> "EndpointingConfig":
+        return EndpointingConfig()
+
+    @staticmethod
+    def fixed(pause_secs: float) -> "EndpointingConfig":
+        """
+        the same wait whatever was said
+        """
+        return EndpointingConfig(
+            complete_pause_secs=pause_secs,
+            question_pause_secs=pause_secs,
+            neutral_pause_secs=pause_secs,
+            stable_pause_secs=pause_secs,
+            trailing_pause_secs=pause_secs,
+        )
@@ -0,0 +1,20 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class FastPathStats:
+    """
+    prompts answered without the llm: `n_routed` by a local command, `n_cached` from an
+    earlier response. `latency_saved_secs` is the llm response time they didn't wait for
+    """
+
+    n_prompts: int = 0
+    n_routed: int = 0
+    n_cached: int = 0
+    latency_saved_secs: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return (
+            (self.n_routed + self.n_cached) / self.n_prompts if self.n_prompts else 0.0
+        )
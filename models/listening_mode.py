@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class ListeningMode(Enum):
+    PASSIVE = "passive"
+    ACTIVE = "active"
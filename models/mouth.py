@@ -6,3 +6,8 @@ class Mouth(AgentPeripheral, ABC):
     @abstractmethod
     def speak(self, words: str):
         pass
+
+    def stop(self):
+        """
+        cuts off whatever is being said, mouths that can't leave it to finish
+        """
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class OverloadPolicy:
+    """
+    what the streaming ears give up once decoding falls more than `max_lag_secs` of
+    audio behind a realtime input.
+
+    `drop_silence` only decodes blocks the voice activity gate finds voiced, without
+    their pre-roll or hangover.
+    `skip_ahead_when_passive` jumps to the newest audio while waiting for the trigger,
+    since nothing said before it ends up in a prompt.
+    `skip_partials` stops polling partial results until the decoder has caught up,
+    finalized results still arrive.
+
+    prompts wait for a decoder that is at most `max_lag_secs` behind to catch up,
+    beyond that they are sent with whatever has been decoded.
+    """
+
+    max_lag_secs: float = 2.0
+    drop_silence: bool = True
+    skip_ahead_when_passive: bool = True
+    skip_partials: bool = True
+
+    @staticmethod
+    def default() -> "OverloadPolicy":
+        return OverloadPolicy()
+
+    @staticmethod
+    def never_shed() -> "OverloadPolicy":
+        return OverloadPolicy(
+            drop_silence=False, skip_ahead_when_passive=False, skip_partials=False
+        )
@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class PhraseTimings:
+    """
+    where the time went for one phrase on its way through the ears' pipeline, in seconds.
+
+    `capture_secs` runs from the phrase starting to it being queued (it includes the
+    trailing pause), `queue_wait_secs` is how long it sat in the queue before a
+    transcriber took it and `reorder_wait_secs` how long its transcript was held back
+    for an earlier phrase still being transcribed. `queue_depth` is how many phrases
+    were waiting when it was queued
+    """
+
+    seq: int
+    audio_secs: float
+    capture_secs: float
+    queue_wait_secs: float
+    transcribe_secs: float
+    reorder_wait_secs: float
+    queue_depth: int
+
+    def total_secs(self) -> float:
+        return (
+            self.capture_secs
+            + self.queue_wait_secs
+            + self.transcribe_secs
+            + self.reorder_wait_secs
+        )
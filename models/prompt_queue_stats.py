@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class PromptQueueStats:
+    """
+    what became of the prompts handed to the agent. `n_coalesced` joined an identical
+    prompt already queued or being answered, `n_interrupted` answers were cut short by
+    a barge-in, `n_superseded` prompts were still waiting when one came in and
+    `n_dropped` didn't fit in the queue
+    """
+
+    n_submitted: int = 0
+    n_coalesced: int = 0
+    n_interrupted: int = 0
+    n_superseded: int = 0
+    n_dropped: int = 0
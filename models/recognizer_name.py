@@ -15,4 +15,9 @@ class RecognizerName(Enum):
 
     WHISPER_TURBO_OFFLINE = "whisper_turbo_offline"
 
+    # dynamically int8-quantized on cpu, for hosts without a gpu
+    WHISPER_BASE_EN_INT8_OFFLINE = "whisper_base_en_int8_offline"
+    WHISPER_SMALL_EN_INT8_OFFLINE = "whisper_small_en_int8_offline"
+    WHISPER_MEDIUM_EN_INT8_OFFLINE = "whisper_medium_en_int8_offline"
+
     GOOGLE = "google"
@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ResponseStats:
+    """
+    how one streamed response arrived, in seconds from when it was asked for.
+    `first_token_secs`/`first_sentence_secs` are None if it never produced one.
+
+    the input token counts are as reported by the model, `input_tokens` includes the
+    ones read from or written to the prompt cache
+    """
+
+    first_token_secs: float | None
+    first_sentence_secs: float | None
+    total_secs: float
+    n_tokens: int
+    input_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """
+        generation rate once the first token was in, time to first token excluded
+        """
+        if self.first_token_secs is None:
+            return 0.0
+        generating_secs = self.total_secs - self.first_token_secs
+        return self.n_tokens / generating_secs if generating_secs > 0 else 0.0
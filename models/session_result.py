@@ -0,0 +1,15 @@
+from dataclasses import dataclass, field
+
+from models.timed_word import TimedWord
+
+
+@dataclass(frozen=True)
+class SessionResult:
+    """
+    a partial or finalized transcript of one stream served by a `RecognizerPool`
+    """
+
+    session_id: int
+    text: str
+    is_final: bool
+    words: list[TimedWord] = field(default_factory=list)
@@ -0,0 +1,16 @@
+from enum import Enum
+
+
+class SpokenKind(Enum):
+    NONE = "none"
+    COMPLETE = "complete"
+    INCOMPLETE = "incomplete"
+
+    @staticmethod
+    def kind_from_transcription(tr: str) -> "SpokenKind":
+        if len(tr.strip()) == 0:
+            return SpokenKind.NONE
+        if tr.endswith("..."):
+            return SpokenKind.INCOMPLETE
+        is_complete = tr.endswith(".") or tr.endswith("!") or tr.endswith("?")
+        return SpokenKind.COMPLETE if is_complete else SpokenKind.INCOMPLETE
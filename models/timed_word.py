@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class TimedWord:
+    """
+    a recognized word with its position in the captured audio, in seconds
+    """
+
+    word: str
+    start: float
+    end: float
+    conf: float = 1.0
@@ -0,0 +1,38 @@
+import logging
+
+import speech_recognition as sr
+
+from models.audio_input import SAMPLE_WIDTH
+from models.recognizer_name import RecognizerName
+from recognizer_backends import get_backend, load_recognizer
+
+logger = logging.getLogger(__name__)
+
+
+class PromptRedecoder:
+    """
+    second pass of the two-pass ears: re-transcribes just the audio of a prompt with
+    a slower, more accurate recognizer (e.g. a whisper tier), after the streaming
+    recognizer has found the trigger and endpoint
+    """
+
+    def __init__(self, model_name: RecognizerName):
+        get_backend(model_name)  # fail fast on an unknown recognizer
+        self.model_name = model_name
+
+    def preload(self):
+        """
+        loads and warms the model, call from the process that will re-decode
+        """
+        load_recognizer(self.model_name)
+
+    def redecode(self, audio: bytes, sample_rate: int) -> str | None:
+        """
+        returns the transcript of `audio`, or None if nothing was understood
+        """
+        audio_data = sr.AudioData(audio, sample_rate, SAMPLE_WIDTH)
+        try:
+            text = load_recognizer(self.model_name).transcribe(audio_data)
+        except sr.UnknownValueError:
+            return None
+        return text.strip() or None
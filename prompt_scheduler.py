@@ -0,0 +1,198 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+import logging
+from typing import Any
+
+from fast_path import normalize
+from models.prompt_queue_stats import PromptQueueStats
+
+MAX_PENDING_PROMPTS = 4  # prompts waiting behind the one being answered
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _Request:
+    key: str
+    prompt: str
+    future: asyncio.Future
+
+
+class PromptScheduler:
+    """
+    answers prompts one at a time, on the event loop it is `run` on.
+
+    a prompt that normalizes to one already waiting or being answered is coalesced
+    with it, both get the same answer from a single llm request. with `barge_in`, any
+    other new prompt means the speaker talked over the agent: the answer in flight is
+    cancelled (its llm stream and speech with it) and older waiting prompts are
+    dropped, so only the latest is answered. without it prompts queue up, at most
+    `max_pending` of them, the oldest is dropped to make room.
+
+    `interrupt` does the cancelling on its own, for when the speaker starts talking
+    before there is a new prompt
+    """
+
+    def __init__(
+        self,
+        answer: Callable[[str], Awaitable[Any]],
+        max_pending: int = MAX_PENDING_PROMPTS,
+        barge_in: bool = True,
+    ):
+        self.max_pending = max_pending
+        self.barge_in = barge_in
+        self.stats = PromptQueueStats()
+        self._answer = answer
+        self._pending: deque[_Request] = deque()
+        self._current: _Request | None = None
+        self._current_task: asyncio.Task | None = None
+        self._wake = asyncio.Event()
+
+    def submit(self, prompt: str) -> asyncio.Future:
+        """
+        queues `prompt`, the future resolves to its answer or is cancelled if it never
+        gets one
+        """
+        self.stats.n_submitted += 1
+        key = " ".join(normalize(prompt))
+        for request in (self._current, *self._pending):
+            if request is not None and request.key == key:
+                self.stats.n_coalesced += 1
+                logger.debug("coalesced with the same prompt: %s", prompt)
+                return request.future
+
+        if self.barge_in:
+            self.interrupt("a new prompt came in")
+        elif len(self._pending) >= self.max_pending:
+            dropped = self._pending.popleft()
+            dropped.future.cancel()
+            self.stats.n_dropped += 1
+            logger.warning("prompt queue full, dropped: %s", dropped.prompt)
+        request = _Request(key, prompt, asyncio.get_running_loop().create_future())
+        self._pending.append(request)
+        self._wake.set()
+        return request.future
+
+    def interrupt(self, reason: str = "barge-in"):
+        """
+        cancels the answer in flight and everything waiting
+        """
+        while self._pending:
+            self._pending.popleft().future.cancel()
+            self.stats.n_superseded += 1
+        if self._current_task and not self._current_task.done():
+            logger.info(
+                "interrupted the answer to '%s', %s", self._current.prompt, reason
+            )
+            self._current_task.cancel()
+            self.stats.n_interrupted += 1
+        # the cancelled answer is not for joining anymore
+        self._current, self._current_task = None, None
+
+    async def run(self):
+        """
+        Note: this runs until it is cancelled!
+        """
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                while self._pending:
+                    await self._answer_next()
+        finally:
+            self.interrupt("shutting down")
+
+    async def _answer_next(self):
+        request = self._pending.popleft()
+        task = asyncio.get_running_loop().create_task(self._answer(request.prompt))
+        self._current, self._current_task = request, task
+        try:
+            # unlike awaiting the task, waiting does not raise when only it is cancelled
+            await asyncio.wait({task})
+        finally:
+            if self._current_task is task:
+                self._current, self._current_task = None, None
+        if request.future.done():
+            return
+        if task.cancelled():
+            request.future.cancel()
+        elif task.exception() is not None:
+            request.future.set_exception(task.exception())
+        else:
+            request.future.set_result(task.result())
+
+
+def _scheduler_with_calls(barge_in: bool, **kwargs) -> tuple[PromptScheduler, list]:
+    calls = []
+
+    async def answer(prompt: str) -> str:
+        calls.append(prompt)
+        try:
+            await asyncio.sleep(0.02)
+        except asyncio.CancelledError:
+            calls.append(f"cancelled {prompt}")
+            raise
+        return prompt.upper()
+
+    return PromptScheduler(answer, barge_in=barge_in, **kwargs), calls
+
+
+def _test_identical_prompts_are_coalesced():
+    async def run():
+        scheduler, calls = _scheduler_with_calls(barge_in=True)
+        runner = asyncio.create_task(scheduler.run())
+        first = scheduler.submit("What time is it?")
+        await asyncio.sleep(0.005)
+        second = scheduler.submit("what time is it")
+        assert await first == await second == "WHAT TIME IS IT?"
+        runner.cancel()
+        return scheduler, calls
+
+    scheduler, calls = asyncio.run(run())
+    assert calls == ["What time is it?"]
+    assert scheduler.stats.n_coalesced == 1
+    assert scheduler.stats.n_interrupted == 0
+
+
+def _test_barge_in_cancels_the_answer_in_flight():
+    async def run():
+        scheduler, calls = _scheduler_with_calls(barge_in=True)
+        runner = asyncio.create_task(scheduler.run())
+        first = scheduler.submit("tell me a story")
+        await asyncio.sleep(0.005)
+        second = scheduler.submit("stop")
+        third = scheduler.submit("actually tell me a joke")
+        assert await third == "ACTUALLY TELL ME A JOKE"
+        assert first.cancelled() and second.cancelled()
+        runner.cancel()
+        return scheduler, calls
+
+    scheduler, calls = asyncio.run(run())
+    assert calls == [
+        "tell me a story",
+        "cancelled tell me a story",
+        "actually tell me a joke",
+    ]
+    assert scheduler.stats.n_interrupted == 1
+    assert scheduler.stats.n_superseded == 1
+
+
+def _test_queue_drops_the_oldest_when_full():
+    async def run():
+        scheduler, calls = _scheduler_with_calls(barge_in=False, max_pending=1)
+        runner = asyncio.create_task(scheduler.run())
+        futures = [scheduler.submit("one")]
+        # "one" is being answered, the queue only has room for one more
+        await asyncio.sleep(0)
+        futures += [scheduler.submit("two"), scheduler.submit("three")]
+        assert await futures[2] == "THREE"
+        runner.cancel()
+        return scheduler, calls, futures
+
+    scheduler, calls, futures = asyncio.run(run())
+    assert calls == ["one", "three"]
+    assert futures[0].result() == "ONE"
+    assert futures[1].cancelled()
+    assert scheduler.stats.n_dropped == 1
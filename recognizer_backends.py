@@ -0,0 +1,234 @@
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from functools import partial
+import logging
+import time
+from typing import Any
+
+import numpy as np
+import speech_recognition as sr
+
+from models.audio_input import SAMPLE_WIDTH
+from models.recognizer_name import RecognizerName
+from models.timed_word import TimedWord
+
+WHISPER_SAMPLE_RATE = 16_000
+WARM_UP_SECS = 1.0  # length of the silent clip transcribed right after loading
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RecognizerBackend:
+    """
+    how to load a recognizer model and transcribe with it.
+
+    backends with `warm_up` transcribe a short silent clip right after loading, so
+    lazy initialization (weight paging, kernel selection, allocator growth) happens at
+    startup instead of on the first real utterance.
+
+    `transcribe_words` is for backends that can time their words, it also takes the
+    text said just before the audio as a prompt for context
+    """
+
+    load: Callable[[], Any]
+    transcribe: Callable[[Any, sr.AudioData], str]
+    warm_up: bool = True
+    transcribe_words: Callable[[Any, sr.AudioData, str], list[TimedWord]] | None = None
+
+
+class LoadedRecognizer:
+    def __init__(self, name: RecognizerName, backend: RecognizerBackend, model: Any):
+        self.name = name
+        self.is_warm = not backend.warm_up
+        self._backend = backend
+        self._model = model
+
+    def warm_up(self):
+        start = time.perf_counter()
+        self._backend.transcribe(self._model, _silence(WARM_UP_SECS))
+        self.is_warm = True
+        logger.info("warmed %s in %.2fs", self.name.value, time.perf_counter() - start)
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        return self._backend.transcribe(self._model, audio)
+
+    @property
+    def runs_on_cpu(self) -> bool:
+        """
+        False for a model on a gpu, whose runtime (cuda) can't be used in a forked process
+        """
+        device = getattr(self._model, "device", None)
+        return device is None or getattr(device, "type", device) == "cpu"
+
+    @property
+    def has_word_timings(self) -> bool:
+        return self._backend.transcribe_words is not None
+
+    def transcribe_words(
+        self, audio: sr.AudioData, prompt: str = ""
+    ) -> list[TimedWord]:
+        """
+        the words said in `audio`, timed in seconds from its start
+        """
+        if not self.has_word_timings:
+            raise TypeError(f"{self.name} does not time its words")
+        return self._backend.transcribe_words(self._model, audio, prompt)
+
+
+_BACKENDS: dict[RecognizerName, RecognizerBackend] = {}
+_loaded: dict[RecognizerName, LoadedRecognizer] = {}  # per process
+
+
+def register_backend(name: RecognizerName, backend: RecognizerBackend):
+    _BACKENDS[name] = backend
+
+
+def get_backend(name: RecognizerName) -> RecognizerBackend:
+    backend = _BACKENDS.get(name)
+    if backend is None:
+        raise TypeError(f"Unhandled model type {name}")
+    return backend
+
+
+def load_recognizer(name: RecognizerName, warm_up: bool = True) -> LoadedRecognizer:
+    """
+    returns the recognizer for `name`, loading and warming it the first time it is
+    asked for in this process.
+
+    without `warm_up` the model is only loaded, e.g. to be shared with processes forked
+    right after, since some runtimes' thread pools don't survive a fork once used
+    """
+    loaded = _loaded.get(name)
+    if loaded is None:
+        backend = get_backend(name)
+        start = time.perf_counter()
+        loaded = LoadedRecognizer(name, backend, backend.load())
+        _loaded[name] = loaded
+        logger.info("loaded %s in %.2fs", name.value, time.perf_counter() - start)
+    if warm_up and not loaded.is_warm:
+        loaded.warm_up()
+    return loaded
+
+
+def preload(names: Iterable[RecognizerName]):
+    """
+    loads and warms every recognizer in `names`, call once at startup in the process
+    that will transcribe
+    """
+    for name in names:
+        load_recognizer(name)
+
+
+def _silence(secs: float) -> sr.AudioData:
+    n_bytes = int(secs * WHISPER_SAMPLE_RATE) * SAMPLE_WIDTH
+    return sr.AudioData(bytes(n_bytes), WHISPER_SAMPLE_RATE, SAMPLE_WIDTH)
+
+
+def _load_whisper(model_name: str, int8: bool = False):
+    # heavy optional dependencies, only imported when a whisper backend is used
+    import torch  # pylint: disable=C0415
+    import whisper  # pylint: disable=C0415
+
+    if not int8:
+        return whisper.load_model(model_name)
+    model = whisper.load_model(model_name, device="cpu")
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def _whisper_samples(audio: sr.AudioData) -> np.ndarray:
+    raw = audio.get_raw_data(
+        convert_rate=WHISPER_SAMPLE_RATE, convert_width=SAMPLE_WIDTH
+    )
+    return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _transcribe_whisper(model, audio: sr.AudioData) -> str:
+    samples = _whisper_samples(audio)
+    result = model.transcribe(samples, fp16=model.device.type == "cuda")
+    return result["text"].strip()
+
+
+def _transcribe_whisper_words(
+    model, audio: sr.AudioData, prompt: str = ""
+) -> list[TimedWord]:
+    samples = _whisper_samples(audio)
+    result = model.transcribe(
+        samples,
+        fp16=model.device.type == "cuda",
+        word_timestamps=True,
+        initial_prompt=prompt or None,
+        # the audio is re-transcribed as it grows, earlier passes must not leak in
+        condition_on_previous_text=False,
+    )
+    return [
+        TimedWord(word["word"].strip(), word["start"], word["end"], word["probability"])
+        for segment in result["segments"]
+        for word in segment.get("words", [])
+        if word["word"].strip()
+    ]
+
+
+def _transcribe_google(recognizer: sr.Recognizer, audio: sr.AudioData) -> str:
+    return recognizer.recognize_google(audio)
+
+
+_WHISPER_MODELS = {
+    RecognizerName.WHISPER_BASE_OFFLINE: ("base", False),
+    RecognizerName.WHISPER_BASE_EN_OFFLINE: ("base.en", False),
+    RecognizerName.WHISPER_SMALL_OFFLINE: ("small", False),
+    RecognizerName.WHISPER_SMALL_EN_OFFLINE: ("small.en", False),
+    RecognizerName.WHISPER_MEDIUM_OFFLINE: ("medium", False),
+    RecognizerName.WHISPER_MEDIUM_EN_OFFLINE: ("medium.en", False),
+    RecognizerName.WHISPER_LARGE_OFFLINE: ("large", False),
+    RecognizerName.WHISPER_TURBO_OFFLINE: ("turbo", False),
+    RecognizerName.WHISPER_BASE_EN_INT8_OFFLINE: ("base.en", True),
+    RecognizerName.WHISPER_SMALL_EN_INT8_OFFLINE: ("small.en", True),
+    RecognizerName.WHISPER_MEDIUM_EN_INT8_OFFLINE: ("medium.en", True),
+}
+for _name, (_model_name, _int8) in _WHISPER_MODELS.items():
+    register_backend(
+        _name,
+        RecognizerBackend(
+            load=partial(_load_whisper, _model_name, _int8),
+            transcribe=_transcribe_whisper,
+            transcribe_words=_transcribe_whisper_words,
+        ),
+    )
+# an online api, nothing to warm
+register_backend(
+    RecognizerName.GOOGLE,
+    RecognizerBackend(load=sr.Recognizer, transcribe=_transcribe_google, warm_up=False),
+)
+
+
+def _test_every_recognizer_name_has_a_backend():
+    for name in RecognizerName:
+        assert get_backend(name)
+
+
+def _test_load_recognizer_loads_and_warms_once():
+    calls = []
+
+    def load():
+        calls.append("load")
+        return "model"
+
+    def transcribe(model, audio: sr.AudioData) -> str:
+        calls.append(len(audio.frame_data))
+        return "text"
+
+    name = RecognizerName.WHISPER_TURBO_OFFLINE
+    original = _BACKENDS[name]
+    register_backend(name, RecognizerBackend(load, transcribe))
+    try:
+        first = load_recognizer(name)
+        assert load_recognizer(name) is first
+        assert first.transcribe(_silence(0.5)) == "text"
+        warm_up_bytes = int(WARM_UP_SECS * WHISPER_SAMPLE_RATE) * SAMPLE_WIDTH
+        assert calls == ["load", warm_up_bytes, 16_000]
+    finally:
+        register_backend(name, original)
+        _loaded.pop(name, None)
@@ -0,0 +1,390 @@
+from collections import deque
+from collections.abc import Callable
+import itertools
+import logging
+import math
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+import os
+import queue
+import threading
+import time
+
+from vosk import Model
+
+from audio_ring_buffer import AudioRingBuffer
+from models.audio_input import SAMPLE_WIDTH
+from models.capture_profile import CaptureProfile
+from models.session_result import SessionResult
+from vosk_streamed_ears import AUDIO_RING_SECS, AUDIO_SAMPLE_RATE, Recognizer
+
+IDLE_POLL_SECS = 0.005  # how long a worker with nothing to decode sleeps
+STATS_INTERVAL_SECS = 1.0  # how often workers report block latencies
+LATENCY_HISTORY = 1024  # block latencies kept per session
+
+_OPEN = "open"
+_CLOSE = "close"
+_STOP = "stop"
+_RESULT = "result"
+_STATS = "stats"
+
+logger = logging.getLogger(__name__)
+
+
+class StreamSession:
+    """
+    one audio stream decoded by a `RecognizerPool`. the producer calls `write` with
+    each captured block; `on_result` is called (on the pool's dispatcher thread) with
+    every `SessionResult`
+    """
+
+    def __init__(
+        self,
+        session_id: int,
+        ring: AudioRingBuffer,
+        on_result: Callable[[SessionResult], None] | None,
+    ):
+        self.session_id = session_id
+        self.on_result = on_result
+        self.latencies_secs: deque[float] = deque(maxlen=LATENCY_HISTORY)
+        self.n_blocks = 0
+        self.n_overruns = 0
+        self._ring = ring
+
+    def write(self, block):
+        self._ring.write(block)
+
+
+class _WorkerSession:
+    def __init__(self, session_id: int, ring: AudioRingBuffer, recognizer: Recognizer):
+        self.session_id = session_id
+        self.ring = ring
+        self.reader = ring.reader(0, from_latest=False)
+        self.recognizer = recognizer
+        self.latencies_secs: list[float] = []
+
+    def close(self):
+        self.ring.close()
+
+
+class RecognizerPool:
+    """
+    decodes many audio streams with a single copy of a vosk model.
+
+    the model is loaded once in `start`, before the workers are forked, so its pages are
+    shared copy-on-write instead of being loaded again for every stream. each session
+    gets its own recognizer on the least busy worker (recognizer state can't migrate),
+    and workers serve their sessions round robin, one block per session per turn, so a
+    backlogged stream cannot starve the others.
+
+    per-session latency is measured from when a block was published to when the
+    recognizer was done with it.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        n_workers: int | None = None,
+        sample_rate: int = AUDIO_SAMPLE_RATE,
+        capture_profile: CaptureProfile | None = None,
+    ):
+        self.model_path = model_path
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.sample_rate = sample_rate
+        self.capture_profile = capture_profile or CaptureProfile.default()
+        self.block_size = self.capture_profile.block_size(sample_rate)
+        # the copy-on-write model sharing relies on fork
+        self._ctx = mp.get_context("fork")
+        self._controls = [self._ctx.Queue() for _ in range(self.n_workers)]
+        self._results = self._ctx.Queue()
+        self._workers: list[mp.Process] = []
+        self._dispatcher: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._sessions: dict[int, StreamSession] = {}
+        self._session_workers: dict[int, int] = {}
+        self._worker_loads = [0] * self.n_workers
+
+    def start(self):
+        model = self._load_model()
+        # workers attach to session rings by name; sharing the parent's tracker keeps
+        # each worker's own tracker from unlinking them when the worker exits
+        resource_tracker.ensure_running()
+        for control in self._controls:
+            proc = self._ctx.Process(
+                target=self._run_worker, args=(model, control), daemon=True
+            )
+            proc.start()
+            self._workers.append(proc)
+        # threads are only started once every worker has been forked
+        self._dispatcher = threading.Thread(target=self._dispatch_results, daemon=True)
+        self._dispatcher.start()
+
+    def stop(self):
+        for control in self._controls:
+            control.put((_STOP,))
+        for proc in self._workers:
+            proc.join()
+        self._results.put(None)
+        if self._dispatcher:
+            self._dispatcher.join()
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            self._release(session)
+
+    def open_session(
+        self, on_result: Callable[[SessionResult], None] | None = None
+    ) -> StreamSession:
+        block_secs = self.block_size / self.sample_rate
+        ring = AudioRingBuffer(
+            block_bytes=self.block_size * SAMPLE_WIDTH,
+            n_slots=math.ceil(AUDIO_RING_SECS / block_secs),
+            n_readers=1,
+        )
+        with self._lock:
+            session = StreamSession(next(self._ids), ring, on_result)
+            worker_idx = min(range(self.n_workers), key=self._worker_loads.__getitem__)
+            self._worker_loads[worker_idx] += 1
+            self._sessions[session.session_id] = session
+            self._session_workers[session.session_id] = worker_idx
+        self._controls[worker_idx].put((_OPEN, session.session_id, ring))
+        return session
+
+    def close_session(self, session: StreamSession):
+        with self._lock:
+            worker_idx = self._session_workers.pop(session.session_id, None)
+            if worker_idx is None:
+                return
+            self._worker_loads[worker_idx] -= 1
+        self._controls[worker_idx].put((_CLOSE, session.session_id))
+        self._release(session)
+
+    def _release(self, session: StreamSession):
+        # the worker keeps its own mapping until it handles the close
+        with self._lock:
+            self._sessions.pop(session.session_id, None)
+        session._ring.unlink()  # pylint: disable=W0212
+        session._ring.close()  # pylint: disable=W0212
+
+    def _load_model(self) -> Model:
+        return Model(self.model_path)
+
+    def _new_recognizer(self, model: Model) -> Recognizer:
+        return Recognizer(model, self.sample_rate)
+
+    def _dispatch_results(self):
+        while True:
+            msg = self._results.get()
+            if msg is None:
+                return
+            with self._lock:
+                session = self._sessions.get(msg[1])
+            if session is None:
+                continue
+            if msg[0] == _RESULT and session.on_result:
+                session.on_result(msg[2])
+            elif msg[0] == _STATS:
+                session.latencies_secs.extend(msg[2])
+                session.n_blocks += len(msg[2])
+                session.n_overruns += msg[3]
+
+    def _run_worker(self, model: Model, control: mp.Queue):
+        """
+        Note: this blocks until the pool is stopped!
+        """
+        sessions: deque[_WorkerSession] = deque()
+        last_stats = time.monotonic()
+        while True:
+            if not self._handle_control(model, control, sessions):
+                break
+
+            n_decoded = 0
+            for session in list(sessions):
+                n_decoded += self._decode_next(session)
+            # whoever went first this turn goes last next turn
+            sessions.rotate(-1)
+
+            now = time.monotonic()
+            if now - last_stats >= STATS_INTERVAL_SECS:
+                for session in sessions:
+                    self._send_stats(session)
+                last_stats = now
+            if not n_decoded:
+                time.sleep(IDLE_POLL_SECS)
+
+        for session in sessions:
+            self._send_stats(session)
+            session.close()
+
+    def _handle_control(
+        self, model: Model, control: mp.Queue, sessions: deque[_WorkerSession]
+    ) -> bool:
+        """
+        applies queued session changes, returns False once the pool is stopping.
+        a worker without sessions blocks here until it is given one
+        """
+        while True:
+            try:
+                msg = control.get(block=not sessions)
+            except queue.Empty:
+                return True
+            except FileNotFoundError:
+                # a session closed before its open got here, its ring is already gone
+                continue
+            if msg[0] == _STOP:
+                return False
+            if msg[0] == _OPEN:
+                _, session_id, ring = msg
+                sessions.append(
+                    _WorkerSession(session_id, ring, self._new_recognizer(model))
+                )
+            elif msg[0] == _CLOSE:
+                for session in sessions:
+                    if session.session_id == msg[1]:
+                        sessions.remove(session)
+                        session.close()
+                        break
+
+    def _decode_next(self, session: _WorkerSession) -> int:
+        """
+        decodes the session's next block, if one is waiting. returns how many were decoded
+        """
+        audio = session.reader.read_nowait()
+        if audio is None:
+            return 0
+        n_frames = len(audio) // SAMPLE_WIDTH
+        capture_secs = (
+            (session.reader.position - 1) * self.block_size / self.sample_rate
+        )
+        recognizer = session.recognizer
+        is_final = recognizer.AcceptWaveform(audio, capture_secs)
+        if is_final:
+            text = recognizer.get_full()
+        else:
+            text = recognizer.poll_partial(
+                n_frames,
+                self.capture_profile.partial_interval_frames(self.sample_rate),
+                self.capture_profile.skip_unchanged_partials,
+            )
+        session.latencies_secs.append(time.monotonic() - session.reader.last_write_time)
+        if text:
+            result = SessionResult(
+                session.session_id, text, is_final, list(recognizer.last_words)
+            )
+            self._results.put((_RESULT, session.session_id, result))
+        return 1
+
+    def _send_stats(self, session: _WorkerSession):
+        overruns = session.reader.overruns
+        if not session.latencies_secs and not overruns:
+            return
+        self._results.put(
+            (_STATS, session.session_id, session.latencies_secs, overruns)
+        )
+        session.latencies_secs = []
+        session.reader.overruns = 0
+
+
+class _BlockRecognizer:
+    """
+    stands in for vosk: every block is a final result, the text is the block's first
+    byte
+    """
+
+    def __init__(self, decoded: list | None = None):
+        self.last_words = []
+        self._decoded = decoded
+        self._text = ""
+
+    def AcceptWaveform(self, data, capture_secs):  # pylint: disable=C0103
+        self._text = str(data[0])
+        if self._decoded is not None:
+            self._decoded.append(self._text)
+        return True
+
+    def get_full(self) -> str:
+        return self._text
+
+
+class _TestPool(RecognizerPool):
+    def __init__(self, n_workers: int, decoded: list | None = None):
+        super().__init__("unused", n_workers=n_workers)
+        self._decoded = decoded
+
+    def _load_model(self):
+        return None
+
+    def _new_recognizer(self, model) -> _BlockRecognizer:
+        return _BlockRecognizer(self._decoded)
+
+
+def _block(pool: RecognizerPool, value: int) -> bytes:
+    return bytes([value]) * (pool.block_size * SAMPLE_WIDTH)
+
+
+def _test_sessions_are_decoded_and_results_dispatched():
+    pool = _TestPool(n_workers=2)
+    pool.start()
+    results: dict[int, list[str]] = {}
+    lock = threading.Lock()
+
+    def on_result(result: SessionResult):
+        with lock:
+            results.setdefault(result.session_id, []).append(result.text)
+
+    try:
+        sessions = [pool.open_session(on_result) for _ in range(3)]
+        # each goes to the least busy worker
+        assert pool._session_workers == {0: 0, 1: 1, 2: 0}  # pylint: disable=W0212
+        pool.close_session(sessions[1])
+        assert pool._session_workers == {0: 0, 2: 0}  # pylint: disable=W0212
+        sessions[1] = pool.open_session(on_result)
+        assert pool._session_workers[3] == 1  # pylint: disable=W0212
+
+        for i, session in enumerate(sessions):
+            for n in range(3):
+                session.write(_block(pool, 10 * i + n))
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            with lock:
+                if sum(len(texts) for texts in results.values()) == 9:
+                    break
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+
+    assert results == {
+        0: ["0", "1", "2"],
+        3: ["10", "11", "12"],
+        2: ["20", "21", "22"],
+    }
+    assert [session.n_blocks for session in sessions] == [3, 3, 3]
+    assert not pool._sessions  # pylint: disable=W0212
+
+
+def _test_worker_serves_its_sessions_round_robin():
+    decoded = []
+    pool = _TestPool(n_workers=1, decoded=decoded)
+    control = queue.Queue()
+    rings = []
+    for i in range(2):
+        ring = AudioRingBuffer(block_bytes=pool.block_size * SAMPLE_WIDTH, n_slots=8)
+        # a backlog waits in both before the worker gets to them
+        for n in range(3):
+            ring.write(_block(pool, 10 * i + n))
+        rings.append(ring)
+        control.put((_OPEN, i, ring))
+
+    worker = threading.Thread(target=pool._run_worker, args=(None, control))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while len(decoded) < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    control.put((_STOP,))
+    worker.join()
+    for ring in rings:
+        ring.unlink()
+
+    # one block per session per turn, whoever went first goes last the next turn
+    assert decoded == ["0", "10", "11", "1", "2", "12"]
@@ -0,0 +1,311 @@
+import asyncio
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+import re
+import threading
+import time
+from typing import Any
+
+from models.response_stats import ResponseStats
+
+# a period after these (or after an initial) does not end the sentence
+ABBREVIATIONS = frozenset("mr mrs ms dr st jr sr prof vs etc e.g i.e".split())
+
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+
+
+def chunk_text(chunk: Any) -> str:
+    """
+    the text of a streamed message chunk, its content is a string or a list of content
+    blocks depending on the model
+    """
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+class SentenceSplitter:
+    """
+    cuts streamed text into sentences as soon as each one is complete, a sentence only
+    counts as ended once the whitespace after it has arrived
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text: str) -> list[str]:
+        """
+        adds `text`, returns the sentences it completed
+        """
+        self._pending += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._pending):
+            if _ends_with_abbreviation(self._pending[start : match.start()]):
+                continue
+            sentence = self._pending[start : match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._pending = self._pending[start:]
+        return sentences
+
+    def flush(self) -> str | None:
+        """
+        the unfinished sentence left at the end of the text, if any
+        """
+        sentence = self._pending.strip()
+        self._pending = ""
+        return sentence or None
+
+
+def _ends_with_abbreviation(text: str) -> bool:
+    words = text.split()
+    if not words:
+        return False
+    last = words[-1].lower().rstrip(".")
+    return last in ABBREVIATIONS or (len(last) == 1 and last.isalpha())
+
+
+class _StatsRecorder:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._first_token_at: float | None = None
+        self._first_sentence_at: float | None = None
+        self._n_chunks = 0
+        self._n_output_tokens = 0
+        self._n_input_tokens = 0
+        self._n_cache_read_tokens = 0
+        self._n_cache_creation_tokens = 0
+
+    def on_chunk(self, chunk: Any) -> str:
+        """
+        records `chunk`, returns its text
+        """
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            self._n_output_tokens += usage.get("output_tokens", 0)
+            self._n_input_tokens += usage.get("input_tokens", 0)
+            details = usage.get("input_token_details") or {}
+            self._n_cache_read_tokens += details.get("cache_read") or 0
+            self._n_cache_creation_tokens += details.get("cache_creation") or 0
+        text = chunk_text(chunk)
+        if text:
+            self._n_chunks += 1
+            if self._first_token_at is None:
+                self._first_token_at = time.monotonic()
+        return text
+
+    def on_sentence(self):
+        if self._first_sentence_at is None:
+            self._first_sentence_at = time.monotonic()
+
+    def finish(self) -> ResponseStats:
+        return ResponseStats(
+            first_token_secs=self._secs(self._first_token_at),
+            first_sentence_secs=self._secs(self._first_sentence_at),
+            total_secs=time.monotonic() - self.started_at,
+            # models that don't report usage stream roughly a token per chunk
+            n_tokens=self._n_output_tokens or self._n_chunks,
+            input_tokens=self._n_input_tokens,
+            cache_read_tokens=self._n_cache_read_tokens,
+            cache_creation_tokens=self._n_cache_creation_tokens,
+        )
+
+    def _secs(self, at: float | None) -> float | None:
+        return None if at is None else at - self.started_at
+
+
+class ResponseStream:
+    """
+    one response, pulled from the model on a background thread so a slow consumer (the
+    mouth speaking one sentence while the next is generated) never holds it up.
+
+    any number of consumers can read its `tokens` or `sentences` from the start while
+    it is still arriving, they wait for what hasn't yet. `on_finish` gets the stats once
+    the whole response is in, unless the stream was closed first
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[Any],
+        on_finish: Callable[[ResponseStats], None] | None = None,
+    ):
+        self.on_finish = on_finish
+        self.stats: ResponseStats | None = None
+        self.error: Exception | None = None
+        self._chunks = chunks
+        self._recorder = _StatsRecorder()
+        self._splitter = SentenceSplitter()
+        self._tokens: list[str] = []
+        self._sentences: list[str] = []
+        self._changed = threading.Condition()
+        self._is_done = False
+        self._is_closed = False
+
+    def start(self) -> "ResponseStream":
+        threading.Thread(target=self._pull, daemon=True).start()
+        return self
+
+    def close(self):
+        """
+        stops pulling the response, consumers get what had arrived
+        """
+        self._is_closed = True
+
+    def wait_for_first_token(self) -> "ResponseStream":
+        with self._changed:
+            self._changed.wait_for(lambda: self._tokens or self._is_done)
+        return self
+
+    def tokens(self) -> Iterator[str]:
+        return self._read(self._tokens)
+
+    def sentences(self) -> Iterator[str]:
+        return self._read(self._sentences)
+
+    async def asentences(self) -> AsyncIterator[str]:
+        """
+        `sentences` for asyncio consumers, waited for off the event loop
+        """
+        sentences = self.sentences()
+        while (sentence := await asyncio.to_thread(next, sentences, None)) is not None:
+            yield sentence
+
+    def text(self) -> str:
+        """
+        the whole response, waiting for it to finish
+        """
+        return "".join(self.tokens())
+
+    def _read(self, items: list[str]) -> Iterator[str]:
+        n_read = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(items) > n_read or self._is_done)
+                batch = items[n_read:]
+            if not batch:
+                if self.error:
+                    raise self.error
+                return
+            yield from batch
+            n_read += len(batch)
+
+    def _pull(self):
+        try:
+            for chunk in self._chunks:
+                if self._is_closed:
+                    break
+                text = self._recorder.on_chunk(chunk)
+                if text:
+                    self._add(text, self._splitter.feed(text))
+            else:
+                last = self._splitter.flush()
+                if last:
+                    self._add("", [last])
+        except Exception as e:  # pylint: disable=broad-except
+            # raised to the consumers once they have read what did arrive
+            self.error = e
+        finally:
+            close = getattr(self._chunks, "close", None)
+            if close:
+                close()
+            with self._changed:
+                self.stats = self._recorder.finish()
+                self._is_done = True
+                self._changed.notify_all()
+        if self.on_finish and not self._is_closed and self.error is None:
+            self.on_finish(self.stats)
+
+    def _add(self, text: str, sentences: list[str]):
+        if sentences:
+            self._recorder.on_sentence()
+        with self._changed:
+            if text:
+                self._tokens.append(text)
+            self._sentences.extend(sentences)
+            self._changed.notify_all()
+
+
+def _test_sentences_are_cut_as_soon_as_they_end():
+    splitter = SentenceSplitter()
+    assert splitter.feed("Sure") == []
+    assert splitter.feed(". It's 3.5") == ["Sure."]
+    assert splitter.feed(" degrees, says Dr. Smith") == []
+    assert splitter.feed(' "outside!" Anything') == [
+        'It\'s 3.5 degrees, says Dr. Smith "outside!"'
+    ]
+    assert splitter.feed(" else?\n- one\n") == ["Anything else?", "- one"]
+    assert splitter.feed("two") == []
+    assert splitter.flush() == "two"
+    assert splitter.flush() is None
+
+    assert chunk_text([{"type": "text", "text": "hi"}, {"type": "tool_use"}]) == "hi"
+
+
+def _test_stream_is_read_while_it_arrives():
+    release = threading.Event()
+    finished = []
+
+    def chunks():
+        yield "Hello there. "
+        release.wait()
+        yield "How are"
+        yield " you?"
+
+    stream = ResponseStream(chunks(), on_finish=finished.append).start()
+    sentences = stream.sentences()
+    # the first sentence is out before the rest is generated
+    assert next(sentences) == "Hello there."
+    release.set()
+    assert list(sentences) == ["How are you?"]
+    assert list(stream.tokens()) == ["Hello there. ", "How are", " you?"]
+    assert stream.text() == "Hello there. How are you?"
+
+    stats = stream.stats
+    assert finished == [stats]
+    assert stats.n_tokens == 3
+    assert stats.first_token_secs <= stats.first_sentence_secs <= stats.total_secs
+
+
+def _test_failed_stream_raises_after_what_arrived():
+    def chunks():
+        yield "Partial "
+        raise ConnectionError("dropped")
+
+    stream = ResponseStream(chunks()).start()
+    tokens = stream.tokens()
+    assert next(tokens) == "Partial "
+    try:
+        next(tokens)
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("the error was swallowed")
+
+
+def _test_stream_records_token_usage():
+    class Chunk:
+        def __init__(self, content: str, output_tokens: int):
+            self.content = content
+            self.usage_metadata = {
+                "input_tokens": 10,
+                "output_tokens": output_tokens,
+                "input_token_details": {"cache_read": 8},
+            }
+
+    async def read() -> list[str]:
+        return [s async for s in stream.asentences()]
+
+    finished = []
+    chunks = (Chunk(content, 2) for content in ("One. ", "Two", "."))
+    stream = ResponseStream(chunks, on_finish=finished.append).start()
+    assert asyncio.run(read()) == ["One.", "Two."]
+    assert finished == [stream.stats]
+    assert stream.stats.n_tokens == 6
+    assert stream.stats.cache_read_tokens == 24
+    assert stream.text() == "One. Two."
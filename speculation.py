@@ -0,0 +1,168 @@
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass
+import logging
+import threading
+import time
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpeculationStats:
+    n_started: int = 0
+    n_used: int = 0
+    n_discarded: int = 0
+    hidden_secs: float = 0.0  # response time that overlapped the endpoint wait
+
+    @property
+    def hit_rate(self) -> float:
+        return self.n_used / self.n_started if self.n_started else 0.0
+
+
+class _Speculation(Generic[T]):
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.future: Future[T] = Future()
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.is_discarded = False
+
+
+class Speculator(Generic[T]):
+    """
+    answers a prompt ahead of time, while the ears are still waiting to be sure the
+    speaker has finished.
+
+    `speculate` starts `respond(prompt)` on a background thread. if the same prompt is
+    then asked for with `take`, the (possibly still running) response is used, so the
+    endpoint wait overlaps the response time. a different prompt, or `discard` when the
+    speaker carries on, throws it away. a response that is already running can't be
+    aborted, its result is ignored, or handed to `on_discard` to be cleaned up once it
+    is ready
+    """
+
+    def __init__(
+        self,
+        respond: Callable[[str], T],
+        on_discard: Callable[[T], None] | None = None,
+    ):
+        self._respond = respond
+        self._on_discard = on_discard
+        self._lock = threading.Lock()
+        self._current: _Speculation[T] | None = None
+        self.stats = SpeculationStats()
+
+    def speculate(self, prompt: str):
+        with self._lock:
+            if self._current and self._current.prompt == prompt:
+                return
+            self._discard("the prompt changed")
+            speculation = _Speculation[T](prompt)
+            self._current = speculation
+            self.stats.n_started += 1
+        logger.debug("speculatively answering: %s", prompt)
+        threading.Thread(target=self._run, args=(speculation,), daemon=True).start()
+
+    def discard(self, reason: str = "speech continued"):
+        with self._lock:
+            self._discard(reason)
+
+    def take(self, prompt: str) -> T | None:
+        """
+        the speculative response to `prompt`, waiting for it if it is still running.
+        None if nothing was speculated for exactly this prompt, or it failed
+        """
+        asked_at = time.monotonic()
+        with self._lock:
+            speculation = self._current
+            self._current = None
+            if speculation is None:
+                return None
+            if speculation.prompt != prompt:
+                self._current = speculation
+                self._discard("the prompt changed")
+                return None
+        try:
+            response = speculation.future.result()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("speculative response failed")
+            with self._lock:
+                self.stats.n_discarded += 1
+            return None
+
+        hidden_secs = min(asked_at, speculation.finished_at) - speculation.started_at
+        with self._lock:
+            self.stats.n_used += 1
+            self.stats.hidden_secs += hidden_secs
+        logger.debug("speculative response used, %.2fs of it hidden", hidden_secs)
+        return response
+
+    def _discard(self, reason: str):
+        if self._current is None:
+            return
+        self._current.is_discarded = True
+        if not self._current.future.cancel() and self._on_discard:
+            self._current.future.add_done_callback(self._clean_up)
+        self.stats.n_discarded += 1
+        logger.debug("speculative response discarded, %s", reason)
+        self._current = None
+
+    def _clean_up(self, future: Future[T]):
+        if future.exception() is None:
+            self._on_discard(future.result())
+
+    def _run(self, speculation: _Speculation[T]):
+        if not speculation.future.set_running_or_notify_cancel():
+            return
+        try:
+            response = self._respond(speculation.prompt)
+        except Exception as e:  # pylint: disable=broad-except
+            speculation.finished_at = time.monotonic()
+            speculation.future.set_exception(e)
+            return
+        speculation.finished_at = time.monotonic()
+        speculation.future.set_result(response)
+
+
+def _test_speculation_is_used_for_the_same_prompt():
+    calls = []
+
+    def respond(prompt: str) -> str:
+        calls.append(prompt)
+        time.sleep(0.05)
+        return prompt.upper()
+
+    speculator = Speculator(respond)
+    speculator.speculate("what time is it")
+    speculator.speculate("what time is it")
+    time.sleep(0.02)
+    assert speculator.take("what time is it") == "WHAT TIME IS IT"
+    assert calls == ["what time is it"]
+    assert speculator.stats.n_used == 1
+    assert 0 < speculator.stats.hidden_secs <= 0.05
+
+    # nothing left to take
+    assert speculator.take("what time is it") is None
+
+
+def _test_speculation_is_discarded_when_speech_continues():
+    cleaned_up = []
+    speculator = Speculator(lambda prompt: prompt, on_discard=cleaned_up.append)
+    speculator.speculate("turn off")
+    time.sleep(0.01)
+    speculator.speculate("turn off the lights")
+    assert speculator.stats.n_discarded == 1
+    assert cleaned_up == ["turn off"]
+
+    speculator.discard()
+    assert speculator.take("turn off the lights") is None
+
+    speculator.speculate("play jazz")
+    assert speculator.take("play some jazz") is None
+    assert speculator.stats.n_started == 3
+    assert speculator.stats.n_discarded == 3
+    assert speculator.stats.hit_rate == 0
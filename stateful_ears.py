@@ -1,59 +1,194 @@
-from enum import Enum
+from collections import deque
+from collections.abc import Callable
+import ctypes
+from dataclasses import dataclass
 import logging
-from multiprocessing import Process, Queue
+import multiprocessing as mp
+import queue
+import threading
+import time
+
 import speech_recognition as sr
 
+from chunked_transcriber import ChunkedTranscriber
+from endpoint_scheduler import EndpointScheduler
+from endpointing import Endpointer
 from modded_deps.modded_recognizer import ModdedRecognizer
 from models.ears import Ears
+from models.phrase_timings import PhraseTimings
+from models.endpointing_config import EndpointingConfig
 from models.recognizer_name import RecognizerName
+from models.spoken_kind import SpokenKind
+from recognizer_backends import LoadedRecognizer, get_backend, load_recognizer
+from streaming_transcriber import StreamingTranscriber
 
-PAUSE_THRESHOLD = 1.6
 NON_SPEAKING_DURATION = 1
+PHRASE_QUEUE_SIZE = 8  # phrases captured but not yet transcribed before dropping
+STREAM_QUEUE_SIZE = 512  # the same for chunks of audio, when streaming
+TIMINGS_HISTORY = 256  # phrase timings kept by the collector
 
 logger = logging.getLogger(__name__)
 
 
-class SpokenKind(Enum):
-    NONE = "none"
-    COMPLETE = "complete"
-    INCOMPLETE = "incomplete"
+@dataclass(frozen=True)
+class _CapturedPhrase:
+    seq: int
+    audio: sr.AudioData
+    started_at: float
+    queued_at: float
+    queue_depth: int
+
+
+@dataclass(frozen=True)
+class _Transcription:
+    seq: int
+    text: str
+    audio_secs: float
+    started_at: float
+    queued_at: float
+    queue_depth: int
+    dequeued_at: float
+    transcribed_at: float
+
 
-    @staticmethod
-    def kind_from_transcription(tr: str) -> "SpokenKind":
-        if len(tr.strip()) == 0:
-            return SpokenKind.NONE
-        if tr.endswith("..."):
-            return SpokenKind.INCOMPLETE
-        is_complete = tr.endswith(".") or tr.endswith("!") or tr.endswith("?")
-        return SpokenKind.COMPLETE if is_complete else SpokenKind.INCOMPLETE
+@dataclass(frozen=True)
+class _AudioChunk:
+    seq: int
+    frames: bytes
+    sample_rate: int
+    sample_width: int
+    started_at: float
+    queued_at: float
+    queue_depth: int
+    is_last: bool
+
+
+@dataclass(frozen=True)
+class _PartialTranscription:
+    seq: int
+    committed: str
+    tail: str
 
 
 class StatefulEars(Ears):
+    """
+    listens in three stages so the microphone is never left unread while whisper runs:
+    a capture process queues every phrase it hears on a bounded queue, `n_transcribers`
+    worker processes (each with its own copy of the model) transcribe them, and a
+    collector hands the transcripts on in the order the phrases were spoken.
+
+    when the transcribers fall `queue_size` phrases behind, new phrases are dropped
+    (and counted) rather than stalling the capture loop.
+
+    with `stream_interval_secs`, phrases are instead queued chunk by chunk while they are
+    spoken and a single transcriber keeps re-transcribing the unsettled end of the
+    phrase (see `StreamingTranscriber`), so once the speaker stops only that tail is
+    left to transcribe.
+
+    otherwise a long phrase can be split and transcribed by `chunk_workers` processes
+    at once (see `ChunkedTranscriber`), e.g. the cores left per transcriber. by default
+    every phrase is transcribed whole.
+
+    the transcripts are joined into a prompt that is sent to the agent once the
+    speaker has been quiet for as long as `endpointing` asks for the way it ends.
+    with `speculate`, a prompt that already looks finished is answered during that
+    wait (see `Agent.speculate`)
+    """
+
     def __init__(
         self,
-        model_name: str = RecognizerName.WHISPER_BASE_EN_OFFLINE,
-        pause_after_incomplete_threshold_secs=1.5,
-        pause_after_complete_threshold_secs=3,
+        model_name: RecognizerName = RecognizerName.WHISPER_BASE_EN_OFFLINE,
+        endpointing: EndpointingConfig | None = None,
+        speculate: bool = True,
+        n_transcribers=1,
+        queue_size: int | None = None,
+        stream_interval_secs: float | None = None,
+        chunk_workers: int = 1,
     ):
         super().__init__()
         self.model_name = model_name
-        self.pause_after_incomplete_threshold_secs = (
-            pause_after_incomplete_threshold_secs
-        )
-        self.pause_after_complete_threshold_secs = pause_after_complete_threshold_secs
+        self.n_transcribers = n_transcribers
+        self.chunk_workers = chunk_workers
+        self.stream_interval_secs = stream_interval_secs
+        self.speculate = speculate
+        if stream_interval_secs is not None:
+            if n_transcribers != 1:
+                raise ValueError(
+                    "streaming transcription needs exactly one transcriber"
+                )
+            if get_backend(model_name).transcribe_words is None:
+                raise ValueError(f"{model_name} can't stream, it does not time words")
+        if queue_size is None:
+            queue_size = (
+                PHRASE_QUEUE_SIZE if stream_interval_secs is None else STREAM_QUEUE_SIZE
+            )
 
+        self._endpointer = Endpointer(endpointing)
         self._recognizer = ModdedRecognizer()
+        # phrases break at the shortest pause that can end a prompt
+        config = self._endpointer.config
+        self._recognizer.pause_threshold = min(
+            config.complete_pause_secs,
+            config.question_pause_secs,
+            config.stable_pause_secs,
+            config.neutral_pause_secs,
+        )
+        self._recognizer.non_speaking_duration = min(
+            NON_SPEAKING_DURATION, self._recognizer.pause_threshold
+        )
         self._prompt = ""
-        self._is_actively_listening = False
-        self._is_talking = False
-        self._delay_id = 0
-        self._last_speak_time = None
-        self._last_audio_processed = None
-        self._audio_data_queue = Queue()
+        self._prompt_lock = threading.Lock()
+        self._last_phrase_started_at = mp.Value(ctypes.c_double)
+        self._endpoint = EndpointScheduler(self._on_endpoint, config.neutral_pause_secs)
+        self._audio_data_queue = mp.Queue(maxsize=queue_size)
+        self._transcription_queue = mp.Queue()
+        self._queue_depth = mp.Value(ctypes.c_int)
+        self._n_dropped = mp.Value(ctypes.c_int)
         self._last_spoken_kind = SpokenKind.NONE
 
-    def listen(self):
-        Process(target=self._listen_for_speech).start()
+        # capture process only
+        self._next_seq = 0
+        self._phrase_started_at = None
+        # collector process only
+        self.timings: deque[PhraseTimings] = deque(maxlen=TIMINGS_HISTORY)
+        self._prompt_started_at = 0.0  # when the last phrase handed on started
+
+        self._capture_proc: mp.Process | None = None
+
+    @property
+    def is_streaming(self) -> bool:
+        return self.stream_interval_secs is not None
+
+    def listen(self) -> mp.Process:
+        transcribe = (
+            self._transcribe_stream if self.is_streaming else self._transcribe_phrases
+        )
+        for _ in range(self.n_transcribers):
+            # not daemonic, a daemon can't start the chunk workers. they exit once
+            # `close` queues their None
+            mp.Process(target=transcribe).start()
+        self._capture_proc = mp.Process(target=self._listen_for_speech, daemon=True)
+        self._capture_proc.start()
+        proc = mp.Process(target=self._run_collector)
+        proc.start()
+        return proc
+
+    def close(self):
+        """
+        stops capturing, the transcribers and the collector exit once the phrases
+        already queued have been handed on
+        """
+        if self._capture_proc:
+            self._capture_proc.terminate()
+        for _ in range(self.n_transcribers):
+            self._audio_data_queue.put(None)
+
+    @property
+    def n_dropped(self) -> int:
+        """
+        phrases, or chunks of them when streaming, dropped because the queue was full
+        """
+        return self._n_dropped.value
 
     def _listen_for_speech(self):
         """
@@ -62,46 +197,532 @@ class StatefulEars(Ears):
         logger.debug("listening for words")
 
         with sr.Microphone() as source:
+            # TODO: allow for mic configuration, handle multi-mic setups
+            self._recognizer.calibrate(source)
             while True:
-                phrase = self._listen_for_phrase(source)
+                if self.is_streaming:
+                    self._stream_phrase(source)
+                else:
+                    self._on_phrase_end(self._listen_for_phrase(source))
 
-    def _listen_for_phrase(self, source: sr.Microphone) -> str:
+    def _listen_for_phrase(self, source: sr.Microphone) -> sr.AudioData:
         logger.debug("listening for sentence")
-        # TODO: allow for mic configuration, handle multi-mic setups
-        self._recognizer.adjust_for_ambient_noise(source)
-        audio = self._recognizer.listen_with_dispatch(
+        return self._recognizer.listen_with_dispatch(
             source, on_phrase_start=self._on_phrase_start
         )
 
-        if self.model_name == RecognizerName.WHISPER_BASE_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="base")
-        elif self.model_name == RecognizerName.WHISPER_BASE_EN_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="base.en")
-        elif self.model_name == RecognizerName.WHISPER_SMALL_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="small")
-        elif self.model_name == RecognizerName.WHISPER_SMALL_EN_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="small.en")
-        elif self.model_name == RecognizerName.WHISPER_MEDIUM_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="medium")
-        elif self.model_name == RecognizerName.WHISPER_MEDIUM_EN_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="medium.en")
-        elif self.model_name == RecognizerName.WHISPER_LARGE_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="large")
-        elif self.model_name == RecognizerName.WHISPER_TURBO_OFFLINE:
-            text = self._recognizer.recognize_whisper(audio, model="turbo")
-        elif self.model_name == RecognizerName.GOOGLE:
-            text = self._recognizer.recognize_google(audio)
-        else:
-            raise TypeError(f"Unhandled model type {self.model_name}")
-
-        logger.debug("heard: %s", text)
-        return text
-
     def _on_phrase_start(self):
         logger.debug("voice started")
+        self._phrase_started_at = time.monotonic()
+        self._last_phrase_started_at.value = self._phrase_started_at
+
+    def _stream_phrase(self, source: sr.Microphone):
+        logger.debug("streaming sentence")
+        chunks = self._recognizer.listen_with_dispatch(
+            source, on_phrase_start=self._on_phrase_start, stream=True
+        )
+        is_queued = False
+        for chunk in chunks:
+            is_queued |= self._queue_chunk(
+                chunk.frame_data, chunk.sample_rate, chunk.sample_width, is_last=False
+            )
+        is_queued |= self._queue_chunk(
+            b"", source.SAMPLE_RATE, source.SAMPLE_WIDTH, is_last=True
+        )
+        # the collector waits for every seq, one with nothing queued would never come
+        if is_queued:
+            self._next_seq += 1
+
+    def _queue_chunk(
+        self, frames, sample_rate: int, sample_width: int, is_last: bool
+    ) -> bool:
+        return self._queue_audio(
+            lambda now, started_at, depth: _AudioChunk(
+                seq=self._next_seq,
+                frames=bytes(frames),
+                sample_rate=sample_rate,
+                sample_width=sample_width,
+                started_at=started_at,
+                queued_at=now,
+                queue_depth=depth,
+                is_last=is_last,
+            ),
+            len(frames) / sample_width / sample_rate,
+        )
 
     def _on_phrase_end(self, audio_data: sr.AudioData):
-        pass
+        is_queued = self._queue_audio(
+            lambda now, started_at, depth: _CapturedPhrase(
+                seq=self._next_seq,
+                # the captured frames are a view into the recognizer's buffer, the
+                # queue needs bytes it can pickle
+                audio=sr.AudioData(
+                    bytes(audio_data.frame_data),
+                    audio_data.sample_rate,
+                    audio_data.sample_width,
+                ),
+                started_at=started_at,
+                queued_at=now,
+                queue_depth=depth,
+            ),
+            _audio_secs(audio_data),
+        )
+        if is_queued:
+            self._next_seq += 1
+
+    def _queue_audio(
+        self,
+        make_item: Callable[[float, float, int], _CapturedPhrase | _AudioChunk],
+        audio_secs: float,
+    ) -> bool:
+        now = time.monotonic()
+        started_at = self._phrase_started_at or now
+        with self._queue_depth.get_lock():
+            depth = self._queue_depth.value
+            self._queue_depth.value += 1
+        try:
+            self._audio_data_queue.put_nowait(make_item(now, started_at, depth))
+        except queue.Full:
+            with self._queue_depth.get_lock():
+                self._queue_depth.value -= 1
+            with self._n_dropped.get_lock():
+                self._n_dropped.value += 1
+            logger.warning(
+                "transcription is %d behind, dropped %.1fs of audio", depth, audio_secs
+            )
+            return False
+        return True
+
+    def _transcribe_phrases(self):
+        """
+        Note: this blocks until a None is queued!
+        """
+        transcriber = ChunkedTranscriber(self.model_name, n_workers=self.chunk_workers)
+        transcriber.start()
+        while True:
+            phrase: _CapturedPhrase | None = self._audio_data_queue.get()
+            if phrase is None:
+                transcriber.stop()
+                self._transcription_queue.put(None)
+                return
+            dequeued_at = time.monotonic()
+            with self._queue_depth.get_lock():
+                self._queue_depth.value -= 1
+
+            try:
+                text = transcriber.transcribe(phrase.audio)
+            except sr.UnknownValueError:
+                text = ""
+            except Exception:  # pylint: disable=broad-except
+                # every phrase has to be handed on, or the collector waits for it forever
+                logger.exception("failed to transcribe phrase %d", phrase.seq)
+                text = ""
+
+            self._transcription_queue.put(
+                _Transcription(
+                    seq=phrase.seq,
+                    text=text,
+                    audio_secs=_audio_secs(phrase.audio),
+                    started_at=phrase.started_at,
+                    queued_at=phrase.queued_at,
+                    queue_depth=phrase.queue_depth,
+                    dequeued_at=dequeued_at,
+                    transcribed_at=time.monotonic(),
+                )
+            )
+
+    def _transcribe_stream(self):
+        """
+        Note: this blocks until a None is queued!
+        """
+        recognizer = load_recognizer(self.model_name)
+        streamer: StreamingTranscriber | None = None
+        first_chunk: _AudioChunk | None = None
+        last_chunk: _AudioChunk | None = None
+        while True:
+            chunks = [self._audio_data_queue.get()]
+            # catch up on everything captured during the last pass before the next one
+            while chunks[-1] is not None:
+                try:
+                    chunks.append(self._audio_data_queue.get_nowait())
+                except queue.Empty:
+                    break
+            dequeued_at = time.monotonic()
+
+            for chunk in chunks:
+                if chunk is None or (streamer and chunk.seq != first_chunk.seq):
+                    # a phrase ended without its last chunk, it was dropped
+                    if streamer:
+                        self._finish_stream(
+                            streamer, first_chunk, last_chunk, dequeued_at
+                        )
+                        streamer = None
+                    if chunk is None:
+                        self._transcription_queue.put(None)
+                        return
+                with self._queue_depth.get_lock():
+                    self._queue_depth.value -= 1
+                if streamer is None:
+                    streamer = self._new_streamer(recognizer, chunk)
+                    first_chunk = chunk
+                last_chunk = chunk
+                streamer.add_audio(chunk.frames)
+                if chunk.is_last:
+                    self._finish_stream(streamer, first_chunk, chunk, dequeued_at)
+                    streamer = None
+
+            if streamer and streamer.should_update():
+                try:
+                    streamer.update()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("failed to transcribe phrase %d", first_chunk.seq)
+                    continue
+                self._transcription_queue.put(
+                    _PartialTranscription(
+                        first_chunk.seq, streamer.committed_text, streamer.tail_text
+                    )
+                )
+
+    def _new_streamer(
+        self, recognizer: LoadedRecognizer, chunk: _AudioChunk
+    ) -> StreamingTranscriber:
+        return StreamingTranscriber(
+            recognizer,
+            chunk.sample_rate,
+            chunk.sample_width,
+            interval_secs=self.stream_interval_secs,
+        )
+
+    def _finish_stream(
+        self,
+        streamer: StreamingTranscriber,
+        first_chunk: _AudioChunk,
+        last_chunk: _AudioChunk,
+        dequeued_at: float,
+    ):
+        try:
+            text = " ".join(word.word for word in streamer.finish())
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("failed to transcribe phrase %d", first_chunk.seq)
+            text = streamer.committed_text
+        logger.debug("phrase %d took %d passes", first_chunk.seq, streamer.n_passes)
+        self._transcription_queue.put(
+            _Transcription(
+                seq=first_chunk.seq,
+                text=text,
+                audio_secs=streamer.audio_secs,
+                started_at=first_chunk.started_at,
+                queued_at=last_chunk.queued_at,
+                queue_depth=last_chunk.queue_depth,
+                dequeued_at=dequeued_at,
+                transcribed_at=time.monotonic(),
+            )
+        )
+
+    def _run_collector(self):
+        """
+        Note: this blocks until every transcriber has stopped!
+        """
+        endpoint_thread = threading.Thread(target=self._endpoint.run, daemon=True)
+        endpoint_thread.start()
+        try:
+            self._collect_transcriptions()
+        finally:
+            self._endpoint.stop()
+            endpoint_thread.join()
+
+    def _collect_transcriptions(self):
+        """
+        Note: this blocks until every transcriber has stopped!
+        transcribers finish out of order, transcripts are held back until the ones
+        for the phrases spoken before them have arrived
+        """
+        pending: dict[int, _Transcription] = {}
+        next_seq = 0
+        n_running = self.n_transcribers
+        while n_running:
+            transcription: _Transcription | None = self._transcription_queue.get()
+            if transcription is None:
+                n_running -= 1
+                continue
+            if isinstance(transcription, _PartialTranscription):
+                # only a single transcriber streams, its partials arrive in order
+                self._on_partial(transcription)
+                continue
+            pending[transcription.seq] = transcription
+            while next_seq in pending:
+                transcription = pending.pop(next_seq)
+                self._on_transcription(
+                    transcription,
+                    reorder_wait_secs=time.monotonic() - transcription.transcribed_at,
+                )
+                next_seq += 1
+
+    def _on_partial(self, partial: _PartialTranscription):
+        # whether the speaker sounds done is decided by the part still settling
+        self._last_spoken_kind = SpokenKind.kind_from_transcription(
+            partial.tail or partial.committed
+        )
+        logger.debug(
+            "partial %d: %s [%s] (%s)",
+            partial.seq,
+            partial.committed,
+            partial.tail,
+            self._last_spoken_kind.value,
+        )
+        if self.speculate and self.agent:
+            self.agent.cancel_speculation()
+        with self._prompt_lock:
+            text = " ".join(
+                t for t in (self._prompt, partial.committed, partial.tail) if t
+            )
+        # still speaking, an empty tail means the last two passes agreed
+        self._endpoint.postpone(
+            self._endpointer.pause_secs(text, is_stable=not partial.tail)
+        )
+
+    def _on_transcription(
+        self, transcription: _Transcription, reorder_wait_secs: float
+    ):
+        timings = PhraseTimings(
+            seq=transcription.seq,
+            audio_secs=transcription.audio_secs,
+            capture_secs=transcription.queued_at - transcription.started_at,
+            queue_wait_secs=transcription.dequeued_at - transcription.queued_at,
+            transcribe_secs=transcription.transcribed_at - transcription.dequeued_at,
+            reorder_wait_secs=reorder_wait_secs,
+            queue_depth=transcription.queue_depth,
+        )
+        self.timings.append(timings)
+        logger.debug(
+            "phrase %d: %.1fs of audio, captured in %.2fs, queued %.2fs behind %d,"
+            " transcribed in %.2fs, held %.2fs for order",
+            timings.seq,
+            timings.audio_secs,
+            timings.capture_secs,
+            timings.queue_wait_secs,
+            timings.queue_depth,
+            timings.transcribe_secs,
+            timings.reorder_wait_secs,
+        )
+
+        text = transcription.text.strip()
+        logger.debug("heard: %s", text)
+        with self._prompt_lock:
+            if text:
+                self._prompt = f"{self._prompt} {text}".strip()
+            self._prompt_started_at = transcription.started_at
+            prompt = self._prompt
+        self._last_spoken_kind = SpokenKind.kind_from_transcription(text)
+        if not prompt:
+            return
+
+        pause_secs = self._endpointer.pause_secs(prompt)
+        # the capture already waited out the recognizer's pause before ending the phrase
+        silence_secs = (
+            time.monotonic()
+            - transcription.queued_at
+            + self._recognizer.pause_threshold
+        )
+        logger.debug(
+            "endpoint after %.2fs of silence (%.2fs so far), prompt is %s",
+            pause_secs,
+            silence_secs,
+            self._endpointer.shape(prompt).value,
+        )
+        self._endpoint.schedule(max(pause_secs - silence_secs, 0))
+        if self.speculate and self.agent and self._endpointer.looks_finished(prompt):
+            self.agent.speculate(prompt)
+
+    def _on_endpoint(self) -> bool:
+        """
+        dispatched by the endpoint scheduler once the pause after the prompt has passed
+        """
+        with self._prompt_lock:
+            if self._last_phrase_started_at.value > self._prompt_started_at:
+                # speech resumed, its transcript will schedule the endpoint again
+                logger.debug("endpoint skipped, a new phrase started")
+                if self.speculate and self.agent:
+                    self.agent.cancel_speculation()
+                return True
+            prompt, self._prompt = self._prompt, ""
+        if not prompt:
+            return True
+        if self.agent:
+            self.agent.prompt(prompt)
+        else:
+            logger.warning("no agent connected, failed to send prompt")
+        return True
+
+
+def _audio_secs(audio: sr.AudioData) -> float:
+    return len(audio.frame_data) / audio.sample_width / audio.sample_rate
+
+
+def _test_phrases_are_transcribed_and_handed_on_in_order():
+    from recognizer_backends import (  # pylint: disable=C0415
+        RecognizerBackend,
+        _loaded,
+        register_backend,
+    )
+
+    name = RecognizerName.WHISPER_BASE_EN_OFFLINE
+    original = get_backend(name)
+
+    def transcribe(model, audio: sr.AudioData) -> str:
+        return {1: "what time", 2: "is it?"}[len(audio.frame_data) // 3_200]
+
+    register_backend(name, RecognizerBackend(lambda: None, transcribe, warm_up=False))
+    try:
+        ears = StatefulEars(model_name=name)
+        ears._on_phrase_end(sr.AudioData(b"\0" * 3_200, 16_000, 2))
+        ears._on_phrase_end(sr.AudioData(memoryview(b"\0" * 6_400), 16_000, 2))
+        ears._audio_data_queue.put(None)
+        ears._transcribe_phrases()
+        ears._collect_transcriptions()
+    finally:
+        register_backend(name, original)
+        _loaded.pop(name, None)
+
+    assert ears._prompt == "what time is it?"
+    assert ears._last_spoken_kind == SpokenKind.COMPLETE
+    assert [t.seq for t in ears.timings] == [0, 1]
+    assert [t.queue_depth for t in ears.timings] == [0, 1]
+    assert ears.timings[1].audio_secs == 0.2
+    assert ears._queue_depth.value == 0
+
+
+def _test_transcripts_wait_for_earlier_phrases():
+    ears = StatefulEars(n_transcribers=2)
+    for seq, text in ((1, "second"), (2, "third"), (0, "first")):
+        ears._transcription_queue.put(
+            _Transcription(seq, text, 1.0, 0.0, 1.0, 0, 1.0, 2.0)
+        )
+    ears._transcription_queue.put(None)
+    ears._transcription_queue.put(None)
+    ears._collect_transcriptions()
+
+    assert ears._prompt == "first second third"
+    assert [t.seq for t in ears.timings] == [0, 1, 2]
+
+
+def _test_endpoint_sends_prompt_unless_speech_resumed():
+    class _Agent:
+        def __init__(self):
+            self.prompts = []
+            self.speculations = []
+            self.n_cancelled = 0
+
+        def prompt(self, prompt: str):
+            self.prompts.append(prompt)
+
+        def speculate(self, prompt: str):
+            self.speculations.append(prompt)
+
+        def cancel_speculation(self):
+            self.n_cancelled += 1
+
+    ears = StatefulEars()
+    ears.agent = _Agent()
+    ears._transcription_queue.put(
+        _Transcription(0, "what time is it?", 1.0, 5.0, 6.0, 0, 6.0, 7.0)
+    )
+    ears._transcription_queue.put(None)
+    ears._collect_transcriptions()
+    assert ears._endpoint.is_armed
+    # a question is answered while the endpoint is still waiting
+    assert ears.agent.speculations == ["what time is it?"]
+
+    ears._last_phrase_started_at.value = 8.0
+    assert ears._on_endpoint()
+    assert ears.agent.prompts == []
+    assert ears.agent.n_cancelled == 1
+
+    ears._last_phrase_started_at.value = 5.0
+    assert ears._on_endpoint()
+    assert ears.agent.prompts == ["what time is it?"]
+    assert ears._prompt == ""
+
+
+def _test_full_queue_drops_new_phrases():
+    ears = StatefulEars(queue_size=1)
+    ears._on_phrase_end(sr.AudioData(b"\0" * 3_200, 16_000, 2))
+    ears._on_phrase_end(sr.AudioData(b"\0" * 3_200, 16_000, 2))
+
+    assert ears.n_dropped == 1
+    assert ears._queue_depth.value == 1
+    assert ears._next_seq == 1
+
+
+def _test_streamed_phrase_is_transcribed_while_spoken():
+    from recognizer_backends import (  # pylint: disable=C0415
+        RecognizerBackend,
+        _loaded,
+        register_backend,
+    )
+    from models.timed_word import TimedWord  # pylint: disable=C0415
+
+    script = ["what", "time", "is", "it?"]
+    windows = []
+
+    def transcribe_words(model, audio: sr.AudioData, prompt: str) -> list[TimedWord]:
+        # one word per 0.1s of audio, the window starts after the prompt's words
+        n_said = len(prompt.split())
+        n_heard = len(audio.frame_data) // 3_200
+        windows.append(n_heard)
+        return [
+            TimedWord(word, i * 0.1, (i + 1) * 0.1)
+            for i, word in enumerate(script[n_said : n_said + n_heard])
+        ]
+
+    name = RecognizerName.WHISPER_BASE_EN_OFFLINE
+    original = get_backend(name)
+    register_backend(
+        name,
+        RecognizerBackend(
+            lambda: None, None, warm_up=False, transcribe_words=transcribe_words
+        ),
+    )
+    try:
+        ears = StatefulEars(model_name=name, stream_interval_secs=0.1)
+        transcriber = threading.Thread(target=ears._transcribe_stream)
+        transcriber.start()
+        for _ in script:
+            ears._queue_chunk(b"\0" * 3_200, 16_000, 2, is_last=False)
+            time.sleep(0.1)
+        ears._queue_chunk(b"", 16_000, 2, is_last=True)
+        ears._audio_data_queue.put(None)
+        transcriber.join()
+        ears._collect_transcriptions()
+    finally:
+        register_backend(name, original)
+        _loaded.pop(name, None)
+
+    assert ears._prompt == "what time is it?"
+    assert ears.timings[0].audio_secs == 0.4
+    # words were committed while speaking, the last pass only read the tail
+    assert len(windows) > 1
+    assert windows[-1] < len(script)
+
+
+def _test_dropped_streamed_phrase_keeps_its_seq():
+    class Recognizer:
+        def listen_with_dispatch(self, source, on_phrase_start, stream):
+            on_phrase_start()
+            yield sr.AudioData(b"\0" * 3_200, 16_000, 2)
+
+    class Source:
+        SAMPLE_RATE = 16_000
+        SAMPLE_WIDTH = 2
+
+    ears = StatefulEars(stream_interval_secs=0.1, queue_size=2)
+    ears._recognizer = Recognizer()
+    ears._stream_phrase(Source())
+    assert ears._next_seq == 1
+    # the queue is full, nothing of the next phrase gets in
+    ears._stream_phrase(Source())
+    assert ears.n_dropped == 2
+    assert ears._next_seq == 1
 
 
 if __name__ == "__main__":
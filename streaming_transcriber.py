@@ -0,0 +1,224 @@
+import logging
+import string
+
+import speech_recognition as sr
+
+from models.timed_word import TimedWord
+from recognizer_backends import LoadedRecognizer
+
+STREAM_INTERVAL_SECS = 0.5  # new audio needed before the window is transcribed again
+MAX_WINDOW_SECS = 20  # uncommitted audio whisper is trusted with (it reads 30s at most)
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingTranscriber:
+    """
+    transcribes a phrase while it is still being spoken.
+
+    the audio heard since the last committed word (the window) is transcribed again every
+    `interval_secs` of new audio. words are committed once two consecutive passes agree
+    on them, the stable prefix, and the audio up to the last committed word is trimmed
+    from the window, so each pass only re-reads the unsettled tail (with the committed
+    text as its prompt). when the phrase ends only that tail is left to transcribe.
+
+    times are in seconds from the start of the phrase
+    """
+
+    def __init__(
+        self,
+        recognizer: LoadedRecognizer,
+        sample_rate: int,
+        sample_width: int,
+        interval_secs: float = STREAM_INTERVAL_SECS,
+        max_window_secs: float = MAX_WINDOW_SECS,
+    ):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.interval_secs = interval_secs
+        self.max_window_secs = max_window_secs
+        self.committed: list[TimedWord] = []
+        # the latest pass's words past the committed ones
+        self.tail: list[TimedWord] = []
+        self.n_passes = 0
+        self._recognizer = recognizer
+        self._window = bytearray()
+        self._window_start_secs = 0.0
+        self._new_bytes = 0
+        self._n_bytes = 0
+
+    @property
+    def committed_text(self) -> str:
+        return " ".join(word.word for word in self.committed)
+
+    @property
+    def tail_text(self) -> str:
+        return " ".join(word.word for word in self.tail)
+
+    @property
+    def window_secs(self) -> float:
+        return self._secs(len(self._window))
+
+    @property
+    def audio_secs(self) -> float:
+        """
+        all the audio added so far, committed or not
+        """
+        return self._secs(self._n_bytes)
+
+    def add_audio(self, frames: bytes):
+        self._window += frames
+        self._new_bytes += len(frames)
+        self._n_bytes += len(frames)
+
+    def should_update(self) -> bool:
+        return self._secs(self._new_bytes) >= self.interval_secs
+
+    def update(self) -> list[TimedWord]:
+        """
+        transcribes the window again, returns the words that were newly committed
+        """
+        words = self._transcribe_window()
+        n_agreed = _common_prefix_len(self.tail, words)
+        if self.window_secs > self.max_window_secs:
+            # the passes keep disagreeing, settle for the latest one rather than letting
+            # the window outgrow what whisper can read
+            logger.debug("committing an unstable %.1fs window", self.window_secs)
+            n_agreed = len(words)
+        newly_committed = words[:n_agreed]
+        self.tail = words[n_agreed:]
+        self._commit(newly_committed)
+        return newly_committed
+
+    def finish(self) -> list[TimedWord]:
+        """
+        transcribes what is left of the window once the phrase has ended and commits all
+        of it, returns every word of the phrase
+        """
+        if self._window:
+            self._commit(self._transcribe_window())
+        self.tail = []
+        return self.committed
+
+    def _transcribe_window(self) -> list[TimedWord]:
+        self._new_bytes = 0
+        self.n_passes += 1
+        audio = sr.AudioData(bytes(self._window), self.sample_rate, self.sample_width)
+        words = self._recognizer.transcribe_words(audio, prompt=self.committed_text)
+        # the window starts at the end of the last committed word, whisper can still
+        # hear a sliver of it, so words centered before that point are not new
+        committed_end = self.committed[-1].end if self.committed else 0.0
+        return [
+            TimedWord(
+                word.word,
+                word.start + self._window_start_secs,
+                word.end + self._window_start_secs,
+                word.conf,
+            )
+            for word in words
+            if (word.start + word.end) / 2 + self._window_start_secs > committed_end
+        ]
+
+    def _commit(self, words: list[TimedWord]):
+        if not words:
+            return
+        self.committed.extend(words)
+        n_frames = int((words[-1].end - self._window_start_secs) * self.sample_rate)
+        n_bytes = min(max(n_frames, 0) * self.sample_width, len(self._window))
+        del self._window[:n_bytes]
+        self._window_start_secs += self._secs(n_bytes)
+
+    def _secs(self, n_bytes: int) -> float:
+        return n_bytes / self.sample_width / self.sample_rate
+
+
+def _normalize(word: str) -> str:
+    return word.lower().strip(string.punctuation)
+
+
+def _common_prefix_len(a: list[TimedWord], b: list[TimedWord]) -> int:
+    n = 0
+    for word_a, word_b in zip(a, b):
+        if _normalize(word_a.word) != _normalize(word_b.word):
+            break
+        n += 1
+    return n
+
+
+class _ScriptedRecognizer:
+    """
+    hears the words of `script` that end inside the window `streamer` passes it,
+    replacing what was said on the n-th pass with `mishear[n]`
+    """
+
+    def __init__(self, script: list[TimedWord], mishear: dict[int, str] = None):
+        self.script = script
+        self.mishear = mishear or {}
+        self.streamer: StreamingTranscriber = None
+        self._n_calls = 0
+
+    def transcribe_words(
+        self, audio: sr.AudioData, prompt: str = ""
+    ) -> list[TimedWord]:
+        self._n_calls += 1
+        start = self.streamer._window_start_secs
+        end = start + len(audio.frame_data) / audio.sample_width / audio.sample_rate
+        return [
+            TimedWord(
+                self.mishear.get(self._n_calls, w.word), w.start - start, w.end - start
+            )
+            for w in self.script
+            if start < w.end <= end + 1e-9
+        ]
+
+
+def _streamer(script, mishear=None, **kwargs) -> StreamingTranscriber:
+    recognizer = _ScriptedRecognizer(script, mishear)
+    recognizer.streamer = StreamingTranscriber(recognizer, 10, 1, **kwargs)
+    return recognizer.streamer
+
+
+def _test_commits_words_once_two_passes_agree():
+    script = [
+        TimedWord("what", 0.1, 0.4),
+        TimedWord("time", 0.5, 0.8),
+        TimedWord("is", 0.9, 1.0),
+        TimedWord("it?", 1.1, 1.4),
+    ]
+    streamer = _streamer(script, interval_secs=0.5)
+
+    streamer.add_audio(bytes(5))
+    assert streamer.should_update()
+    assert streamer.update() == []
+    assert streamer.tail_text == "what"
+
+    streamer.add_audio(bytes(5))
+    assert [w.word for w in streamer.update()] == ["what"]
+    assert streamer.tail_text == "time is"
+    # the audio up to the end of "what" is no longer re-transcribed
+    assert streamer.window_secs == 0.6
+
+    streamer.add_audio(bytes(5))
+    assert streamer.committed_text == "what"
+    streamer.update()
+    assert streamer.committed_text == "what time is"
+    assert streamer.tail_text == "it?"
+
+    assert [w.word for w in streamer.finish()] == ["what", "time", "is", "it?"]
+    assert streamer.tail == []
+
+
+def _test_disagreeing_passes_are_not_committed():
+    script = [TimedWord("hey", 0.0, 0.3), TimedWord("there", 0.4, 0.7)]
+    streamer = _streamer(script, mishear={1: "hay"})
+
+    streamer.add_audio(bytes(5))
+    streamer.update()
+    streamer.add_audio(bytes(5))
+    assert streamer.update() == []
+    assert streamer.tail_text == "hey there"
+
+    streamer = _streamer(script, mishear={1: "hay"}, max_window_secs=0.4)
+    streamer.add_audio(bytes(5))
+    # a window that never settles is committed as heard
+    assert [w.word for w in streamer.update()] == ["hay"]
@@ -0,0 +1,201 @@
+import ctypes
+import multiprocessing as mp
+
+TRANSCRIPT_CAPACITY_BYTES = 16 * 1024
+PASSIVE_HISTORY_WORDS = 64  # words kept while waiting for the trigger
+
+_NO_TRIGGER = -1
+
+
+class _TranscriptStruct(ctypes.Structure):
+    _fields_ = [
+        ("n_bytes", ctypes.c_uint32),
+        ("n_words", ctypes.c_uint32),
+        ("trigger_end", ctypes.c_int32),
+    ]
+
+
+class TranscriptStore:
+    """
+    bounded, shared-memory transcript of finalized phrases.
+
+    the byte offset just past the trigger is recorded the first time a phrase containing
+    it is appended, so building a prompt is a single copy of the text after that offset.
+    until the trigger is heard only the last `passive_history_words` words are kept, and
+    the whole transcript never outgrows `capacity` bytes (the oldest text is dropped).
+
+    mutating calls are expected to happen under the owner's lock
+    """
+
+    def __init__(
+        self,
+        trigger: str,
+        capacity: int = TRANSCRIPT_CAPACITY_BYTES,
+        passive_history_words: int = PASSIVE_HISTORY_WORDS,
+    ):
+        self.trigger = trigger
+        self.passive_history_words = passive_history_words
+        self._trigger_bytes = trigger.encode("utf-8")
+        self._struct = mp.RawValue(_TranscriptStruct)
+        self._struct.trigger_end = _NO_TRIGGER
+        self._buf = mp.RawArray(ctypes.c_char, capacity)
+
+    @property
+    def trigger_seen(self) -> bool:
+        return self._struct.trigger_end != _NO_TRIGGER
+
+    def has_words(self) -> bool:
+        return self._struct.n_bytes > 0
+
+    def append(self, words: str, prompt_start: int | None = None):
+        """
+        appends a finalized phrase, separated from the previous one by a space.
+
+        `prompt_start` is the character offset into `words` where the prompt begins,
+        as located from word timestamps. without it the prompt starts right after the
+        first occurrence of the trigger text
+        """
+        encoded = words.encode("utf-8")
+        if not encoded:
+            return
+        n_bytes = self._struct.n_bytes
+        if n_bytes:
+            encoded = b" " + encoded
+        capacity = len(self._buf)
+        if len(encoded) > capacity:
+            encoded = encoded[-capacity:]
+        overflow = n_bytes + len(encoded) - capacity
+        if overflow > 0:
+            self._drop_front(overflow)
+            n_bytes = self._struct.n_bytes
+
+        ctypes.memmove(ctypes.byref(self._buf, n_bytes), encoded, len(encoded))
+        self._struct.n_bytes = n_bytes + len(encoded)
+        self._struct.n_words += len(words.split())
+
+        if not self.trigger_seen:
+            # the trigger may have started at the end of the phrase before this one
+            lookback = min(n_bytes, len(self._trigger_bytes) - 1)
+            window_start = n_bytes - lookback
+            window = ctypes.string_at(
+                ctypes.addressof(self._buf) + window_start,
+                self._struct.n_bytes - window_start,
+            )
+            trigger_idx = window.find(self._trigger_bytes)
+            if prompt_start is not None:
+                prompt_bytes = len(words[prompt_start:].encode("utf-8"))
+                self._struct.trigger_end = self._struct.n_bytes - prompt_bytes
+            elif trigger_idx != -1:
+                self._struct.trigger_end = (
+                    window_start + trigger_idx + len(self._trigger_bytes)
+                )
+            elif self._struct.n_words > self.passive_history_words:
+                self._drop_words(self._struct.n_words - self.passive_history_words)
+
+    def text(self) -> str:
+        return self._read(0)
+
+    def prompt(self) -> str | None:
+        """
+        everything said after the trigger, or None if the trigger has not been heard
+        """
+        trigger_end = self._struct.trigger_end
+        if trigger_end == _NO_TRIGGER:
+            return None
+        return self._read(trigger_end).strip()
+
+    def clear(self):
+        self._struct.n_bytes = 0
+        self._struct.n_words = 0
+        self._struct.trigger_end = _NO_TRIGGER
+
+    def _read(self, start: int) -> str:
+        n_bytes = self._struct.n_bytes - start
+        if n_bytes <= 0:
+            return ""
+        raw = ctypes.string_at(ctypes.addressof(self._buf) + start, n_bytes)
+        return raw.decode("utf-8", errors="ignore")
+
+    def _drop_words(self, n_words: int):
+        # only runs on the small passive history, so scanning it is cheap
+        head = ctypes.string_at(ctypes.addressof(self._buf), self._struct.n_bytes)
+        cut = 0
+        for _ in range(n_words):
+            cut = head.find(b" ", cut) + 1
+            if cut == 0:
+                cut = len(head)
+                break
+        self._drop_front(cut, n_words)
+
+    def _drop_front(self, n_bytes: int, n_words: int | None = None):
+        if n_words is None:
+            dropped = ctypes.string_at(ctypes.addressof(self._buf), n_bytes)
+            n_words = len(dropped.split())
+        remaining = self._struct.n_bytes - n_bytes
+        if remaining > 0:
+            ctypes.memmove(self._buf, ctypes.byref(self._buf, n_bytes), remaining)
+        self._struct.n_bytes = max(remaining, 0)
+        self._struct.n_words = max(self._struct.n_words - n_words, 0)
+        if self.trigger_seen:
+            self._struct.trigger_end = max(self._struct.trigger_end - n_bytes, 0)
+
+
+def _test_transcript_store_prompt_after_first_trigger():
+    store = TranscriptStore("hey agent")
+    store.append("nothing to see")
+    assert store.prompt() is None
+
+    store.append("ok hey agent what time")
+    store.append("is it hey agent")
+    assert store.trigger_seen
+    assert store.prompt() == "what time is it hey agent"
+    assert store.text() == "nothing to see ok hey agent what time is it hey agent"
+
+    store.clear()
+    assert not store.has_words()
+    assert store.prompt() is None
+
+
+def _test_transcript_store_trigger_split_across_phrases():
+    store = TranscriptStore("hey agent")
+    store.append("well hey")
+    assert store.prompt() is None
+    store.append("agent what time is it")
+    assert store.trigger_seen
+    assert store.prompt() == "what time is it"
+
+
+def _test_transcript_store_explicit_prompt_start():
+    store = TranscriptStore("hey agent")
+    store.append("well")
+    # the offset comes from word timestamps, not from searching for the trigger text
+    store.append("hey agents what time", prompt_start=len("hey agents "))
+    assert store.prompt() == "what time"
+
+    store.append("hey agent again", prompt_start=0)
+    assert store.prompt() == "what time hey agent again"
+
+
+def _test_transcript_store_caps_passive_history():
+    store = TranscriptStore("hey agent", passive_history_words=3)
+    store.append("one two")
+    store.append("three four five")
+    assert store.text() == "three four five"
+
+    store.append("hey agent six")
+    store.append("seven eight")
+    # once the trigger has been heard nothing is trimmed by word count
+    assert store.text() == "three four five hey agent six seven eight"
+    assert store.prompt() == "six seven eight"
+
+
+def _test_transcript_store_capacity_keeps_trigger_offset():
+    store = TranscriptStore("hey", capacity=16, passive_history_words=100)
+    store.append("hey abc")
+    store.append("defgh")
+    assert store.prompt() == "abc defgh"
+
+    store.append("ijk")
+    # the oldest byte was dropped to make room, the trigger offset moves with it
+    assert store.text() == "ey abc defgh ijk"
+    assert store.prompt() == "abc defgh ijk"
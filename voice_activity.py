@@ -0,0 +1,175 @@
+from collections import deque
+import math
+
+import numpy as np
+
+FRAME_SECS = 0.02  # analysis frame length, short enough to catch word onsets
+SPEECH_ENERGY_RATIO = 3.0  # ~10dB over the noise floor counts as voiced
+FRICATIVE_ENERGY_RATIO = (
+    1.5  # quieter frames still count if they are noisy like "s", "f"
+)
+FRICATIVE_MIN_ZCR = 0.25  # zero crossings per sample typical of unvoiced consonants
+MIN_ENERGY = 50.0  # int16 rms below which nothing is ever considered speech
+MIN_SPEECH_FRAMES = 2  # voiced frames a block needs before it counts as speech
+NOISE_FLOOR_RISE = 0.05  # the floor climbs slowly so speech does not drag it up
+NOISE_FLOOR_FALL = 0.5  # and drops quickly when the room gets quieter
+PREROLL_SECS = 0.3
+HANGOVER_SECS = 1.0  # vosk needs trailing silence to finalize a result
+
+
+class VoiceActivityGate:
+    """
+    decides per block whether audio is worth decoding.
+
+    each block is split into short frames and every frame is scored with its rms
+    energy against an adaptive noise floor, plus its zero-crossing rate so quiet
+    fricatives still count as speech. silent blocks are held back (as zero-copy views)
+    as pre-roll; once speech starts they are released in front of it so word onsets
+    survive, and decoding continues through a hangover window after the last voiced
+    block so the recognizer can see the trailing silence it needs to endpoint.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        block_size: int,
+        preroll_secs: float = PREROLL_SECS,
+        hangover_secs: float = HANGOVER_SECS,
+    ):
+        self.frame_size = max(int(sample_rate * FRAME_SECS), 1)
+        block_secs = block_size / sample_rate
+        self._preroll = deque(maxlen=max(math.ceil(preroll_secs / block_secs), 1))
+        self._hangover_blocks = math.ceil(hangover_secs / block_secs)
+        self._blocks_since_speech = self._hangover_blocks + 1
+        self.noise_floor: float | None = None
+        self.n_skipped = 0
+        self.n_passed = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._blocks_since_speech <= self._hangover_blocks
+
+    def process(self, block, with_context: bool = True) -> list:
+        """
+        returns the blocks (possibly none) that should be decoded now, in order.
+        without `with_context` only voiced blocks are returned, pre-roll and hangover
+        are dropped (used to shed load when decoding falls behind)
+        """
+        is_voiced = self.is_voiced(block)
+        if is_voiced:
+            self._blocks_since_speech = 0
+        else:
+            self._blocks_since_speech += 1
+
+        if not with_context:
+            self._preroll.clear()
+            if not is_voiced:
+                self.n_skipped += 1
+                return []
+            self.n_passed += 1
+            return [block]
+
+        if not self.in_speech:
+            self._preroll.append(block)
+            self.n_skipped += 1
+            return []
+
+        to_decode = list(self._preroll)
+        to_decode.append(block)
+        self.n_skipped -= len(self._preroll)
+        self.n_passed += len(to_decode)
+        self._preroll.clear()
+        return to_decode
+
+    def reset(self):
+        """
+        forgets held back pre-roll, releasing any views it kept alive
+        """
+        self._preroll.clear()
+        self._blocks_since_speech = self._hangover_blocks + 1
+
+    def is_voiced(self, block) -> bool:
+        samples = np.frombuffer(block, dtype=np.int16)
+        n_frames = len(samples) // self.frame_size
+        if n_frames == 0:
+            return False
+        frames = samples[: n_frames * self.frame_size].reshape(n_frames, -1)
+        frames = frames.astype(np.float32)
+
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / self.frame_size
+
+        if self.noise_floor is None:
+            self.noise_floor = max(float(np.percentile(energy, 10)), 1.0)
+
+        loud = energy > max(self.noise_floor * SPEECH_ENERGY_RATIO, MIN_ENERGY)
+        fricative = (
+            energy > max(self.noise_floor * FRICATIVE_ENERGY_RATIO, MIN_ENERGY)
+        ) & (zcr > FRICATIVE_MIN_ZCR)
+        voiced = loud | fricative
+
+        quiet = energy[~voiced]
+        if len(quiet):
+            level = float(np.median(quiet))
+            rate = NOISE_FLOOR_RISE if level > self.noise_floor else NOISE_FLOOR_FALL
+            self.noise_floor = max(
+                self.noise_floor + (level - self.noise_floor) * rate, 1.0
+            )
+
+        return int(np.count_nonzero(voiced)) >= MIN_SPEECH_FRAMES
+
+
+def _tone(n_samples: int, amplitude: float, sample_rate: int = 16_000) -> bytes:
+    t = np.arange(n_samples) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16).tobytes()
+
+
+def _noise(n_samples: int, amplitude: float, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    return (rng.normal(0, amplitude, n_samples)).astype(np.int16).tobytes()
+
+
+def _test_voice_activity_gate_skips_silence():
+    gate = VoiceActivityGate(16_000, 1_600, preroll_secs=0.1, hangover_secs=0.2)
+    for i in range(10):
+        assert gate.process(_noise(1_600, 20, seed=i)) == []
+    assert gate.n_skipped == 10
+    assert gate.n_passed == 0
+    assert not gate.in_speech
+
+
+def _test_voice_activity_gate_preroll_and_hangover():
+    gate = VoiceActivityGate(16_000, 1_600, preroll_secs=0.2, hangover_secs=0.2)
+    silence = [_noise(1_600, 20, seed=i) for i in range(5)]
+    for block in silence:
+        gate.process(block)
+
+    speech = _tone(1_600, 5_000)
+    # the two most recent silent blocks are released ahead of the speech onset
+    assert gate.process(speech) == [silence[3], silence[4], speech]
+
+    trailing = [_noise(1_600, 20, seed=10 + i) for i in range(3)]
+    assert gate.process(trailing[0]) == [trailing[0]]
+    assert gate.process(trailing[1]) == [trailing[1]]
+    assert gate.process(trailing[2]) == []
+    assert gate.n_passed == 5
+
+
+def _test_voice_activity_gate_without_context():
+    gate = VoiceActivityGate(16_000, 1_600, preroll_secs=0.2, hangover_secs=0.2)
+    gate.process(_noise(1_600, 20))
+    speech = _tone(1_600, 5_000)
+    assert gate.process(speech, with_context=False) == [speech]
+    assert gate.process(_noise(1_600, 20, seed=1), with_context=False) == []
+    assert gate.n_passed == 1
+    assert gate.n_skipped == 2
+
+
+def _test_voice_activity_gate_noise_floor_adapts():
+    gate = VoiceActivityGate(16_000, 1_600)
+    for i in range(50):
+        gate.process(_noise(1_600, 400, seed=i))
+    # a steady fan hum is learned as background instead of staying "speech"
+    assert not gate.in_speech
+    assert gate.noise_floor > 200
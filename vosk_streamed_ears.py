@@ -1,217 +1,731 @@
-from enum import Enum
 import json
 import logging
+import math
 import multiprocessing as mp
+import threading
 import time
 
+from audio_inputs import MicrophoneInput
+from audio_ring_buffer import AudioRingBuffer, RingBufferReader
+from ears_state import SharedEarsState
+from endpoint_scheduler import EndpointScheduler
+from endpointing import Endpointer
+from models.audio_input import SAMPLE_WIDTH, AudioInput
+from models.capture_profile import CaptureProfile
 from models.ears import Ears
-
-from vosk import Model, KaldiRecognizer
-
-PAUSE_THRESHOLD_SECS = 2  # amount of time to allow pass with no additional incoming words before sending prompt
+from models.endpointing_config import EndpointingConfig
+from models.listening_mode import ListeningMode
+from models.overload_policy import OverloadPolicy
+from models.recognizer_name import RecognizerName
+from models.timed_word import TimedWord
+from voice_activity import VoiceActivityGate
+from word_timing import (
+    RecognizerClock,
+    has_phrase,
+    phrase_end_secs,
+    prompt_start_offset,
+)
+
+from vosk import Model, KaldiRecognizer, _ffi
+
+PAUSE_THRESHOLD_SECS = 2  # the flat pause used before endpointing adapted to the words
 AUDIO_SAMPLE_RATE = 16_000  # 16kHz works best with vosk
+AUDIO_RING_SECS = 32  # capture history kept in the shared ring buffer
+RECOGNIZER_READER_IDX = 0  # ring buffer cursor owned by the recognizer loop
 TRIGGER = "hey agent"
+# audio replayed into the full recognizer once the trigger is heard
+WAKE_CARRYOVER_SECS = 2
+# shortest wait before re-checking an endpoint the decoder has not caught up to
+ENDPOINT_RECHECK_SECS = 0.05
+REDECODE_TAIL_SECS = 0.3  # audio kept after the last word when re-decoding a prompt
 
 logger = logging.getLogger(__name__)
 
 
 class Recognizer(KaldiRecognizer):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.SetWords(True)
+        self.SetPartialWords(True)
+        self.clock = RecognizerClock(args[1])
+        self.last_words: list[TimedWord] = []
+        self._frames_since_partial = 0
+        self._last_partial_raw = None
+
+    def AcceptWaveform(  # pylint: disable=C0103
+        self, data, capture_secs: float | None = None
+    ):
+        """
+        accepts any buffer (e.g. a memoryview into the audio ring) without copying it.
+        `capture_secs` is when the block was captured, so word timestamps can be
+        reported on the capture clock even when blocks were skipped or replayed
+        """
+        n_frames = len(data) // SAMPLE_WIDTH
+        if capture_secs is None:
+            capture_secs = self.clock.to_capture_secs(self.clock.accepted_secs)
+        self.clock.advance(n_frames, capture_secs)
+        if not isinstance(data, bytes):
+            data = _ffi.from_buffer(data)
+        return super().AcceptWaveform(data)
+
+    def Reset(self):  # pylint: disable=C0103
+        self.clock.reset()
+        self.last_words = []
+        self._frames_since_partial = 0
+        self._last_partial_raw = None
+        return super().Reset()
+
     def get_partial(self) -> str:
         """
         wrapper for the `PartialResult` method on `KaldiRecognizer`
         extracts important information and filters out unwanted results
         """
-        partial = json.loads(self.PartialResult())["partial"]
-        return self.filter_results(partial)
+        return self._parse(self.PartialResult(), "partial")
+
+    def poll_partial(
+        self, n_frames: int, interval_frames: int, skip_unchanged: bool
+    ) -> str | None:
+        """
+        throttled `get_partial`: only asks the recognizer once `interval_frames` of
+        audio have been accepted since the last ask, and with `skip_unchanged` drops
+        a partial identical to the previous one before parsing it.
+
+        returns None when there is nothing new to handle
+        """
+        self._frames_since_partial += n_frames
+        if self._frames_since_partial < interval_frames:
+            return None
+        self._frames_since_partial = 0
+
+        raw = self.PartialResult()
+        if skip_unchanged:
+            if raw == self._last_partial_raw:
+                return None
+            self._last_partial_raw = raw
+        return self._parse(raw, "partial")
 
     def get_full(self) -> str:
         """
         wrapper for the `Result` method on `KaldiRecognizer`
         extracts important information and filters out unwanted results
         """
-        full = json.loads(self.Result())["text"]
-        return self.filter_results(full)
+        return self._parse(self.Result(), "text")
+
+    def get_final(self) -> str:
+        """
+        wrapper for the `FinalResult` method on `KaldiRecognizer`, flushes any
+        buffered audio once an input has run dry
+        """
+        return self._parse(self.FinalResult(), "text")
+
+    def _parse(self, raw: str, text_key: str) -> str:
+        """
+        returns the filtered text of a result and keeps its words, with timestamps
+        moved onto the capture clock, in `last_words`
+        """
+        result = json.loads(raw)
+        text = self.filter_results(result.get(text_key, ""))
+        words_key = "partial_result" if text_key == "partial" else "result"
+        self.last_words = []
+        if text:
+            for word in result.get(words_key, ()):
+                token = word["word"].lower()
+                if token == "[unk]":
+                    continue
+                self.last_words.append(
+                    TimedWord(
+                        token,
+                        self.clock.to_capture_secs(word["start"]),
+                        self.clock.to_capture_secs(word["end"]),
+                        word.get("conf", 1.0),
+                    )
+                )
+        return text
 
     @staticmethod
     def filter_results(result: str) -> str:
-        result = result.strip().lower()
+        result = result.replace("[unk]", "")
+        result = " ".join(result.lower().split())
         if result == "the":
             return ""
         return result
 
 
-class ListeningMode(Enum):
-    PASSIVE = "passive"
-    ACTIVE = "active"
+class VoskStreamedEars(Ears):
+    def __init__(
+        self,
+        model_path: str,
+        audio_input: AudioInput | None = None,
+        use_wake_grammar: bool = True,
+        wake_model_path: str | None = None,
+        use_vad: bool = True,
+        capture_profile: CaptureProfile | None = None,
+        overload_policy: OverloadPolicy | None = None,
+        redecode_model: RecognizerName | None = None,
+        endpointing: EndpointingConfig | None = None,
+        speculate: bool = True,
+    ):
+        """
+        while passive, `use_wake_grammar` decodes with a recognizer restricted to the
+        trigger phrase instead of the full vocabulary. large models with static graphs
+        (e.g. vosk-model-en-us-0.22) ignore grammars, so point `wake_model_path` at a
+        small model (e.g. vosk-model-small-en-us-0.15) to get the cpu savings
 
+        `use_vad` skips decoding blocks that a voice activity gate considers silence
 
-class VoskStreamedEars(Ears):
-    def __init__(self, model_path: str):
+        `capture_profile` sets the block size of the default microphone input and how
+        often partial results are pulled. an explicit `audio_input` keeps its own block size
+
+        `overload_policy` decides what is shed when decoding falls behind a realtime input
+
+        with a whisper `redecode_model` the ears run two passes: vosk still finds the
+        trigger and the endpoint, then only the audio between them is re-transcribed
+        with whisper (out of the capture ring) and sent as the prompt
+
+        `endpointing` sets how long the silence after the last word has to be before
+        the prompt is sent, depending on how the prompt ends (see `Endpointer`).
+        `EndpointingConfig.fixed(PAUSE_THRESHOLD_SECS)` waits the same after anything
+
+        with `speculate`, a final result that makes the prompt look finished starts
+        the agent's answer right away (see `Agent.speculate`), and the endpoint only
+        confirms it. not done with a `redecode_model`, whose prompt only exists then
+        """
         super().__init__()
         self.model_path = model_path
+        self.capture_profile = capture_profile or CaptureProfile.default()
+        self.audio_input = audio_input or MicrophoneInput(
+            AUDIO_SAMPLE_RATE, self.capture_profile.block_size(AUDIO_SAMPLE_RATE)
+        )
+        self._partial_interval_frames = self.capture_profile.partial_interval_frames(
+            self.audio_input.sample_rate
+        )
+        self.overload_policy = overload_policy or OverloadPolicy.default()
+        self._is_overloaded = False
+        self.use_wake_grammar = use_wake_grammar
+        self.wake_model_path = wake_model_path
+        self._wake_carryover_blocks = math.ceil(
+            WAKE_CARRYOVER_SECS
+            * self.audio_input.sample_rate
+            / self.audio_input.block_size
+        )
+        self._vad = None
+        if use_vad:
+            self._vad = VoiceActivityGate(
+                self.audio_input.sample_rate, self.audio_input.block_size
+            )
 
-        self._manager = mp.Manager()
-        self._shared_audio_q = self._manager.Queue()
-        self._shared_last_audio_time = self._manager.Value("d", None)
-        self._shared_words = self._manager.list()
-        self._shared_timer_active = self._manager.Value("b", False)
-        self._shared_listening_mode = self._manager.Value("s", ListeningMode.PASSIVE)
-        self._lock = self._manager.Lock()
+        self._block_secs = self.audio_input.block_size / self.audio_input.sample_rate
+        self._audio_ring = AudioRingBuffer(
+            block_bytes=self.audio_input.block_bytes,
+            n_slots=math.ceil(AUDIO_RING_SECS / self._block_secs),
+        )
+        self._state = SharedEarsState(TRIGGER)
+        self._lock = self._state.lock
+        self._endpointer = Endpointer(endpointing)
+        self._state.endpoint_pause_secs = self._endpointer.config.neutral_pause_secs
+        self._endpoint = EndpointScheduler(
+            self._on_endpoint, self._endpointer.config.neutral_pause_secs
+        )
+        self._last_partial = ""  # listening process only
+
+        self._redecoder = None
+        if redecode_model:
+            # whisper dependencies are only needed for the two-pass mode
+            from prompt_redecoder import (  # pylint: disable=C0415
+                PromptRedecoder,
+            )
+
+            self._redecoder = PromptRedecoder(redecode_model)
+
+        self.speculate = speculate and self._redecoder is None
+        # fires in the endpoint process, where the agent is prompted
+        self._speculation = EndpointScheduler(self._on_speculation, delay_secs=0)
 
     def listen(self) -> mp.Process:
         model = Model(self.model_path)
-        recognizer = Recognizer(model, AUDIO_SAMPLE_RATE)
+        recognizer = Recognizer(model, self.audio_input.sample_rate)
+        wake_recognizer = self._build_wake_recognizer(model)
 
-        proc = mp.Process(target=self._listen_for_speech, args=(recognizer,))
+        mp.Process(target=self._run_endpoint_scheduler, daemon=True).start()
+        proc = mp.Process(
+            target=self._listen_for_speech, args=(recognizer, wake_recognizer)
+        )
         proc.start()
         return proc
 
-    def _listen_for_speech(self, recognizer: Recognizer):
+    def close(self):
         """
-        Note: this blocks forever!
+        releases the shared capture buffer, call once no process is listening anymore
+        """
+        if self._vad:
+            self._vad.reset()
+        self._audio_ring.unlink()
+        self._audio_ring.close()
+
+    def _run_endpoint_scheduler(self):
+        """
+        Note: this blocks until the scheduler is stopped!
+        prompts are re-decoded in this process, so the second pass model is warmed here
+        """
+        if self._redecoder:
+            self._redecoder.preload()
+        threading.Thread(target=self._speculation.run, daemon=True).start()
+        self._endpoint.run()
+
+    def _build_wake_recognizer(
+        self, model: Model, recognizer_cls: type[Recognizer] = Recognizer
+    ) -> Recognizer | None:
+        if not self.use_wake_grammar:
+            return None
+        if self.wake_model_path:
+            model = Model(self.wake_model_path)
+        grammar = json.dumps([TRIGGER, "[unk]"])
+        return recognizer_cls(model, self.audio_input.sample_rate, grammar)
+
+    def _listen_for_speech(
+        self, recognizer: Recognizer, wake_recognizer: Recognizer | None = None
+    ):
+        """
+        Note: this blocks forever for live inputs!
+        finite inputs return once fully processed and any pending prompt has been sent
+
+        with a `wake_recognizer`, passive listening only decodes the trigger phrase.
+        once it is heard the cursor is rewound so the full recognizer re-decodes the
+        audio around the trigger and no words after it are lost
         """
-        blocksize = AUDIO_SAMPLE_RATE // 2
         logger.debug(
-            "listening for words: rate=%s, blocksize=%s", AUDIO_SAMPLE_RATE, blocksize
+            "listening for words: rate=%s, blocksize=%s",
+            self.audio_input.sample_rate,
+            self.audio_input.block_size,
         )
         logger.info("say '%s' to get the agent's attention", TRIGGER)
-        import sounddevice as sd
-
-        with sd.RawInputStream(
-            samplerate=AUDIO_SAMPLE_RATE,
-            blocksize=blocksize,
-            device=None,
-            dtype="int16",
-            channels=1,
-            callback=self._ingest_audio,
-        ):
+
+        reader = self._audio_ring.reader(RECOGNIZER_READER_IDX)
+        last_mode = self._state.listening_mode
+        with self.audio_input.open(self._ingest_audio, pending_blocks=reader.pending):
             while True:
-                audio_bytes = self._shared_audio_q.get()
-                self._process_audio(audio_bytes, recognizer)
+                audio = reader.read(timeout=0.1)
+                if audio is None:
+                    if self.audio_input.is_exhausted() and not reader.pending():
+                        break
+                    continue
+
+                is_overloaded = self._track_lag(reader, recognizer, wake_recognizer)
+                if self._vad:
+                    drop_silence = is_overloaded and self.overload_policy.drop_silence
+                    blocks = self._vad.process(audio, with_context=not drop_silence)
+                else:
+                    blocks = (audio,)
+                # released blocks are contiguous and end with the one just read
+                first_seq = reader.position - len(blocks)
+                rewound = False
+                for i, block in enumerate(blocks):
+                    capture_secs = (first_seq + i) * self._block_secs
+                    self._state.processed_audio_secs = capture_secs + self._block_secs
+                    if wake_recognizer is not None:
+                        mode = self._state.listening_mode
+                        if mode != last_mode and mode == ListeningMode.PASSIVE:
+                            wake_recognizer.Reset()
+                        last_mode = mode
+                        if mode == ListeningMode.PASSIVE:
+                            if self._process_wake_audio(
+                                block, wake_recognizer, capture_secs
+                            ):
+                                last_mode = ListeningMode.ACTIVE
+                                recognizer.Reset()
+                                reader.rewind(self._wake_carryover_blocks)
+                                rewound = True
+                                break
+                            continue
+
+                    self._process_audio(block, recognizer, capture_secs)
+                if not rewound:
+                    # blocks held back by the vad are silence the decoder can skip
+                    self._state.processed_audio_secs = (
+                        reader.position * self._block_secs
+                    )
+                if reader.overruns:
+                    logger.warning(
+                        "recognizer dropped %s audio blocks", reader.overruns
+                    )
+                    self._state.shed_blocks(reader.overruns)
+                    reader.overruns = 0
+
+        final = recognizer.get_final()
+        if final:
+            self._handle_words(final, recognizer.last_words)
+        self._endpoint.wait_idle()
+
+    def _track_lag(
+        self,
+        reader: RingBufferReader,
+        recognizer: Recognizer,
+        wake_recognizer: Recognizer | None,
+    ) -> bool:
+        """
+        publishes how far decoding is behind capture and returns True while that is
+        more than the overload policy tolerates. when passive, the policy may skip
+        straight to the newest audio
+        """
+        lag_secs = reader.pending() * self._block_secs
+        self._state.lag_secs = lag_secs
+        policy = self.overload_policy
+        is_overloaded = (
+            self.audio_input.is_realtime() and lag_secs > policy.max_lag_secs
+        )
 
-    def _ingest_audio(self, audio_data, _, __, status):
-        if status:
-            raise ValueError(
-                f"audio data with non-zero status error ({status}) inbound"
-            )
-        self._shared_audio_q.put(bytes(audio_data))
+        is_passive = self._state.listening_mode == ListeningMode.PASSIVE
+        if is_overloaded and is_passive and policy.skip_ahead_when_passive:
+            skipped = reader.skip_to_latest()
+            self._state.shed_blocks(skipped)
+            logger.debug("%.2fs behind, skipped %s passive blocks", lag_secs, skipped)
+            if self._vad:
+                self._vad.reset()
+            (wake_recognizer or recognizer).Reset()
+            self._state.lag_secs = 0.0
+            is_overloaded = False
+
+        if is_overloaded != self._is_overloaded:
+            self._is_overloaded = is_overloaded
+            if is_overloaded:
+                logger.warning("recognizer is %.2fs behind, shedding load", lag_secs)
+            else:
+                logger.info("recognizer caught up")
+        return is_overloaded
+
+    def _ingest_audio(self, audio_data):
+        self._audio_ring.write(audio_data)
 
-    def _process_audio(self, audio_bytes: bytes, recognizer: Recognizer):
-        is_final = recognizer.AcceptWaveform(audio_bytes)
+    def _process_audio(
+        self, audio: memoryview, recognizer: Recognizer, capture_secs: float
+    ):
+        is_final = recognizer.AcceptWaveform(audio, capture_secs)
         if is_final:
             full = recognizer.get_full()
-            self._handle_words(full)
+            self._handle_words(full, recognizer.last_words)
         else:
-            partial = recognizer.get_partial()
+            partial = self._poll_partial(audio, recognizer)
             if partial:
-                self._handle_partial(partial)
+                self._handle_partial(partial, recognizer.last_words)
+
+    def _poll_partial(self, audio: memoryview, recognizer: Recognizer) -> str | None:
+        if self._is_overloaded and self.overload_policy.skip_partials:
+            return None
+        return recognizer.poll_partial(
+            len(audio) // SAMPLE_WIDTH,
+            self._partial_interval_frames,
+            self.capture_profile.skip_unchanged_partials,
+        )
+
+    def _process_wake_audio(
+        self, audio: memoryview, wake_recognizer: Recognizer, capture_secs: float
+    ) -> bool:
+        """
+        returns True once the trigger has been heard and listening turned active
+        """
+        is_final = wake_recognizer.AcceptWaveform(audio, capture_secs)
+        if is_final:
+            words = wake_recognizer.get_full()
+        else:
+            words = self._poll_partial(audio, wake_recognizer)
+        if not words or not has_phrase(words, TRIGGER):
+            return False
 
-    def _try_start_prompter_clock(self):
+        logger.debug("wake word heard: %s", words)
         with self._lock:
-            if self._shared_timer_active.value:
-                return
-            self._shared_timer_active.value = True
-        logger.debug("starting clock")
-        mp.Process(target=self._prompter_clock).start()
-
-    def _prompter_clock(self):
-        while True:
-            logger.debug("running prompt clock")
-            to_send_prompt = False
-            with self._lock:
-                now = time.time()
-                dt_secs = now - self._shared_last_audio_time.value
-                logger.debug("seconds since last word spoken: %s", dt_secs)
-                if dt_secs >= PAUSE_THRESHOLD_SECS and len(self._shared_words):
-                    to_send_prompt = True
-
-            if to_send_prompt:
-                prompt_sent = self._init_prompt()
-
-                if prompt_sent:
-                    logger.debug("prompt sent, killing clock")
-                    with self._lock:
-                        self._shared_timer_active.value = False
-                        return
-                else:
-                    logger.debug("prompt couldn't be sent, keeping clock alive")
+            self._state.listening_mode = ListeningMode.ACTIVE
+        self._on_trigger()
+        return True
+
+    def _on_endpoint(self) -> bool:
+        """
+        dispatched by the endpoint scheduler once no words have arrived for the pause
+        the endpointer picked. returns False if the prompt should be retried
+
+        the pause is confirmed against audio timestamps: if decoding is lagging behind
+        capture, the recognizer may not have seen the words that end the pause yet, so
+        the endpoint is re-armed until that much silence has actually been decoded
+        """
+        if not self._state.has_words():
+            return True
+        pause_secs = self._state.endpoint_pause_secs
+        silence_secs = self._state.decoded_silence_secs()
+        lag_secs = self._audio_ring.pending(RECOGNIZER_READER_IDX) * self._block_secs
+        is_drained = self.audio_input.is_exhausted() and not lag_secs
+        if silence_secs < pause_secs and not is_drained:
+            logger.debug(
+                "endpoint deferred: %.2fs of silence decoded, decoder %.2fs behind capture",
+                silence_secs,
+                lag_secs,
+            )
+            self._endpoint.schedule(
+                max(pause_secs - silence_secs, ENDPOINT_RECHECK_SECS)
+            )
+            return False
 
-            wait_secs = max(PAUSE_THRESHOLD_SECS - dt_secs, 1)
-            time.sleep(wait_secs)
+        if lag_secs and lag_secs <= self.overload_policy.max_lag_secs:
+            logger.debug("endpoint deferred: decoder %.2fs behind capture", lag_secs)
+            self._endpoint.schedule(max(lag_secs, ENDPOINT_RECHECK_SECS))
+            return False
 
-    def _handle_partial(self, words: str):
+        logger.debug(
+            "endpoint: %.2fs of silence decoded, decoder %.2fs behind capture, "
+            "%.2fs since the last word was handled",
+            silence_secs,
+            lag_secs,
+            time.time() - self._state.last_audio_time,
+        )
+        prompt_sent = self._init_prompt()
+        if not prompt_sent:
+            if self.audio_input.is_exhausted():
+                logger.debug("input exhausted, dropping unfinished prompt")
+                return True
+            logger.debug("prompt couldn't be sent, retrying")
+        return prompt_sent
+
+    def _handle_partial(self, words: str, timed_words: list[TimedWord] = ()):
         """
         handles words that have not yet been finalized by the transcriber
         """
         logger.info("partial: %s", words)
-        with self._lock:
-            self._shared_last_audio_time.value = time.time()
-            is_passive = self._shared_listening_mode.value == ListeningMode.PASSIVE
-            if is_passive and TRIGGER in words:
-                self._shared_listening_mode.value = ListeningMode.ACTIVE
-                logger.info("actively listening...")
+        # single writer, plain stores into shared memory; no lock needed
+        self._state.last_audio_time = time.time()
+        self._mark_word_end(timed_words)
+        self._last_partial = words
+        self._endpoint.postpone(self._state.endpoint_pause_secs)
+        # more words are coming, a speculation about to start would be outdated. one
+        # already running is discarded once the prompt turns out different
+        self._speculation.cancel()
+        is_passive = self._state.listening_mode == ListeningMode.PASSIVE
+        if is_passive and has_phrase(words, TRIGGER):
+            with self._lock:
+                self._state.listening_mode = ListeningMode.ACTIVE
+            self._on_trigger()
 
-    def _handle_words(self, words: str):
+    def _handle_words(self, words: str, timed_words: list[TimedWord] = ()):
         """
-        handles words that have been finalized by the transcriber
+        handles words that have been finalized by the transcriber.
+        with `timed_words` the prompt is cut at the first word starting after the
+        trigger ended, rather than wherever the trigger text happens to appear
         """
         logger.info("heard: %s", words)
+        prompt_start = None
+        if timed_words and " ".join(w.word for w in timed_words) == words:
+            prompt_start = prompt_start_offset(timed_words, TRIGGER)
 
         with self._lock:
-            self._shared_words.append(words)
-            self._shared_last_audio_time.value = time.time()
-            is_active = self._shared_listening_mode.value == ListeningMode.ACTIVE
-            if (not is_active) and TRIGGER in words:
-                self._shared_listening_mode.value = ListeningMode.ACTIVE
-                logger.info("actively listening...")
+            trigger_seen = self._state.transcript.trigger_seen
+            self._state.transcript.append(words, prompt_start)
+            if prompt_start is not None and not trigger_seen:
+                self._state.trigger_end_secs = phrase_end_secs(timed_words, TRIGGER)
+            self._state.last_audio_time = time.time()
+            self._mark_word_end(timed_words)
+            is_active = self._state.listening_mode == ListeningMode.ACTIVE
+            # the transcript also finds a trigger split across two finals
+            heard_trigger = (
+                prompt_start is not None
+                or has_phrase(words, TRIGGER)
+                or (self._state.transcript.trigger_seen and not trigger_seen)
+            )
+            if (not is_active) and heard_trigger:
+                self._state.listening_mode = ListeningMode.ACTIVE
+                self._on_trigger()
                 is_active = True
+            if is_active:
+                prompt = self._state.transcript.prompt() or ""
+                pause_secs = self._endpoint_pause_secs(
+                    prompt, is_stable=words == self._last_partial
+                )
+                self._state.endpoint_pause_secs = pause_secs
+        self._last_partial = ""
         if is_active:
-            self._try_start_prompter_clock()
+            self._endpoint.schedule(pause_secs)
+            if self.speculate and self._endpointer.looks_finished(prompt):
+                self._speculation.schedule(0)
+
+    def _on_trigger(self):
+        logger.info("actively listening...")
+        # the speaker is addressing the agent again, whatever it is still saying is moot
+        if self.agent:
+            self.agent.interrupt()
+
+    def _endpoint_pause_secs(self, prompt: str, is_stable: bool) -> float:
+        pause_secs = self._endpointer.pause_secs(prompt, is_stable)
+        logger.debug(
+            "endpoint after %.2fs of silence, prompt is %s%s",
+            pause_secs,
+            self._endpointer.shape(prompt).value,
+            " and stable" if is_stable else "",
+        )
+        return pause_secs
+
+    def _on_speculation(self) -> bool:
+        """
+        dispatched by the speculation scheduler in the endpoint process, right after a
+        final result that looks like the end of the prompt
+        """
+        with self._lock:
+            prompt = self._state.transcript.prompt()
+        if prompt and self.agent:
+            self.agent.speculate(prompt)
+        return True
+
+    def _mark_word_end(self, timed_words: list[TimedWord]):
+        """
+        records when the latest word ended on the capture clock. results without
+        timestamps count as ending with the block being decoded
+        """
+        if timed_words:
+            word_end = timed_words[-1].end
+        else:
+            word_end = self._state.processed_audio_secs
+        self._state.last_word_end_secs = max(self._state.last_word_end_secs, word_end)
 
     def _build_prompt(self) -> str:
         """
-        iterates through recorded words in reverse order until full prompt is built, excludes trigger words
+        returns the words heard since the trigger, excluding the trigger itself
         """
         with self._lock:
-            words = " ".join(self._shared_words)
-        trigger_match_idx = words.rfind(TRIGGER)
-        if trigger_match_idx == -1:
+            prompt = self._state.transcript.prompt()
+        if prompt is None:
             raise ValueError("Trigger was never spoken, cannot built prompt")
-        return words[trigger_match_idx + len(TRIGGER) :]
+        return prompt
+
+    def _prompt_audio(self) -> bytes | None:
+        """
+        the captured audio from the end of the trigger to just after the last word,
+        None if the trigger's timing is unknown or the audio has left the ring
+        """
+        start_secs = self._state.trigger_end_secs
+        if start_secs is None:
+            return None
+        end_secs = min(
+            self._state.last_word_end_secs + REDECODE_TAIL_SECS,
+            self._state.processed_audio_secs,
+        )
+        if end_secs <= start_secs:
+            return None
+        first_seq = int(start_secs / self._block_secs)
+        end_seq = math.ceil(end_secs / self._block_secs)
+        audio = self._audio_ring.copy_blocks(first_seq, end_seq)
+        if audio is None:
+            return None
+        rate = self.audio_input.sample_rate
+        skip = int((start_secs - first_seq * self._block_secs) * rate) * SAMPLE_WIDTH
+        n_bytes = int((end_secs - start_secs) * rate) * SAMPLE_WIDTH
+        return audio[skip : skip + n_bytes]
+
+    def _redecode_prompt(self, prompt: str) -> str:
+        """
+        second pass over the prompt's audio, falls back to the streamed `prompt`
+        """
+        audio = self._prompt_audio()
+        if audio is None:
+            logger.debug("prompt audio unavailable, keeping the streamed transcript")
+            return prompt
+        start = time.perf_counter()
+        try:
+            text = self._redecoder.redecode(audio, self.audio_input.sample_rate)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("re-decoding the prompt failed")
+            return prompt
+        logger.debug(
+            "re-decoded %.2fs of prompt audio in %.2fs: %s",
+            len(audio) / SAMPLE_WIDTH / self.audio_input.sample_rate,
+            time.perf_counter() - start,
+            text,
+        )
+        return text or prompt
 
     def _init_prompt(self) -> bool:
         """
-        assumes that audio_q has been fully processed.
-        it should, unless transcription of a single block took longer than the required
-        pause before sending prompt.
-        if not, though, this function will raise a ValueError.
+        sends what has been decoded so far, `_on_endpoint` decides whether the decoder
+        is close enough to caught up for that to be the whole prompt.
 
-        returns True if prompt could be built, otherwise returns False
+        returns True if prompt could be built or there is none coming, otherwise
+        returns False
         """
         try:
             prompt = self._build_prompt()
-        except Exception:
-            pass
+        except ValueError:
+            self._drop_false_wake()
+            return True
         if not prompt:
             return False
 
         logger.debug("built prompt: %s", prompt)
+        streamed_prompt = prompt
+        if self._redecoder:
+            prompt = self._redecode_prompt(prompt)
         with self._lock:
-            if not self._shared_audio_q.empty():
-                raise ValueError(
-                    "tried sending prompt when audio queue is still populated"
-                )
-
+            if self._state.transcript.prompt() != streamed_prompt:
+                logger.debug("speech resumed while the prompt was being built")
+                return False
             if self.agent:
                 self.agent.prompt(prompt)
             else:
                 logger.warning("no agent connected, failed to send prompt")
 
-            self._shared_words[:] = []
-            self._shared_listening_mode.value = ListeningMode.PASSIVE
+            self._state.transcript.clear()
+            self._state.trigger_end_secs = None
+            self._state.listening_mode = ListeningMode.PASSIVE
             logger.info("passively listening...")
             return True
 
+    def _drop_false_wake(self):
+        """
+        the wake recognizer can fire on audio in which the full recognizer then doesn't
+        hear the trigger. there is no prompt to wait for, back to passive listening
+        """
+        with self._lock:
+            if self._state.transcript.prompt() is not None:
+                return  # the trigger was heard after all, the next endpoint sends it
+            logger.info(
+                "false wake, the trigger wasn't confirmed: %s",
+                self._state.transcript.text(),
+            )
+            self._state.transcript.clear()
+            self._state.trigger_end_secs = None
+            self._state.listening_mode = ListeningMode.PASSIVE
+            logger.info("passively listening...")
+
+
+def _test_unconfirmed_wake_goes_back_to_passive():
+    import os
+    import tempfile
+
+    from audio_inputs import PcmFileInput  # pylint: disable=C0415
+
+    class WakeRecognizer:
+        last_words = []
+
+        def AcceptWaveform(self, *_):  # pylint: disable=C0103
+            return True
+
+        def get_full(self) -> str:
+            return TRIGGER
+
+    path = os.path.join(tempfile.mkdtemp(), "silence.pcm")
+    with open(path, "wb") as f:
+        f.write(bytes(AUDIO_SAMPLE_RATE * SAMPLE_WIDTH))
+    ears = VoskStreamedEars(
+        "unused", audio_input=PcmFileInput(path, realtime=False), use_vad=False
+    )
+    try:
+        block = memoryview(bytes(ears.audio_input.block_bytes))
+        assert ears._process_wake_audio(block, WakeRecognizer(), 0.0)
+        assert ears._state.listening_mode == ListeningMode.ACTIVE
+
+        # the full recognizer re-decodes the carryover without hearing the trigger
+        ears._handle_words("what a day", [TimedWord("day", 0.5, 0.8, 1.0)])
+        ears._state.processed_audio_secs = 5.0
+        assert ears._on_endpoint()
+        assert ears._state.listening_mode == ListeningMode.PASSIVE
+        assert not ears._state.has_words()
+    finally:
+        ears._endpoint.cancel()
+        ears.close()
+
 
 if __name__ == "__main__":
     logging.basicConfig(
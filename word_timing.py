@@ -0,0 +1,154 @@
+import bisect
+from collections import deque
+
+from models.timed_word import TimedWord
+
+CLOCK_HISTORY_SECS = 120  # how far back recognizer timestamps can still be mapped
+
+
+class RecognizerClock:
+    """
+    maps a recognizer's timestamps (seconds of audio it has accepted) back onto the
+    capture clock (seconds since the input started).
+
+    the two drift apart whenever blocks are skipped (voice activity gating) or re-fed
+    (wake word carry-over), so every discontinuity starts a new segment.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self._accepted_frames = 0
+        self._segment_starts: deque[float] = deque()  # recognizer secs
+        self._segment_captures: deque[float] = deque()  # capture secs at those starts
+
+    @property
+    def accepted_secs(self) -> float:
+        return self._accepted_frames / self.sample_rate
+
+    def advance(self, n_frames: int, capture_secs: float):
+        """
+        records that `n_frames` captured at `capture_secs` are about to be accepted
+        """
+        rec_secs = self.accepted_secs
+        if self._segment_starts:
+            expected = self._segment_captures[-1] + (
+                rec_secs - self._segment_starts[-1]
+            )
+            is_contiguous = abs(expected - capture_secs) < 1 / self.sample_rate
+        else:
+            is_contiguous = False
+        if not is_contiguous:
+            self._segment_starts.append(rec_secs)
+            self._segment_captures.append(capture_secs)
+            while (
+                len(self._segment_starts) > 1
+                and self._segment_starts[1] < rec_secs - CLOCK_HISTORY_SECS
+            ):
+                self._segment_starts.popleft()
+                self._segment_captures.popleft()
+        self._accepted_frames += n_frames
+
+    def to_capture_secs(self, rec_secs: float) -> float:
+        if not self._segment_starts:
+            return rec_secs
+        idx = max(bisect.bisect_right(self._segment_starts, rec_secs) - 1, 0)
+        return self._segment_captures[idx] + (rec_secs - self._segment_starts[idx])
+
+    def reset(self):
+        self._accepted_frames = 0
+        self._segment_starts.clear()
+        self._segment_captures.clear()
+
+
+def find_phrase(words: list[TimedWord], phrase: str) -> int | None:
+    """
+    returns the index of the first word of the first occurrence of `phrase`,
+    matching whole words rather than substrings
+    """
+    tokens = phrase.split()
+    for i in range(len(words) - len(tokens) + 1):
+        if all(words[i + j].word == token for j, token in enumerate(tokens)):
+            return i
+    return None
+
+
+def phrase_end_secs(words: list[TimedWord], phrase: str) -> float | None:
+    """
+    when the first occurrence of `phrase` ended, None if it was not said
+    """
+    idx = find_phrase(words, phrase)
+    if idx is None:
+        return None
+    return words[idx + len(phrase.split()) - 1].end
+
+
+def has_phrase(text: str, phrase: str) -> bool:
+    """
+    whether `phrase` appears in `text` as whole words ("they agent" is not "hey agent")
+    """
+    return f" {phrase} " in f" {text} "
+
+
+def prompt_start_offset(words: list[TimedWord], phrase: str) -> int | None:
+    """
+    given the words of a phrase, returns the character offset (into the words joined
+    by spaces) of the first word starting after `phrase` ended, or the length of the
+    text if nothing followed it. None if `phrase` was not said
+    """
+    idx = find_phrase(words, phrase)
+    if idx is None:
+        return None
+    phrase_end = words[idx + len(phrase.split()) - 1].end
+    offset = 0
+    for i, word in enumerate(words):
+        if i >= idx + len(phrase.split()) and word.start >= phrase_end:
+            return offset
+        offset += len(word.word) + 1
+    return max(offset - 1, 0)
+
+
+def _words(*spec: tuple[str, float, float]) -> list[TimedWord]:
+    return [TimedWord(word, start, end) for word, start, end in spec]
+
+
+def _test_recognizer_clock_maps_across_gaps():
+    clock = RecognizerClock(sample_rate=10)
+    clock.advance(10, capture_secs=0.0)
+    clock.advance(10, capture_secs=1.0)
+    # two seconds of silence skipped
+    clock.advance(10, capture_secs=4.0)
+
+    assert clock.accepted_secs == 3.0
+    assert clock.to_capture_secs(0.5) == 0.5
+    assert clock.to_capture_secs(1.5) == 1.5
+    assert clock.to_capture_secs(2.5) == 4.5
+
+    clock.reset()
+    clock.advance(10, capture_secs=7.0)
+    assert clock.to_capture_secs(0.2) == 7.2
+
+
+def _test_find_phrase_matches_whole_words():
+    words = _words(("they", 0, 1), ("agent", 1, 2), ("hey", 2, 3), ("agent", 3, 4))
+    assert find_phrase(words, "hey agent") == 2
+    assert find_phrase(words, "hey there") is None
+    assert phrase_end_secs(words, "hey agent") == 4
+
+    assert has_phrase("ok hey agent", "hey agent")
+    assert not has_phrase("they agent", "hey agent")
+
+
+def _test_prompt_start_offset():
+    words = _words(
+        ("ok", 0.0, 0.2),
+        ("hey", 0.3, 0.5),
+        ("agent", 0.5, 0.9),
+        ("what", 1.0, 1.2),
+        ("time", 1.2, 1.4),
+    )
+    text = " ".join(w.word for w in words)
+    offset = prompt_start_offset(words, "hey agent")
+    assert text[offset:] == "what time"
+
+    assert prompt_start_offset(words[:3], "hey agent") == len("ok hey agent")
+    assert prompt_start_offset(words, "stop") is None